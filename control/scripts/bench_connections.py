@@ -0,0 +1,65 @@
+"""Per-call connection overhead: fresh connection per operation vs pool.
+
+Usage:
+    python scripts/bench_connections.py [--calls 2000]
+
+Runs against a throwaway CONTROL_DATA_DIR so the real database is untouched.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+def _legacy_call(config):
+    # Replica de la antigua get_connection(): ensure_dirs + 3 PRAGMAs.
+    config.ensure_dirs()
+    conn = sqlite3.connect(config.DB_PATH, timeout=30)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA busy_timeout = 30000")
+    conn.execute("PRAGMA journal_mode = WAL")
+    try:
+        conn.execute("SELECT COUNT(*) FROM pdf_files").fetchone()
+    finally:
+        conn.close()
+
+
+def _pooled_call(db):
+    with db.connection() as conn:
+        conn.execute("SELECT COUNT(*) FROM pdf_files").fetchone()
+
+
+def _measure(label, func, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        func()
+    elapsed = time.perf_counter() - start
+    per_call_us = elapsed / calls * 1_000_000
+    print(f"{label:<22} {calls} llamadas  {elapsed:.3f}s  {per_call_us:.1f} us/llamada")
+    return per_call_us
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as data_dir:
+        os.environ["CONTROL_DATA_DIR"] = data_dir
+        import control.config as config
+        import control.database.db as db
+
+        db.init_db()
+        before = _measure("conexion por llamada", lambda: _legacy_call(config), args.calls)
+        after = _measure("pool por hilo", lambda: _pooled_call(db), args.calls)
+        print(f"Mejora: {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Compare text-extraction engines: pages/second and code recall.
+
+Usage:
+    python scripts/bench_engines.py [--pdfs 2] [--pages 100] [--corpus DIR]
+
+Without --corpus it writes a synthetic corpus: Helvetica text, 40 lines per
+page, with some lines (and every 25th page entirely) drawn one letter at a
+time, which only a layout-aware engine joins back into codes. With --corpus
+it reads every *.pdf in DIR. pdfplumber is the reference for recall; "sin respaldo" counts
+what the engine finds alone, before the pages it may have misread are
+re-read with pdfplumber ("releidas").
+"""
+
+import argparse
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from control.data.engines import ENGINES, get_engine, pypdf_available  # noqa: E402
+from control.data.pdf_extractor import _extract_codes, _iter_page_codes  # noqa: E402
+
+HELVETICA_WIDTHS = {"-": 333}
+FILLER = ["Lote", "Cantidad", "Referencia", "Total", "Hoja", "de", "Fecha", "Caja"]
+
+
+def _write_text_pdf(path, pages):
+    kids = " ".join(f"{4 + 2 * index} 0 R" for index in range(len(pages)))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+        b"/Encoding /WinAnsiEncoding >>",
+    ]
+    for index, content in enumerate(pages):
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (5 + 2 * index)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(content), content))
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    path.write_bytes(bytes(out))
+
+
+def _page_content(rng, pdf_index, page, spread_every=None):
+    """40 lines with a code each; every spread_every-th line letter by letter."""
+    parts = [b"BT /F1 9 Tf"]
+    for line in range(40):
+        code = f"HJ{pdf_index:02d}-{page:04d}{line:02d}"
+        y = 760 - 18 * line
+        if spread_every and line % spread_every == 0:
+            x = 50.0
+            for char in code:
+                parts.append(b"1 0 0 1 %.2f %d Tm (%s) Tj" % (x, y, char.encode()))
+                x += HELVETICA_WIDTHS.get(char, 556) * 9 / 1000
+            continue
+        words = " ".join(rng.choice(FILLER) for _ in range(4))
+        text = f"{words} {code} {rng.randint(1, 999)}"
+        parts.append(b"1 0 0 1 50 %d Tm (%s) Tj" % (y, text.encode("latin-1")))
+    parts.append(b"ET")
+    return b" ".join(parts)
+
+
+def _build_corpus(directory, pdfs, pages):
+    rng = random.Random(11)
+    paths = []
+    for pdf_index in range(pdfs):
+        path = directory / f"lote_{pdf_index:02d}.pdf"
+        contents = []
+        for page in range(1, pages + 1):
+            if page % 25 == 0:
+                # Hoja entera letra por letra: sin respaldo no da codigos.
+                spread_every = 1
+            elif page % 10 == 0:
+                # Algunas lineas dispersas: los motores rapidos pierden esas.
+                spread_every = 8
+            else:
+                spread_every = None
+            contents.append(_page_content(rng, pdf_index, page, spread_every))
+        _write_text_pdf(path, contents)
+        paths.append(path)
+    return paths
+
+
+def _engine_alone(engine, path):
+    """(codes, re-read with pdfplumber) per page, as the indexer decides."""
+    results = []
+    with engine.open(str(path)) as pages:
+        for page in pages:
+            text = engine.text(page)
+            codes = _extract_codes(text)
+            results.append((codes, not codes or engine.may_miss_codes(page, text)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdfs", type=int, default=2)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--corpus", help="Carpeta con PDFs reales")
+    args = parser.parse_args()
+
+    temp_dir = None
+    if args.corpus:
+        paths = sorted(Path(args.corpus).glob("*.pdf"))
+    else:
+        temp_dir = Path(tempfile.mkdtemp(prefix="control-engines-"))
+        paths = _build_corpus(temp_dir, args.pdfs, args.pages)
+
+    names = [name for name in ENGINES if name != "pypdf" or pypdf_available()]
+    try:
+        reference = None
+        print(f"{len(paths)} PDF(s)")
+        print(f"{'motor':>10} {'hojas/s':>9} {'recall':>8} {'sin respaldo':>13} {'releidas':>9}")
+        for name in names:
+            engine = get_engine(name)
+            start = time.perf_counter()
+            results = [
+                [page.codes for page in _iter_page_codes(str(path), engine=name)]
+                for path in paths
+            ]
+            elapsed = time.perf_counter() - start
+            if reference is None:
+                reference = results
+            alone = [[(codes, False) for codes in pdf] for pdf in results]
+            if name != "pdfplumber":
+                alone = [_engine_alone(engine, path) for path in paths]
+            total = found = found_alone = pages = reread = 0
+            for expected_pdf, got_pdf, alone_pdf in zip(reference, results, alone):
+                for expected, got, (solo, reread_page) in zip(
+                    expected_pdf, got_pdf, alone_pdf
+                ):
+                    pages += 1
+                    total += len(expected)
+                    found += len(set(expected) & set(got))
+                    found_alone += len(set(expected) & set(solo))
+                    reread += reread_page
+            print(
+                f"{name:>10} {pages / elapsed:>9.1f} {found / max(1, total):>8.1%} "
+                f"{found_alone / max(1, total):>13.1%} {reread:>9}"
+            )
+    finally:
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
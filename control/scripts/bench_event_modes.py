@@ -0,0 +1,78 @@
+"""Scan throughput for each event mode (sync, durable, buffered).
+
+Usage:
+    python scripts/bench_event_modes.py [--pages 3000] [--data-dir DIR]
+
+For every mode a fresh database with one synthetic PDF (two codes per page)
+is scanned code by code with process_scan in verification mode: the first
+code of each page is OK and the second one an already-scanned error, so half
+of the events come with a scanned update and half without. Use --data-dir
+on the real disk: on tmpfs fsync costs nothing and the modes look alike.
+"""
+
+import argparse
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+def _run(mode, pages, data_dir):
+    os.environ["CONTROL_DATA_DIR"] = str(data_dir)
+    import control.config as config
+    import control.database.db as db
+    import control.data.pdf_extractor as pdf_extractor
+    import control.logic.judge as judge
+
+    for module in (config, db, pdf_extractor, judge):
+        importlib.reload(module)
+
+    db.init_db(reset=True)
+    page_codes = [
+        pdf_extractor.PageCodes(page, pages, [f"E{page:06d}A", f"E{page:06d}B"])
+        for page in range(1, pages + 1)
+    ]
+    pdf_extractor._write_pdf(Path("C:/bench/eventos.pdf"), "sig-bench", page_codes)
+    codes = [code for page in page_codes for code in page.codes]
+
+    judge.set_event_mode(mode)
+    start = time.perf_counter()
+    for code in codes:
+        judge.process_scan(code, mode="verificacion")
+    elapsed = time.perf_counter() - start
+    judge.close_events()
+
+    conn = db.get_connection()
+    try:
+        events = conn.execute("SELECT COUNT(*) FROM events WHERE code IS NOT NULL").fetchone()[0]
+    finally:
+        conn.close()
+    judge._SCAN_INDEX.close()
+    return len(codes), elapsed, events
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=3000)
+    parser.add_argument("--data-dir", help="Carpeta temporal (por defecto el temp del sistema)")
+    args = parser.parse_args()
+
+    base = Path(tempfile.mkdtemp(prefix="control-events-", dir=args.data_dir))
+    try:
+        for mode in ("sync", "durable", "buffered"):
+            scans, elapsed, events = _run(mode, args.pages, base / mode)
+            print(
+                f"{mode:9s} {scans} escaneos en {elapsed:.2f}s "
+                f"({scans / elapsed:,.0f}/s, eventos {events})"
+            )
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
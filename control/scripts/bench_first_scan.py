@@ -0,0 +1,104 @@
+"""Time to first scan after loading a large PDF: blocking vs progressive.
+
+Usage:
+    python scripts/bench_first_scan.py [--pages 2000] [--workers 1] [--engine pdfplumber]
+
+Writes a synthetic PDF (the bench_engines corpus: 40 coded lines per page)
+into a throwaway CONTROL_DATA_DIR and indexes it with progressive
+publishing while a thread scans the first page's code every 50 ms. Without
+progressive indexing the first scan can only happen once the whole PDF is
+indexed, so that total is the blocking time to first scan. Scan latency is
+measured while pages are being published.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--engine", default="pdfplumber")
+    args = parser.parse_args()
+
+    data_dir = Path(tempfile.mkdtemp(prefix="control-bench-"))
+    os.environ["CONTROL_DATA_DIR"] = str(data_dir)
+    try:
+        # bench_engines importa control: recien despues de fijar CONTROL_DATA_DIR.
+        from bench_engines import _page_content, _write_text_pdf
+        from control.database import db
+        from control.data import pdf_extractor
+        from control.logic import judge
+
+        db.init_db(reset=True)
+        rng = random.Random(5)
+        pdf_path = data_dir / "lote.pdf"
+        _write_text_pdf(
+            pdf_path, [_page_content(rng, 0, page) for page in range(1, args.pages + 1)]
+        )
+
+        done = threading.Event()
+        first_scan = []
+        latencies = []
+
+        def scan_first_page():
+            while not done.is_set():
+                start = time.perf_counter()
+                result = judge.process_scan("HJ00-000100", mode="secuencia")
+                latencies.append(time.perf_counter() - start)
+                if result["status"] == "OK":
+                    first_scan.append(time.perf_counter())
+                    return
+                time.sleep(0.05)
+
+        def scan_during_indexing():
+            # Codigo siempre ausente: mide la latencia mientras se publica.
+            while not done.is_set():
+                start = time.perf_counter()
+                judge.process_scan("NOEXISTE01", mode="secuencia")
+                latencies.append(time.perf_counter() - start)
+                time.sleep(0.05)
+
+        start = time.perf_counter()
+        scanners = [threading.Thread(target=scan_first_page)]
+        scanners.append(threading.Thread(target=scan_during_indexing))
+        for scanner in scanners:
+            scanner.start()
+        pdf_extractor.extract_pdf(
+            pdf_path,
+            workers=args.workers,
+            engine=args.engine,
+            publish_seconds=pdf_extractor.PUBLISH_SECONDS,
+        )
+        total = time.perf_counter() - start
+        done.set()
+        for scanner in scanners:
+            scanner.join()
+
+        print(f"PDF de {args.pages} hojas, motor {args.engine}, workers {args.workers}")
+        print(f"Primer escaneo, bloqueante:  {total:,.1f} s (indexacion completa)")
+        if first_scan:
+            print(f"Primer escaneo, progresivo:  {first_scan[0] - start:,.1f} s")
+        latencies.sort()
+        print(
+            f"Escaneos durante la indexacion: {len(latencies)}, "
+            f"p50 {statistics.median(latencies) * 1000:,.1f} ms, "
+            f"max {latencies[-1] * 1000:,.1f} ms"
+        )
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
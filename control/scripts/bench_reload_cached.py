@@ -0,0 +1,92 @@
+"""Reload already indexed PDFs: full SHA-256 per file vs stored size/mtime/inode.
+
+Usage:
+    python scripts/bench_reload_cached.py [--pdfs 40] [--size-mb 25] [--workers 4]
+
+Writes --pdfs files of random bytes into a throwaway CONTROL_DATA_DIR,
+indexes them once (with fake page codes), then times extract_pdfs() on the
+unchanged files three ways: with the stored fingerprint cleared (every file
+hashed, one at a time, as before), the same with --workers hashing threads,
+and with the fingerprint in place (no file is read). The OS page cache keeps
+the files warm, so the hashing numbers are a lower bound for a network share.
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+def _build(directory, pdfs, size_mb):
+    paths = []
+    settled = time.time() - 60
+    for index in range(pdfs):
+        path = directory / f"lote_{index:02d}.pdf"
+        with path.open("wb") as handle:
+            for _ in range(size_mb):
+                handle.write(os.urandom(1024 * 1024))
+        os.utime(path, (settled, settled))
+        paths.append(path)
+    return paths
+
+
+def _clear_fingerprints(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE pdf_files SET file_size = NULL")
+    conn.commit()
+    conn.close()
+
+
+def _time_reload(pdf_extractor, paths, workers):
+    start = time.perf_counter()
+    results = pdf_extractor.extract_pdfs(paths, workers=workers)
+    elapsed = time.perf_counter() - start
+    assert not any(results)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdfs", type=int, default=40)
+    parser.add_argument("--size-mb", type=int, default=25)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    data_dir = Path(tempfile.mkdtemp(prefix="control-bench-"))
+    os.environ["CONTROL_DATA_DIR"] = str(data_dir)
+    try:
+        from control.config import DB_PATH
+        from control.database import db
+        from control.data import pdf_extractor
+
+        db.init_db(reset=True)
+        paths = _build(data_dir, args.pdfs, args.size_mb)
+        indexing = pdf_extractor._iter_page_codes
+        pdf_extractor._iter_page_codes = lambda path_text, **_kwargs: iter(
+            [pdf_extractor.PageCodes(1, 1, [f"B{Path(path_text).stem[-2:]}00001"])]
+        )
+        pdf_extractor.extract_pdfs(paths)
+        pdf_extractor._iter_page_codes = indexing
+
+        _clear_fingerprints(DB_PATH)
+        hashed = _time_reload(pdf_extractor, paths, workers=1)
+        _clear_fingerprints(DB_PATH)
+        threaded = _time_reload(pdf_extractor, paths, workers=args.workers)
+        fingerprint = _time_reload(pdf_extractor, paths, workers=1)
+
+        print(f"{args.pdfs} PDF(s) de {args.size_mb} MB")
+        print(f"hash completo:              {hashed * 1000:,.1f} ms")
+        print(f"hash con {args.workers} hilos:           {threaded * 1000:,.1f} ms")
+        print(f"huella tamano/mtime/inodo:  {fingerprint * 1000:,.1f} ms")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Batch scan ingestion: process_scans vs one process_scan per code.
+
+Usage:
+    python scripts/bench_scan_batch.py [--pdfs 20] [--pages 2500] [--serial 2000]
+
+Indexes synthetic PDFs (two codes per page) into a throwaway
+CONTROL_DATA_DIR, then scans every code in page order with process_scans
+and, after reset_scans(), times a sample with the serial path.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+
+def _build(pdf_extractor, pdfs, pages):
+    codes = []
+    for pdf_index in range(pdfs):
+        page_codes = []
+        for page in range(1, pages + 1):
+            pair = [f"B{pdf_index:03d}{page:06d}A", f"B{pdf_index:03d}{page:06d}B"]
+            page_codes.append(pdf_extractor.PageCodes(page, pages, pair))
+            codes.extend(pair)
+        pdf_extractor._write_pdf(
+            Path(f"C:/bench/{pdf_index:03d}.pdf"), f"sig-{pdf_index}", page_codes
+        )
+    return codes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdfs", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=2500)
+    parser.add_argument("--serial", type=int, default=2000)
+    parser.add_argument("--mode", default="secuencia")
+    args = parser.parse_args()
+
+    data_dir = Path(tempfile.mkdtemp(prefix="control-bench-"))
+    os.environ["CONTROL_DATA_DIR"] = str(data_dir)
+    try:
+        from control.database import db
+        from control.data import pdf_extractor
+        from control.logic import judge
+
+        db.init_db(reset=True)
+        codes = _build(pdf_extractor, args.pdfs, args.pages)
+
+        start = time.perf_counter()
+        results = judge.process_scans(codes, mode=args.mode)
+        batch = time.perf_counter() - start
+        ok = sum(1 for result in results if result["status"] == "OK")
+        print(f"process_scans: {len(codes)} codigos en {batch:.2f}s "
+              f"({len(codes) / batch:,.0f}/s, OK {ok})")
+
+        judge.reset_scans()
+        sample = codes[: args.serial]
+        start = time.perf_counter()
+        ok = 0
+        for code in sample:
+            ok += judge.process_scan(code, mode=args.mode)["status"] == "OK"
+        serial = time.perf_counter() - start
+        print(f"process_scan:  {len(sample)} codigos en {serial:.2f}s "
+              f"({len(sample) / serial:,.0f}/s, OK {ok})")
+        judge._SCAN_INDEX.conn.close()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Cost of the scanned write: per-code flags in pages vs one page_state row.
+
+Usage:
+    python scripts/bench_scan_update.py [--pages 20000] [--codes 10] [--scans 5000]
+
+Builds a database in the layout before page_state (scanned on every code
+row of pages), times the old UPDATE and the scanned-pages aggregate, runs
+init_db to migrate it and times the same work against page_state. Every
+scan is its own transaction, as in process_scan.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+OLD_PAGES_SQL = """
+    CREATE TABLE pages (
+        page_number INTEGER NOT NULL CHECK(page_number >= 1),
+        code TEXT NOT NULL CHECK(length(trim(code)) > 0),
+        scanned INTEGER NOT NULL DEFAULT 0 CHECK(scanned IN (0, 1)),
+        pdf_id INTEGER NOT NULL,
+        UNIQUE(pdf_id, code),
+        FOREIGN KEY (pdf_id) REFERENCES pdf_files(id)
+    )
+"""
+
+OLD_SCAN_SQL = "UPDATE pages SET scanned = 1 WHERE pdf_id = ? AND page_number = ?"
+NEW_SCAN_SQL = """
+    INSERT INTO page_state (pdf_id, page_number, scanned, scanned_at)
+    VALUES (?, ?, 1, datetime('now'))
+    ON CONFLICT (pdf_id, page_number)
+    DO UPDATE SET scanned = 1, scanned_at = excluded.scanned_at
+"""
+OLD_COUNT_SQL = (
+    "SELECT COUNT(DISTINCT CASE WHEN scanned = 1 THEN page_number END) "
+    "FROM pages WHERE pdf_id = ?"
+)
+NEW_COUNT_SQL = "SELECT COUNT(*) FROM page_state WHERE pdf_id = ? AND scanned = 1"
+
+
+def _build_old_layout(conn, pages, codes):
+    conn.execute(
+        """
+        CREATE TABLE pdf_files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_name TEXT NOT NULL CHECK(length(trim(file_name)) > 0),
+            file_path TEXT UNIQUE NOT NULL,
+            signature TEXT NOT NULL CHECK(length(trim(signature)) > 0),
+            loaded_at TEXT DEFAULT (datetime('now'))
+        )
+        """
+    )
+    conn.execute(OLD_PAGES_SQL)
+    conn.execute("CREATE INDEX idx_pages_code ON pages(code)")
+    conn.execute("CREATE INDEX idx_pages_pdf_page ON pages(pdf_id, page_number)")
+    conn.execute(
+        "INSERT INTO pdf_files (file_name, file_path, signature) "
+        "VALUES ('bench.pdf', 'C:/bench/bench.pdf', 'sig')"
+    )
+    conn.executemany(
+        "INSERT INTO pages (page_number, code, scanned, pdf_id) VALUES (?, ?, 0, 1)",
+        (
+            (page, f"U{page:07d}{index:03d}")
+            for page in range(1, pages + 1)
+            for index in range(codes)
+        ),
+    )
+    conn.commit()
+
+
+def _time_scans(conn, sql, targets):
+    start = time.perf_counter()
+    for page in targets:
+        conn.execute(sql, (1, page))
+        conn.commit()
+    return time.perf_counter() - start
+
+
+def _time_count(conn, sql, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        conn.execute(sql, (1,)).fetchone()
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20000)
+    parser.add_argument("--codes", type=int, default=10, help="codigos por hoja")
+    parser.add_argument("--scans", type=int, default=5000)
+    args = parser.parse_args()
+
+    targets = random.Random(7).sample(
+        range(1, args.pages + 1), min(args.scans, args.pages)
+    )
+    data_dir = Path(tempfile.mkdtemp(prefix="control-bench-"))
+    os.environ["CONTROL_DATA_DIR"] = str(data_dir)
+    try:
+        from control.database import db
+
+        conn = db.get_connection()
+        try:
+            _build_old_layout(conn, args.pages, args.codes)
+            old_scans = _time_scans(conn, OLD_SCAN_SQL, targets)
+            old_count = _time_count(conn, OLD_COUNT_SQL)
+        finally:
+            conn.close()
+
+        start = time.perf_counter()
+        db.init_db()
+        migration = time.perf_counter() - start
+
+        conn = db.get_connection()
+        try:
+            migrated = conn.execute(NEW_COUNT_SQL, (1,)).fetchone()[0]
+            conn.execute("UPDATE page_state SET scanned = 0, scanned_at = NULL")
+            conn.commit()
+            new_scans = _time_scans(conn, NEW_SCAN_SQL, targets)
+            new_count = _time_count(conn, NEW_COUNT_SQL)
+        finally:
+            conn.close()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    scans = len(targets)
+    print(f"{args.pages} hojas x {args.codes} codigos, {scans} escaneos")
+    print(f"pages.scanned:  {scans / old_scans:,.0f} escaneos/s, "
+          f"conteo {old_count * 1000:.2f} ms")
+    print(f"page_state:     {scans / new_scans:,.0f} escaneos/s, "
+          f"conteo {new_count * 1000:.2f} ms")
+    print(f"migracion: {migration:.2f}s ({migrated} hojas escaneadas conservadas)")
+
+
+if __name__ == "__main__":
+    main()
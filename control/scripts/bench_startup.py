@@ -0,0 +1,86 @@
+"""Startup cost of init_db: full migration pass vs current schema version.
+
+Usage:
+    python scripts/bench_startup.py [--pdfs 40] [--pages 25000]
+
+Indexes synthetic PDFs (two codes per page) into a throwaway
+CONTROL_DATA_DIR, then times init_db() in a fresh process twice: with
+user_version cleared (every check and the foreign key scan run, as before
+schema versioning) and with the version already recorded.
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+TIME_INIT_DB = (
+    "import time; from control.database.db import init_db; "
+    "start = time.perf_counter(); init_db(); print(time.perf_counter() - start)"
+)
+
+
+def _build(pdf_extractor, pdfs, pages):
+    for pdf_index in range(pdfs):
+        page_codes = [
+            pdf_extractor.PageCodes(
+                page, pages, [f"S{pdf_index:03d}{page:06d}A", f"S{pdf_index:03d}{page:06d}B"]
+            )
+            for page in range(1, pages + 1)
+        ]
+        pdf_extractor._write_pdf(
+            Path(f"C:/bench/{pdf_index:03d}.pdf"), f"sig-{pdf_index}", page_codes
+        )
+
+
+def _time_startup(env):
+    output = subprocess.run(
+        [sys.executable, "-c", TIME_INIT_DB],
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pdfs", type=int, default=40)
+    parser.add_argument("--pages", type=int, default=25000)
+    args = parser.parse_args()
+
+    data_dir = Path(tempfile.mkdtemp(prefix="control-bench-"))
+    os.environ["CONTROL_DATA_DIR"] = str(data_dir)
+    env = {**os.environ, "PYTHONPATH": str(SRC_DIR)}
+    try:
+        from control.config import DB_PATH
+        from control.database import db
+        from control.data import pdf_extractor
+
+        db.init_db(reset=True)
+        _build(pdf_extractor, args.pdfs, args.pages)
+        size_mb = DB_PATH.stat().st_size / 1e6
+
+        conn = sqlite3.connect(DB_PATH)
+        conn.execute("PRAGMA user_version = 0")
+        conn.commit()
+        conn.close()
+        full = _time_startup(env)
+        current = _time_startup(env)
+        print(f"Base de {size_mb:,.0f} MB ({args.pdfs * args.pages * 2:,} codigos)")
+        print(f"init_db con migraciones: {full * 1000:,.1f} ms")
+        print(f"init_db version al dia:  {current * 1000:,.1f} ms")
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
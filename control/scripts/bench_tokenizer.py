@@ -0,0 +1,84 @@
+"""Micro-benchmark of _extract_codes against the token-by-token version.
+
+Usage:
+    python scripts/bench_tokenizer.py [--tokens 5000] [--repeat 200]
+
+Builds a dense synthetic page (codes, repeated codes, words and numbers) and
+times both tokenizers on it after checking that they return the same list.
+"""
+
+import argparse
+import random
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from control.data.pdf_extractor import _extract_codes  # noqa: E402
+
+CODE_PATTERN = re.compile(r"\b[A-Z0-9][A-Z0-9\-]{5,}\b")
+
+
+def _normalize_code(raw):
+    code = raw.strip().upper()
+    code = code.strip("-")
+    if len(code) < 6:
+        return None
+    if not any(char.isdigit() for char in code):
+        return None
+    return code
+
+
+def _extract_codes_per_token(text):
+    if not text:
+        return []
+
+    seen = set()
+    codes = []
+    for token in CODE_PATTERN.findall(text.upper()):
+        code = _normalize_code(token)
+        if not code or code in seen:
+            continue
+        seen.add(code)
+        codes.append(code)
+    return codes
+
+
+def _page_text(tokens, seed=3):
+    rng = random.Random(seed)
+    words = ["Lote", "Cantidad", "Referencia", "Total", "Hoja", "de", "Fecha"]
+    parts = []
+    for _ in range(tokens):
+        kind = rng.random()
+        if kind < 0.45:
+            parts.append(f"HOJA-{rng.randint(1, tokens // 3):06d}")
+        elif kind < 0.6:
+            parts.append(f"LT{rng.randint(0, 10**8):08d}-")
+        elif kind < 0.8:
+            parts.append(rng.choice(words))
+        else:
+            parts.append(str(rng.randint(0, 10**6)))
+    return " ".join(parts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tokens", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    text = _page_text(args.tokens)
+    assert _extract_codes(text) == _extract_codes_per_token(text)
+    print(f"{args.tokens} tokens, {len(_extract_codes(text))} codigos distintos")
+    for name, function in (
+        ("por token", _extract_codes_per_token),
+        ("actual", _extract_codes),
+    ):
+        best = min(timeit.repeat(lambda: function(text), number=args.repeat, repeat=5))
+        print(f"{name:>10}: {best / args.repeat * 1000:.3f} ms/pagina")
+
+
+if __name__ == "__main__":
+    main()
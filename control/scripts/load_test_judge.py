@@ -0,0 +1,198 @@
+"""Multi-station load test for the judge service (control serve).
+
+Usage:
+    python scripts/load_test_judge.py [--clients 8] [--overlap 2]
+        [--pages 1500] [--event-mode sync] [--url http://127.0.0.1:8765]
+
+Without --url a service is started on a throwaway CONTROL_DATA_DIR with
+synthetic PDFs (one code per page). Stations scan their PDF in page order
+in sequence mode; with --overlap N, N stations share each PDF and race for
+the same pages. The script reports scans/second and latency percentiles and
+checks that every page got exactly one OK verdict.
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+sys.path.insert(0, str(SRC_DIR))
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _pdf_codes(pdf_index, pages):
+    return [f"J{pdf_index:03d}{page:06d}" for page in range(1, pages + 1)]
+
+
+def _start_service(pdfs, pages, event_mode):
+    # CONTROL_DATA_DIR antes del primer import de control: config lo lee al cargar.
+    data_dir = tempfile.mkdtemp(prefix="control-judge-")
+    os.environ["CONTROL_DATA_DIR"] = data_dir
+    from control.database import db
+    from control.data import pdf_extractor
+    from control.service import JudgeClient, JudgeServiceError
+
+    db.init_db(reset=True)
+    for pdf_index in range(pdfs):
+        pdf_extractor._write_pdf(
+            Path(f"C:/carga/{pdf_index:03d}.pdf"),
+            f"sig-{pdf_index}",
+            [
+                pdf_extractor.PageCodes(page, pages, [code])
+                for page, code in enumerate(_pdf_codes(pdf_index, pages), start=1)
+            ],
+        )
+
+    port = _free_port()
+    env = dict(os.environ, PYTHONPATH=str(SRC_DIR))
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "control.main",
+            "--event-mode",
+            event_mode,
+            "serve",
+            "--port",
+            str(port),
+        ],
+        env=env,
+        stdout=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    client = JudgeClient(url)
+    deadline = time.monotonic() + 30
+    while True:
+        try:
+            client.health()
+            break
+        except JudgeServiceError:
+            if time.monotonic() > deadline or process.poll() is not None:
+                process.kill()
+                raise SystemExit("No se pudo iniciar el servicio de escaneo")
+            time.sleep(0.1)
+    client.close()
+    return url, process, data_dir
+
+
+def _station(url, codes, latencies, verdicts, errors, lock):
+    from control.service import JudgeClient, JudgeServiceError
+
+    client = JudgeClient(url)
+    local_latencies = []
+    local_verdicts = []
+    local_errors = 0
+    for code in codes:
+        start = time.perf_counter()
+        try:
+            result = client.process_scan(code, mode="secuencia")
+        except JudgeServiceError:
+            local_errors += 1
+            continue
+        local_latencies.append(time.perf_counter() - start)
+        local_verdicts.append((code, result["status"]))
+    client.close()
+    with lock:
+        latencies.extend(local_latencies)
+        verdicts.extend(local_verdicts)
+        errors.append(local_errors)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="Servicio ya iniciado (por defecto se inicia uno de prueba)")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--overlap", type=int, default=2, help="Estaciones por PDF")
+    parser.add_argument("--pages", type=int, default=1500)
+    parser.add_argument("--event-mode", default="sync")
+    args = parser.parse_args()
+
+    overlap = max(1, min(args.overlap, args.clients))
+    pdfs = max(1, args.clients // overlap)
+    process = None
+    data_dir = None
+    url = args.url
+    if url is None:
+        url, process, data_dir = _start_service(pdfs, args.pages, args.event_mode)
+
+    try:
+        latencies = []
+        verdicts = []
+        errors = []
+        lock = threading.Lock()
+        threads = [
+            threading.Thread(
+                target=_station,
+                args=(
+                    url,
+                    _pdf_codes(index % pdfs, args.pages),
+                    latencies,
+                    verdicts,
+                    errors,
+                    lock,
+                ),
+            )
+            for index in range(args.clients)
+        ]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if data_dir is not None:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    latencies.sort()
+    ok_per_code = Counter(code for code, status in verdicts if status == "OK")
+    expected_codes = pdfs * args.pages
+    print(
+        f"Estaciones: {args.clients}  PDFs: {pdfs}  Estaciones por PDF: {overlap}  "
+        f"Duracion: {elapsed:.1f}s"
+    )
+    print(f"Escaneos: {len(latencies)}  Errores de red: {sum(errors)}")
+    print(f"Escaneos/s: {len(latencies) / elapsed:.1f}")
+    print(
+        "Latencia ms  p50: {:.1f}  p95: {:.1f}  p99: {:.1f}  max: {:.1f}".format(
+            _percentile(latencies, 0.50) * 1000,
+            _percentile(latencies, 0.95) * 1000,
+            _percentile(latencies, 0.99) * 1000,
+            (latencies[-1] if latencies else 0.0) * 1000,
+        )
+    )
+    repeated = sum(1 for count in ok_per_code.values() if count > 1)
+    print(
+        f"Hojas con OK: {len(ok_per_code)}/{expected_codes}  "
+        f"OK repetidos: {repeated}"
+    )
+    if args.url is None and (repeated or len(ok_per_code) != expected_codes):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Concurrent load test for control-db.
+
+Usage:
+    python scripts/load_test_web.py [--url http://127.0.0.1:8000]
+        [--clients 50] [--duration 10] [--path /api/dashboard ...]
+
+Each client repeatedly requests the given paths for the test duration and
+the script reports requests/second and latency percentiles.
+"""
+
+import argparse
+import threading
+import time
+import urllib.error
+import urllib.request
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _client(base_url, paths, deadline, latencies, errors, lock):
+    local_latencies = []
+    local_errors = 0
+    position = 0
+    while time.perf_counter() < deadline:
+        path = paths[position % len(paths)]
+        position += 1
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(base_url + path, timeout=60) as response:
+                response.read()
+        except (urllib.error.URLError, OSError):
+            local_errors += 1
+            continue
+        local_latencies.append(time.perf_counter() - start)
+    with lock:
+        latencies.extend(local_latencies)
+        errors.append(local_errors)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument(
+        "--path",
+        action="append",
+        dest="paths",
+        help="Ruta a solicitar (repetible). Por defecto /api/dashboard",
+    )
+    args = parser.parse_args()
+    paths = args.paths or ["/api/dashboard"]
+
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    started = time.perf_counter()
+    deadline = started + args.duration
+    threads = [
+        threading.Thread(
+            target=_client,
+            args=(args.url.rstrip("/"), paths, deadline, latencies, errors, lock),
+        )
+        for _ in range(args.clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"Clientes: {args.clients}  Duracion: {elapsed:.1f}s  Rutas: {', '.join(paths)}")
+    print(f"Solicitudes OK: {len(latencies)}  Errores: {sum(errors)}")
+    print(f"Solicitudes/s: {len(latencies) / elapsed:.1f}")
+    print(
+        "Latencia ms  p50: {:.1f}  p95: {:.1f}  p99: {:.1f}  max: {:.1f}".format(
+            _percentile(latencies, 0.50) * 1000,
+            _percentile(latencies, 0.95) * 1000,
+            _percentile(latencies, 0.99) * 1000,
+            (latencies[-1] if latencies else 0.0) * 1000,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
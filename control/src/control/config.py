@@ -22,6 +22,8 @@ def _app_data_root():
 DATA_DIR = _app_data_root()
 DB_PATH = DATA_DIR / "control.db"
 PDF_DIR = DATA_DIR / "pdfs"
+# Motor de extraccion de texto por defecto (ver control.data.engines).
+PDF_ENGINE = os.environ.get("CONTROL_PDF_ENGINE") or "pdfplumber"
 
 
 def _legacy_paths():
@@ -41,9 +43,16 @@ def _legacy_paths():
 
 
 def ensure_dirs():
+    # Las rutas antiguas solo se revisan hasta que existe la base: despues
+    # de la primera ejecucion ya no hay nada que migrar.
+    first_run = not DB_PATH.exists()
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     PDF_DIR.mkdir(parents=True, exist_ok=True)
+    if first_run:
+        _migrate_legacy_paths()
 
+
+def _migrate_legacy_paths():
     for legacy_db_path, legacy_pdf_dir in _legacy_paths():
         if legacy_db_path.exists() and not DB_PATH.exists():
             shutil.move(str(legacy_db_path), str(DB_PATH))
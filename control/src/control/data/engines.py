@@ -0,0 +1,397 @@
+"""Text extraction backends for the PDF indexer.
+
+An engine opens a PDF as a sequence of pages and gives, per page, a hash of
+its content streams (page cache key) and its text. pdfplumber is the
+reference; the others skip the character layout analysis and are faster,
+at the cost of missing text that only pdfplumber recovers.
+"""
+
+import hashlib
+import re
+from contextlib import contextmanager
+
+from control.config import PDF_ENGINE
+
+# Motor de referencia: tambien relee las hojas sin codigos de los demas.
+DEFAULT_ENGINE = "pdfplumber"
+# "fast" = pypdf si esta instalado, si no el lector de content streams.
+ENGINE_NAMES = ("pdfplumber", "fast", "pypdf", "raw")
+
+
+def _digest_streams(streams, salt=None, resources=()):
+    """Page cache key: content streams plus the resolved /Resources.
+
+    The resources (Form XObjects, fonts, ToUnicode maps...) decide what text
+    the same content stream shows, so they are part of the key.
+    """
+    digest = hashlib.sha256()
+    if salt:
+        # Codigos en cache de otro motor no se reutilizan con este.
+        digest.update(salt.encode("ascii") + b"\0")
+    for stream in streams:
+        digest.update(stream)
+    digest.update(b"\0resources\0")
+    for chunk in resources:
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _pdfminer_streams(page_obj):
+    from pdfminer.pdftypes import resolve1
+
+    for stream in resolve1(page_obj.contents) or ():
+        yield resolve1(stream).get_data()
+
+
+def _pdfminer_chunks(obj, seen=None):
+    """Canonical bytes of a pdfminer object, references resolved."""
+    from pdfminer.pdftypes import PDFObjRef, PDFStream
+    from pdfminer.psparser import PSKeyword, PSLiteral
+
+    seen = set() if seen is None else seen
+    if isinstance(obj, PDFObjRef):
+        if obj.objid in seen:
+            # Ya recorrido en esta hoja (fuente compartida, ciclo).
+            yield b"R%d" % obj.objid
+            return
+        seen.add(obj.objid)
+        obj = obj.resolve()
+    if isinstance(obj, PDFStream):
+        yield from _pdfminer_chunks(obj.attrs, seen)
+        data = obj.get_data()
+        yield b"S%d:" % len(data)
+        yield data
+    elif isinstance(obj, dict):
+        yield b"{"
+        for key in sorted(obj, key=str):
+            if key == "Parent":
+                continue
+            yield b"/%s " % str(key).encode("utf-8", "replace")
+            yield from _pdfminer_chunks(obj[key], seen)
+        yield b"}"
+    elif isinstance(obj, (list, tuple)):
+        yield b"["
+        for item in obj:
+            yield from _pdfminer_chunks(item, seen)
+        yield b"]"
+    elif isinstance(obj, bytes):
+        yield b"(%d:" % len(obj) + obj + b")"
+    elif isinstance(obj, PSLiteral):
+        yield b"/" + str(obj.name).encode("utf-8", "replace") + b" "
+    elif isinstance(obj, PSKeyword):
+        yield b"K" + bytes(obj.name) + b" "
+    else:
+        yield repr(obj).encode("ascii", "replace") + b" "
+
+
+def _pypdf_chunks(obj, seen=None):
+    """Canonical bytes of a pypdf object, references resolved."""
+    from pypdf.generic import IndirectObject, StreamObject
+
+    seen = set() if seen is None else seen
+    if isinstance(obj, IndirectObject):
+        if obj.idnum in seen:
+            yield b"R%d" % obj.idnum
+            return
+        seen.add(obj.idnum)
+        obj = obj.get_object()
+    if isinstance(obj, dict):
+        # dict.items sin resolver: las referencias pasan por la rama de arriba.
+        yield b"{"
+        for key, value in sorted(dict.items(obj), key=lambda item: item[0]):
+            if key == "/Parent":
+                continue
+            yield str(key).encode("utf-8", "replace") + b" "
+            yield from _pypdf_chunks(value, seen)
+        yield b"}"
+        if isinstance(obj, StreamObject):
+            data = obj.get_data()
+            yield b"S%d:" % len(data)
+            yield data
+    elif isinstance(obj, list):
+        yield b"["
+        for item in obj:
+            yield from _pypdf_chunks(item, seen)
+        yield b"]"
+    elif isinstance(obj, bytes):
+        yield b"(%d:" % len(obj) + bytes(obj) + b")"
+    else:
+        yield repr(obj).encode("utf-8", "replace") + b" "
+
+
+class PdfplumberEngine:
+    name = "pdfplumber"
+
+    @contextmanager
+    def open(self, path_text):
+        import pdfplumber
+
+        with pdfplumber.open(path_text) as pdf:
+            yield pdf.pages
+
+    def content_hash(self, page):
+        return _digest_streams(
+            _pdfminer_streams(page.page_obj),
+            resources=_pdfminer_chunks(page.page_obj.resources),
+        )
+
+    def may_miss_codes(self, page, text):
+        return False
+
+    def text(self, page):
+        try:
+            return page.extract_text() or ""
+        finally:
+            # pdfplumber conserva los caracteres de cada hoja leida: sin
+            # soltarlos la memoria, y cada pasada del GC, crecen con el PDF.
+            # close() es de pdfplumber 0.11; antes solo estaba flush_cache().
+            release = getattr(page, "close", None) or getattr(page, "flush_cache", None)
+            if release is not None:
+                release()
+
+
+class PypdfEngine:
+    name = "pypdf"
+
+    @contextmanager
+    def open(self, path_text):
+        from pypdf import PdfReader
+
+        with open(path_text, "rb") as handle:
+            yield PdfReader(handle).pages
+
+    def content_hash(self, page):
+        from pypdf.generic import ArrayObject
+
+        contents = page.get("/Contents")
+        contents = contents.get_object() if contents is not None else ()
+        if not isinstance(contents, (ArrayObject, tuple)):
+            contents = (contents,)
+        return _digest_streams(
+            (stream.get_object().get_data() for stream in contents),
+            salt=self.name,
+            resources=_pypdf_chunks(page.get("/Resources")),
+        )
+
+    def may_miss_codes(self, page, text):
+        # pypdf sigue las Form XObjects y decodifica las fuentes; las hojas
+        # sin codigos igual se releen.
+        return False
+
+    def text(self, page):
+        return page.extract_text() or ""
+
+
+class RawEngine:
+    """Reads the strings of the text operators straight from the content
+    streams (parsed by pdfminer, without layout analysis)."""
+
+    name = "raw"
+
+    @contextmanager
+    def open(self, path_text):
+        from pdfminer.pdfdocument import PDFDocument
+        from pdfminer.pdfpage import PDFPage
+        from pdfminer.pdfparser import PDFParser
+
+        with open(path_text, "rb") as handle:
+            document = PDFDocument(PDFParser(handle))
+            yield list(PDFPage.create_pages(document))
+
+    def content_hash(self, page):
+        return _digest_streams(
+            _pdfminer_streams(page),
+            salt=self.name,
+            resources=_pdfminer_chunks(page.resources),
+        )
+
+    def text(self, page):
+        return "\n".join(scan_content_text(data) for data in _pdfminer_streams(page))
+
+    def may_miss_codes(self, page, text):
+        """True when the page draws text this scanner cannot read whole:
+        Form XObjects (not followed), fonts whose bytes are not Latin-1, or
+        characters placed one at a time (a code split into letters)."""
+        if _ISOLATED_CHARS.search(text):
+            return True
+        try:
+            return not _latin_resources(page.resources)
+        except Exception:
+            return True
+
+
+# Cuatro o mas caracteres sueltos seguidos: texto dibujado letra por letra.
+_ISOLATED_CHARS = re.compile(r"(?:(?<!\S)[0-9A-Za-z]\s+){3}[0-9A-Za-z](?!\S)")
+_SIMPLE_FONTS = {"Type1", "MMType1", "TrueType"}
+_LATIN_ENCODINGS = {"WinAnsiEncoding", "StandardEncoding", "MacRomanEncoding"}
+_EMBEDDED_FONT_KEYS = ("FontFile", "FontFile2", "FontFile3")
+
+
+def _pdfminer_dict(obj):
+    from pdfminer.pdftypes import resolve1
+
+    obj = resolve1(obj)
+    return obj if isinstance(obj, dict) else {}
+
+
+def _pdfminer_name(obj):
+    from pdfminer.pdftypes import resolve1
+    from pdfminer.psparser import PSLiteral, literal_name
+
+    obj = resolve1(obj)
+    return literal_name(obj) if isinstance(obj, PSLiteral) else None
+
+
+def _latin_font(font):
+    """True when the font's bytes are its letters and digits in Latin-1."""
+    if _pdfminer_name(font.get("Subtype")) not in _SIMPLE_FONTS:
+        return False
+    encoding = font.get("Encoding")
+    if encoding is None:
+        # Sin /Encoding manda la de la fuente: solo se confia en las no
+        # incrustadas (las 14 estandar).
+        descriptor = _pdfminer_dict(font.get("FontDescriptor"))
+        return not any(key in descriptor for key in _EMBEDDED_FONT_KEYS)
+    # Un diccionario con /Differences puede cambiar cualquier caracter.
+    return _pdfminer_name(encoding) in _LATIN_ENCODINGS
+
+
+def _latin_resources(resources):
+    from pdfminer.pdftypes import PDFStream, resolve1
+
+    resources = _pdfminer_dict(resources)
+    for xobject in _pdfminer_dict(resources.get("XObject")).values():
+        xobject = resolve1(xobject)
+        if isinstance(xobject, PDFStream) and _pdfminer_name(xobject.get("Subtype")) == "Form":
+            return False
+    return all(
+        _latin_font(_pdfminer_dict(font))
+        for font in _pdfminer_dict(resources.get("Font")).values()
+    )
+
+
+_CONTENT_TOKEN = re.compile(
+    rb"\("  # cadena literal, se lee aparte por los parentesis anidados
+    rb"|<[0-9A-Fa-f\s]*>"  # cadena hexadecimal
+    rb"|[+-]?(?:\d+\.?\d*|\.\d+)"  # numero
+    rb"|/[^\s/\[\]()<>{}%]*"  # nombre
+    rb"|[A-Za-z'\"*]+"  # operador
+)
+_LITERAL_ESCAPES = {ord("n"): 10, ord("r"): 13, ord("t"): 9, ord("b"): 8, ord("f"): 12}
+_SHOW_OPERATORS = {b"Tj", b"TJ", b"'", b'"'}
+_LINE_OPERATORS = {b"BT", b"ET", b"Td", b"TD", b"Tm", b"T*", b"'", b'"'}
+# Desplazamiento de TJ (milesimas de em) que separa palabras.
+_TJ_SPACE = -250
+
+
+def _literal_string(data, position):
+    """Decode a literal string whose "(" ends at position; return (bytes, end)."""
+    out = bytearray()
+    depth = 1
+    length = len(data)
+    while position < length:
+        char = data[position]
+        position += 1
+        if char == 0x5C:  # backslash
+            if position >= length:
+                break
+            escaped = data[position]
+            position += 1
+            if escaped in _LITERAL_ESCAPES:
+                out.append(_LITERAL_ESCAPES[escaped])
+            elif 0x30 <= escaped <= 0x37:
+                value = escaped - 0x30
+                for _ in range(2):
+                    if position < length and 0x30 <= data[position] <= 0x37:
+                        value = value * 8 + data[position] - 0x30
+                        position += 1
+                out.append(value & 0xFF)
+            elif escaped not in (10, 13):
+                out.append(escaped)
+            continue
+        if char == 0x28:
+            depth += 1
+        elif char == 0x29:
+            depth -= 1
+            if not depth:
+                break
+        out.append(char)
+    return bytes(out), position
+
+
+def _hex_string(token):
+    digits = re.sub(rb"\s", b"", token[1:-1])
+    if len(digits) % 2:
+        digits += b"0"
+    return bytes.fromhex(digits.decode("ascii"))
+
+
+def scan_content_text(data):
+    """Text shown by the Tj/TJ/'/" operators of a content stream.
+
+    Bytes are read as Latin-1, which matches the WinAnsi/Standard encodings
+    for letters and digits. Text in CID fonts comes out as isolated
+    characters and yields no codes, so those pages fall back to pdfplumber.
+    """
+    parts = []
+    operands = []
+    position = 0
+    while True:
+        match = _CONTENT_TOKEN.search(data, position)
+        if match is None:
+            break
+        token = match.group()
+        position = match.end()
+        first = token[:1]
+        if first == b"(":
+            value, position = _literal_string(data, position)
+            operands.append(value)
+        elif first == b"<":
+            operands.append(_hex_string(token))
+        elif first in b"+-.0123456789":
+            operands.append(float(token))
+        elif first == b"/":
+            continue
+        else:
+            if token in _LINE_OPERATORS:
+                parts.append("\n")
+            if token in _SHOW_OPERATORS:
+                for operand in operands:
+                    if isinstance(operand, bytes):
+                        parts.append(operand.decode("latin-1"))
+                    elif operand <= _TJ_SPACE:
+                        parts.append(" ")
+                parts.append(" ")
+            operands = []
+    return "".join(parts)
+
+
+ENGINES = {
+    engine.name: engine for engine in (PdfplumberEngine(), PypdfEngine(), RawEngine())
+}
+
+
+def pypdf_available():
+    try:
+        import pypdf  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def get_engine(name=None):
+    """Return the engine called name (CONTROL_PDF_ENGINE when None).
+
+    Only pdfplumber reads text with its layout. The other engines can miss
+    codes; the indexer re-reads with pdfplumber the pages where they find
+    none or where may_miss_codes() says the text was not read whole, but
+    a code the engine garbles without either sign is still lost.
+    """
+    name = name or PDF_ENGINE
+    if name == "fast":
+        name = "pypdf" if pypdf_available() else "raw"
+    if name not in ENGINES:
+        raise ValueError(f"Motor de extraccion desconocido: {name}")
+    if name == "pypdf" and not pypdf_available():
+        raise ValueError("El motor pypdf requiere instalar pypdf (pip install pypdf)")
+    return ENGINES[name]
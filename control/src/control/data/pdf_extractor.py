@@ -1,45 +1,201 @@
 import hashlib
 import json
+import multiprocessing
+import os
 import re
 import sqlite3
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import ExitStack, contextmanager
+from operator import methodcaller
 from pathlib import Path
 
-from control.database.db import get_connection
+from control.config import DATA_DIR
+from control.data.engines import DEFAULT_ENGINE, get_engine
+from control.database.db import connection
+from control.database.stats import refresh_pdf_stats
 
 CODE_PATTERN = re.compile(r"\b[A-Z0-9][A-Z0-9\-]{5,}\b")
+_HAS_DIGIT = re.compile(r"[0-9]")
+# Los tokens empiezan con letra o digito: solo sobran guiones al final.
+_strip_dashes = methodcaller("rstrip", "-")
+# Paginas por tarea enviada a cada proceso en modo paralelo.
+PARALLEL_CHUNK_PAGES = 25
+# Un mtime mas reciente que esto no se guarda como huella: el archivo puede
+# seguir cambiando sin que cambien tamano ni mtime (resolucion del reloj).
+STAT_SETTLE_SECONDS = 2
+# Indexacion progresiva: cada cuantos segundos se confirman las hojas leidas.
+PUBLISH_SECONDS = 1.0
+# Un archivo de lock por PDF que se esta publicando (ver _lock_indexing).
+_LOCK_DIR = DATA_DIR / "indexing"
+
+
+class IndexingCancelled(RuntimeError):
+    """Raised inside extract_pdf when its cancel event is set."""
+
+
+PageCodes = namedtuple(
+    "PageCodes",
+    "page_index total_pages codes content_hash cache_hit",
+    defaults=(None, False),
+)
 
 
 def _file_signature(path):
-    digest = hashlib.sha256()
     with path.open("rb") as handle:
+        if hasattr(hashlib, "file_digest"):
+            # Lee directo a un buffer reutilizado y suelta el GIL al hashear.
+            return hashlib.file_digest(handle, "sha256").hexdigest()
+        digest = hashlib.sha256()
         for chunk in iter(lambda: handle.read(1024 * 1024), b""):
             digest.update(chunk)
     return digest.hexdigest()
 
 
-def _normalize_code(raw):
-    code = raw.strip().upper()
-    code = code.strip("-")
-    if len(code) < 6:
-        return None
-    if not any(char.isdigit() for char in code):
+def _file_signatures(paths, workers=1):
+    if workers <= 1 or len(paths) <= 1:
+        return [_file_signature(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=min(workers, len(paths))) as executor:
+        return list(executor.map(_file_signature, paths))
+
+
+def _file_stat(path):
+    """(size, mtime_ns, inode) of path, or None while it may still change."""
+    stat = path.stat()
+    if time.time() - stat.st_mtime < STAT_SETTLE_SECONDS:
         return None
-    return code
+    return (stat.st_size, stat.st_mtime_ns, stat.st_ino)
 
 
 def _extract_codes(text):
+    """Return the distinct codes of text in order of first appearance.
+
+    A code is a CODE_PATTERN token without trailing dashes, at least 6
+    characters long and with a digit. Both rules depend only on the code, so
+    tokens are deduplicated first and filtered with C-level calls.
+    """
     if not text:
         return []
 
-    seen = set()
-    codes = []
-    for token in CODE_PATTERN.findall(text.upper()):
-        code = _normalize_code(token)
-        if not code or code in seen:
-            continue
-        seen.add(code)
-        codes.append(code)
-    return codes
+    tokens = dict.fromkeys(CODE_PATTERN.findall(text.upper()))
+    codes = dict.fromkeys(map(_strip_dashes, filter(_HAS_DIGIT.search, tokens)))
+    return [code for code in codes if len(code) >= 6]
+
+
+class _FallbackPages:
+    """Reference-engine pages of a PDF, opened only if some page needs them."""
+
+    def __init__(self, path_text):
+        self.path_text = path_text
+        self._stack = ExitStack()
+        self._pages = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def codes(self, page_index):
+        engine = get_engine(DEFAULT_ENGINE)
+        if self._pages is None:
+            self._pages = self._stack.enter_context(engine.open(self.path_text))
+        return _extract_codes(engine.text(self._pages[page_index - 1]))
+
+
+def _page_codes(engine, page, page_index, total_pages, page_cache, fallback=None):
+    content_hash = engine.content_hash(page)
+    codes = page_cache.get(content_hash) if page_cache else None
+    if codes is not None:
+        return PageCodes(page_index, total_pages, codes, content_hash, True)
+    try:
+        text = engine.text(page)
+    except Exception:
+        # Un motor rapido que no entiende la hoja cede al de referencia.
+        if fallback is None:
+            raise
+        text = ""
+    codes = _extract_codes(text)
+    if fallback is not None and (not codes or engine.may_miss_codes(page, text)):
+        codes = fallback.codes(page_index)
+    return PageCodes(page_index, total_pages, codes, content_hash)
+
+
+@contextmanager
+def _open_pages(path_text, engine):
+    """Yield (pages, fallback) for path_text; fallback is None for pdfplumber."""
+    with ExitStack() as stack:
+        pages = stack.enter_context(engine.open(path_text))
+        fallback = None
+        if engine.name != DEFAULT_ENGINE:
+            fallback = stack.enter_context(_FallbackPages(path_text))
+        yield pages, fallback
+
+
+def _process_pool(workers):
+    # spawn en todos los sistemas (en Windows es el unico): el pool se crea
+    # tambien desde hilos (--progressive, --watch) mientras otros tienen
+    # conexiones y locks de SQLite, que un fork copiaria a medio usar.
+    return ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
+def _extract_page_range(path_text, first_page, last_page, page_cache=None, engine=None):
+    # Se ejecuta en un proceso hijo: no toca la base de datos.
+    engine = get_engine(engine)
+    results = []
+    with _open_pages(path_text, engine) as (pages, fallback):
+        total_pages = len(pages)
+        for page_index in range(first_page, last_page + 1):
+            page = pages[page_index - 1]
+            results.append(
+                _page_codes(engine, page, page_index, total_pages, page_cache, fallback)
+            )
+    return results
+
+
+def _iter_page_codes(path_text, workers=1, page_cache=None, engine=None):
+    """Yield a PageCodes per page, in page order.
+
+    Pages whose content hash is in page_cache (hash -> codes) reuse those
+    codes instead of extracting the text. engine names the extraction
+    backend (see control.data.engines); pages where a fast engine finds no
+    code are read again with pdfplumber. With workers > 1 the pages are
+    split into chunks extracted in a process pool; results are still yielded
+    in page order so the caller can remain the single writer.
+    """
+    engine = get_engine(engine)
+    # The engines import their PDF library lazily so the program can still
+    # start even if dependency installation is pending and there are cached
+    # PDFs.
+    with _open_pages(path_text, engine) as (pages, fallback):
+        total_pages = len(pages)
+        if workers <= 1 or total_pages <= PARALLEL_CHUNK_PAGES:
+            for page_index, page in enumerate(pages, start=1):
+                yield _page_codes(
+                    engine, page, page_index, total_pages, page_cache, fallback
+                )
+            return
+
+    ranges = [
+        (first, min(first + PARALLEL_CHUNK_PAGES - 1, total_pages))
+        for first in range(1, total_pages + 1, PARALLEL_CHUNK_PAGES)
+    ]
+    with _process_pool(workers) as executor:
+        futures = [
+            executor.submit(
+                _extract_page_range, path_text, first, last, page_cache, engine.name
+            )
+            for first, last in ranges
+        ]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
 
 
 def _log_extract_summary(cur, summary):
@@ -50,219 +206,645 @@ def _log_extract_summary(cur, summary):
 
 
 def _clear_duplicate_rows(cur, pdf_id):
+    """Delete duplicate rows touching pdf_id; return the other PDFs whose
+    counters lose rows."""
+    cur.execute(
+        "SELECT DISTINCT new_pdf_id FROM code_duplicates WHERE existing_pdf_id = ?",
+        (pdf_id,),
+    )
+    affected = {row[0] for row in cur.fetchall()}
+    affected.discard(pdf_id)
     cur.execute(
         "DELETE FROM code_duplicates WHERE new_pdf_id = ? OR existing_pdf_id = ?",
         (pdf_id, pdf_id),
     )
+    return affected
 
 
-def _register_duplicate(
-    cur,
-    code,
-    duplicate_kind,
-    new_pdf_id,
-    new_page_number,
-    existing_pdf_id,
-    existing_page_number,
-):
+def _existing_code_rows(cur, codes):
+    """Map each staged code to its (pdf_id, page_number) rows already in pages."""
+    cur.execute("CREATE TEMP TABLE IF NOT EXISTS staged_codes (code TEXT PRIMARY KEY)")
+    cur.execute("DELETE FROM staged_codes")
+    cur.executemany(
+        "INSERT OR IGNORE INTO staged_codes (code) VALUES (?)",
+        ((code,) for code in codes),
+    )
     cur.execute(
         """
-        INSERT INTO code_duplicates (
-            code,
-            duplicate_kind,
-            new_pdf_id,
-            new_page_number,
-            existing_pdf_id,
-            existing_page_number
-        )
-        VALUES (?, ?, ?, ?, ?, ?)
-        """,
-        (
-            code,
-            duplicate_kind,
-            new_pdf_id,
-            new_page_number,
-            existing_pdf_id,
-            existing_page_number,
-        ),
+        SELECT p.code, p.pdf_id, p.page_number
+        FROM staged_codes s
+        JOIN pages p ON p.code = s.code
+        ORDER BY p.pdf_id, p.page_number
+        """
     )
+    existing = {}
+    for code, pdf_id, page_number in cur.fetchall():
+        existing.setdefault(code, []).append((pdf_id, page_number))
+    cur.execute("DELETE FROM staged_codes")
+    return existing
 
 
 def list_loaded_pdfs():
-    conn = get_connection()
-    try:
+    with connection() as conn:
         cur = conn.cursor()
         cur.execute(
             """
-            SELECT f.file_name, f.file_path, COUNT(p.code) AS codes
+            SELECT f.file_name, f.file_path, COALESCE(s.codes, 0) AS codes
             FROM pdf_files f
-            LEFT JOIN pages p ON p.pdf_id = f.id
-            GROUP BY f.id, f.file_name, f.file_path
+            LEFT JOIN pdf_stats s ON s.pdf_id = f.id
             ORDER BY f.loaded_at DESC, f.id DESC
             """
         )
         return cur.fetchall()
-    finally:
-        conn.close()
 
 
-def extract_pdf(pdf_path, progress_callback=None):
+def _resolve_pdf_path(pdf_path):
     path = Path(pdf_path).expanduser().resolve()
     if not path.exists():
         raise FileNotFoundError(f"No existe el PDF: {path}")
     if path.suffix.lower() != ".pdf":
         raise ValueError(f"Archivo no soportado: {path}")
+    return path
 
-    signature = _file_signature(path)
+
+def _load_page_cache(cur, path_text):
+    """Return content_hash -> codes for the pages last indexed from path_text."""
+    cur.execute(
+        """
+        SELECT c.content_hash, c.codes
+        FROM page_cache c
+        JOIN pdf_files f ON f.id = c.pdf_id
+        WHERE f.file_path = ?
+        """,
+        (path_text,),
+    )
+    return {content_hash: json.loads(codes) for content_hash, codes in cur.fetchall()}
+
+
+def _store_page_cache(cur, pdf_id, pages):
+    cur.execute("DELETE FROM page_cache WHERE pdf_id = ?", (pdf_id,))
+    cur.executemany(
+        "INSERT INTO page_cache (pdf_id, page_number, content_hash, codes) "
+        "VALUES (?, ?, ?, ?)",
+        [
+            (pdf_id, page.page_index, page.content_hash, json.dumps(page.codes))
+            for page in pages
+            if page.content_hash is not None
+        ],
+    )
+
+
+def _is_cached(cur, path_text, signature):
+    cur.execute(
+        "SELECT signature, indexing FROM pdf_files WHERE file_path = ?",
+        (path_text,),
+    )
+    # fetchall cierra la lectura: no queda un snapshot abierto durante la
+    # extraccion que sigue.
+    rows = cur.fetchall()
+    # Una indexacion progresiva cortada a la mitad no cuenta como cache.
+    return bool(rows) and rows[0][0] == signature and not rows[0][1]
+
+
+def _stat_unchanged(cur, path_text, file_stat):
+    # Misma huella que al indexar: el contenido no cambio y no hace falta
+    # leer el archivo entero para calcular la firma.
+    if file_stat is None:
+        return False
+    cur.execute(
+        "SELECT file_size, file_mtime_ns, file_inode FROM pdf_files WHERE file_path = ?",
+        (path_text,),
+    )
+    rows = cur.fetchall()
+    return bool(rows) and tuple(rows[0]) == file_stat
+
+
+def _record_file_stat(cur, path_text, file_stat):
+    # Firma igual con otra huella (copiado, tocado): se guarda la nueva para
+    # no volver a hashear en la proxima carga.
+    if file_stat is None:
+        return
+    cur.execute(
+        """
+        UPDATE pdf_files SET file_size = ?, file_mtime_ns = ?, file_inode = ?
+        WHERE file_path = ?
+        """,
+        (*file_stat, path_text),
+    )
+
+
+def _claim_pdf(cur, path, signature, indexing):
+    """Create or reset the pdf_files row of path under the write lock.
+
+    Returns (pdf_id, other PDFs whose duplicate counters changed), or None
+    when another writer already indexed this signature or is publishing it.
+    """
     path_text = str(path)
+    cur.execute(
+        "SELECT id, signature, indexing FROM pdf_files WHERE file_path = ?",
+        (path_text,),
+    )
+    existing = cur.fetchone()
 
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
+    if existing and existing[1] == signature and not existing[2]:
+        return None
+    if existing and existing[2]:
+        # Marcado como indexandose: si quien lo publica sigue vivo no se le
+        # borran las hojas.
+        fd = _lock_indexing(existing[0])
+        if fd is None:
+            return None
+        os.close(fd)
+
+    affected_pdf_ids = set()
+    if existing:
+        pdf_id = existing[0]
+        cur.execute("DELETE FROM pages WHERE pdf_id = ?", (pdf_id,))
+        cur.execute("DELETE FROM page_state WHERE pdf_id = ?", (pdf_id,))
+        affected_pdf_ids = _clear_duplicate_rows(cur, pdf_id)
+        cur.execute(
+            """
+            UPDATE pdf_files
+            SET file_name = ?, signature = ?, loaded_at = datetime('now'),
+                file_size = NULL, file_mtime_ns = NULL, file_inode = NULL,
+                indexing = ?, generation = generation + 1
+            WHERE id = ?
+            """,
+            (path.name, signature, indexing, pdf_id),
+        )
+    else:
         cur.execute(
-            "SELECT id, signature FROM pdf_files WHERE file_path = ?",
-            (path_text,),
+            """
+            INSERT INTO pdf_files (file_name, file_path, signature, indexing)
+            VALUES (?, ?, ?, ?)
+            """,
+            (path.name, path_text, signature, indexing),
         )
-        existing = cur.fetchone()
+        pdf_id = cur.lastrowid
+    return pdf_id, affected_pdf_ids
 
-        if existing and existing[1] == signature:
-            return False
 
-        if existing:
-            pdf_id = existing[0]
-            cur.execute("DELETE FROM pages WHERE pdf_id = ?", (pdf_id,))
-            _clear_duplicate_rows(cur, pdf_id)
-            cur.execute(
-                """
-                UPDATE pdf_files
-                SET file_name = ?, signature = ?, loaded_at = datetime('now')
-                WHERE id = ?
-                """,
-                (path.name, signature, pdf_id),
-            )
+def _lock_indexing(pdf_id):
+    """Take the lock file held while pdf_id is published progressively.
+
+    Returns its descriptor, or None when another live process holds it. The
+    OS drops the lock when the process dies, which tells a crashed indexing
+    from one still running.
+    """
+    path = _LOCK_DIR / f"{pdf_id}.lock"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    try:
+        if os.name == "nt":
+            import msvcrt
+
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
         else:
-            cur.execute(
-                "INSERT INTO pdf_files (file_name, file_path, signature) VALUES (?, ?, ?)",
-                (path.name, path_text, signature),
-            )
-            pdf_id = cur.lastrowid
-
-        # Import lazily so the program can still start even if dependency
-        # installation is pending and there are cached PDFs.
-        import pdfplumber
-
-        inserted = 0
-        duplicates = 0
-        duplicates_same_pdf = 0
-        duplicates_cross_pdf = 0
-        codes_found = 0
-        pages_processed = 0
-        start_page = None
-        end_page = None
-
-        with pdfplumber.open(path_text) as pdf:
-            total_pages = len(pdf.pages)
-
-            for page_index, page in enumerate(pdf.pages, start=1):
-                if progress_callback is not None:
-                    progress_callback(path_text, page_index, total_pages)
-
-                text = page.extract_text() or ""
-                codes = _extract_codes(text)
-                pages_processed += 1
-
-                if not codes:
-                    continue
-
-                if start_page is None:
-                    start_page = page_index
-                end_page = page_index
-
-                for code in codes:
-                    codes_found += 1
-                    cur.execute(
-                        """
-                        SELECT pdf_id, page_number
-                        FROM pages
-                        WHERE code = ?
-                        ORDER BY pdf_id, page_number
-                        """,
-                        (code,),
+            import fcntl
+
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _discard_pdf(cur, pdf_id):
+    """Delete pdf_id and every row that hangs from it, as if never loaded."""
+    affected_pdf_ids = _clear_duplicate_rows(cur, pdf_id)
+    for table in ("pages", "page_state", "page_cache", "pdf_stats"):
+        cur.execute(f"DELETE FROM {table} WHERE pdf_id = ?", (pdf_id,))
+    cur.execute("DELETE FROM pdf_files WHERE id = ?", (pdf_id,))
+    refresh_pdf_stats(cur, affected_pdf_ids)
+
+
+def discard_interrupted_indexing():
+    """Remove the PDFs left half-published by a progressive indexing that died.
+
+    PDFs still marked as indexing whose lock is held belong to a running
+    process and are kept. Returns the file paths of the PDFs removed, which
+    have to be indexed again.
+    """
+    with connection() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT 1 FROM pdf_files WHERE indexing = 1 LIMIT 1")
+        if not cur.fetchall() and not any(_LOCK_DIR.glob("*.lock")):
+            return []
+        cur.execute("BEGIN IMMEDIATE")
+        cur.execute("SELECT id, file_path FROM pdf_files WHERE indexing = 1 ORDER BY id")
+        discarded = []
+        running = set()
+        for pdf_id, file_path in cur.fetchall():
+            fd = _lock_indexing(pdf_id)
+            if fd is None:
+                running.add(str(pdf_id))
+                continue
+            os.close(fd)
+            _discard_pdf(cur, pdf_id)
+            discarded.append(file_path)
+        # Con el lock de escritura nadie puede estar tomando un lock nuevo:
+        # se borran los de las indexaciones que ya terminaron.
+        for lock_path in _LOCK_DIR.glob("*.lock"):
+            if lock_path.stem not in running:
+                try:
+                    lock_path.unlink()
+                except OSError:
+                    pass
+        if discarded:
+            _log_discarded(cur, discarded)
+        return discarded
+
+
+def _log_discarded(cur, paths):
+    details = {"files": [Path(path).name for path in paths]}
+    cur.execute(
+        "INSERT INTO events (event_type, details) VALUES (?, ?)",
+        ("extract_discarded", json.dumps(details)),
+    )
+
+
+def _publish_pages(cur, pdf_id, staged, first_page_by_code, summary):
+    """Insert the staged (page_index, codes) of pdf_id and their duplicates.
+
+    first_page_by_code carries the codes already published for this PDF
+    between calls; summary counters are updated in place.
+    """
+    # Rows of this PDF come from first_page_by_code (earlier batches).
+    existing_rows = {
+        code: [row for row in rows if row[0] != pdf_id]
+        for code, rows in _existing_code_rows(
+            cur, (code for _page_index, codes in staged for code in codes)
+        ).items()
+    }
+
+    # Same rules as inserting code by code: every occurrence is a duplicate
+    # of each earlier row with that code (other PDFs, or the first page of
+    # this PDF where it appeared), ordered by (pdf_id, page_number).
+    page_rows = []
+    duplicate_rows = []
+    for page_index, codes in staged:
+        for code in codes:
+            summary["codes_found"] += 1
+            previous_rows = existing_rows.get(code, [])
+            first_page = first_page_by_code.get(code)
+            if first_page is not None:
+                previous_rows = sorted(previous_rows + [(pdf_id, first_page)])
+
+            for previous_pdf_id, previous_page in previous_rows:
+                if previous_pdf_id == pdf_id:
+                    duplicate_kind = "same_pdf"
+                    summary["duplicates_same_pdf"] += 1
+                else:
+                    duplicate_kind = "cross_pdf"
+                    summary["duplicates_cross_pdf"] += 1
+                duplicate_rows.append(
+                    (
+                        code,
+                        duplicate_kind,
+                        pdf_id,
+                        page_index,
+                        previous_pdf_id,
+                        previous_page,
                     )
-                    previous_rows = cur.fetchall()
-                    has_same_pdf_duplicate = False
-                    for previous_pdf_id, previous_page in previous_rows:
-                        duplicate_kind = (
-                            "same_pdf" if previous_pdf_id == pdf_id else "cross_pdf"
-                        )
-                        _register_duplicate(
-                            cur,
-                            code=code,
-                            duplicate_kind=duplicate_kind,
-                            new_pdf_id=pdf_id,
-                            new_page_number=page_index,
-                            existing_pdf_id=previous_pdf_id,
-                            existing_page_number=previous_page,
-                        )
-                        duplicates += 1
-                        if duplicate_kind == "same_pdf":
-                            has_same_pdf_duplicate = True
-                            duplicates_same_pdf += 1
-                        else:
-                            duplicates_cross_pdf += 1
-
-                    try:
-                        cur.execute(
-                            """
-                            INSERT INTO pages (page_number, code, scanned, pdf_id)
-                            VALUES (?, ?, 0, ?)
-                            """,
-                            (page_index, code, pdf_id),
-                        )
-                        inserted += 1
-                    except sqlite3.IntegrityError:
-                        if not has_same_pdf_duplicate:
-                            cur.execute(
-                                """
-                                SELECT page_number
-                                FROM pages
-                                WHERE pdf_id = ? AND code = ?
-                                ORDER BY page_number
-                                LIMIT 1
-                                """,
-                                (pdf_id, code),
-                            )
-                            existing_same_pdf = cur.fetchone()
-                            if existing_same_pdf is not None:
-                                _register_duplicate(
-                                    cur,
-                                    code=code,
-                                    duplicate_kind="same_pdf",
-                                    new_pdf_id=pdf_id,
-                                    new_page_number=page_index,
-                                    existing_pdf_id=pdf_id,
-                                    existing_page_number=existing_same_pdf[0],
-                                )
-                                duplicates += 1
-                                duplicates_same_pdf += 1
-
-        summary = {
-            "pdf": path.name,
-            "start_page": start_page,
-            "end_page": end_page,
-            "total_pages": total_pages,
-            "pages_processed": pages_processed,
-            "codes_found": codes_found,
-            "inserted": inserted,
-            "duplicates": duplicates,
-            "duplicates_same_pdf": duplicates_same_pdf,
-            "duplicates_cross_pdf": duplicates_cross_pdf,
-        }
+                )
+
+            if first_page is None:
+                first_page_by_code[code] = page_index
+                page_rows.append((page_index, code, pdf_id))
+
+    cur.executemany(
+        """
+        INSERT INTO pages (page_number, code, pdf_id)
+        VALUES (?, ?, ?)
+        """,
+        page_rows,
+    )
+    cur.executemany(
+        "INSERT INTO page_state (pdf_id, page_number) VALUES (?, ?)",
+        sorted({(pdf_id, page_index) for page_index, _code, _pdf_id in page_rows}),
+    )
+    cur.executemany(
+        """
+        INSERT INTO code_duplicates (
+            code,
+            duplicate_kind,
+            new_pdf_id,
+            new_page_number,
+            existing_pdf_id,
+            existing_page_number
+        )
+        VALUES (?, ?, ?, ?, ?, ?)
+        """,
+        duplicate_rows,
+    )
+    summary["inserted"] += len(page_rows)
+    summary["duplicates"] += len(duplicate_rows)
+
+
+def _index_pdf(
+    conn,
+    path,
+    signature,
+    page_codes,
+    progress_callback=None,
+    file_stat=None,
+    publish_seconds=None,
+    cancel=None,
+):
+    """Write one PDF's codes; page_codes yields PageCodes in page order.
+
+    Returns False without consuming page_codes when the signature is cached.
+    The pages are read before any write: the write lock is only held while
+    the extracted rows are published, so scans keep running meanwhile. The
+    caller owns the transaction. file_stat (see _file_stat) is stored so the
+    next load can skip hashing an unchanged file.
+
+    With publish_seconds, the pages read so far are committed every
+    publish_seconds while the PDF stays marked as indexing, so they can be
+    scanned before the last page is read; the caller must not have a
+    transaction open. Setting the cancel event stops before the next page
+    with IndexingCancelled, after removing what was already published.
+    """
+    path_text = str(path)
+    cur = conn.cursor()
+    if _is_cached(cur, path_text, signature):
+        return False
+
+    summary = {
+        "pdf": path.name,
+        "start_page": None,
+        "end_page": None,
+        "total_pages": 0,
+        "pages_processed": 0,
+        "codes_found": 0,
+        "inserted": 0,
+        "duplicates": 0,
+        "duplicates_same_pdf": 0,
+        "duplicates_cross_pdf": 0,
+        "cache_hits": 0,
+        "cache_misses": 0,
+    }
+    first_page_by_code = {}
+    staged = []
+    cacheable = []
+    claimed = None
+    lock = None
+    published = False
+    published_at = time.monotonic()
+
+    try:
+        for page in page_codes:
+            if cancel is not None and cancel.is_set():
+                raise IndexingCancelled(path.name)
+            page_index = page.page_index
+            summary["total_pages"] = page.total_pages
+            if progress_callback is not None:
+                progress_callback(path_text, page_index, page.total_pages)
+
+            summary["pages_processed"] += 1
+            summary["cache_hits" if page.cache_hit else "cache_misses"] += 1
+            cacheable.append(page)
+
+            if page.codes:
+                if summary["start_page"] is None:
+                    summary["start_page"] = page_index
+                summary["end_page"] = page_index
+                staged.append((page_index, page.codes))
+
+            if (
+                publish_seconds is None
+                or not staged
+                or time.monotonic() - published_at < publish_seconds
+            ):
+                continue
+            if not conn.in_transaction:
+                cur.execute("BEGIN IMMEDIATE")
+            if claimed is None:
+                claimed = _claim_pdf(cur, path, signature, indexing=1)
+                if claimed is None:
+                    return False
+                lock = _lock_indexing(claimed[0])
+                if lock is None:
+                    # Otro proceso lo esta publicando.
+                    conn.rollback()
+                    return False
+            _publish_pages(cur, claimed[0], staged, first_page_by_code, summary)
+            refresh_pdf_stats(cur, [claimed[0]])
+            conn.commit()
+            published = True
+            staged = []
+            published_at = time.monotonic()
+
+        if not conn.in_transaction:
+            # Lock de escritura antes de leer lo que se va a reemplazar: otro
+            # proceso pudo indexar el mismo archivo durante la extraccion.
+            cur.execute("BEGIN IMMEDIATE")
+        if claimed is None:
+            claimed = _claim_pdf(cur, path, signature, indexing=0)
+            if claimed is None:
+                return False
+        pdf_id, affected_pdf_ids = claimed
+
+        _publish_pages(cur, pdf_id, staged, first_page_by_code, summary)
+        cur.execute(
+            """
+            UPDATE pdf_files
+            SET indexing = 0, file_size = ?, file_mtime_ns = ?, file_inode = ?
+            WHERE id = ?
+            """,
+            (*(file_stat or (None, None, None)), pdf_id),
+        )
+        _store_page_cache(cur, pdf_id, cacheable)
+        refresh_pdf_stats(cur, [pdf_id, *affected_pdf_ids])
         _log_extract_summary(cur, summary)
-        conn.commit()
         return True
-    except Exception:
-        conn.rollback()
+    except BaseException:
+        if published:
+            _discard_published(conn, claimed[0], path_text)
         raise
     finally:
-        conn.close()
+        if lock is not None:
+            os.close(lock)
+
+
+def _discard_published(conn, pdf_id, path_text):
+    # Fallo despues de publicar hojas: se quitan para que el PDF no quede
+    # marcado como indexandose para siempre. Si la base no deja, lo limpia
+    # discard_interrupted_indexing al volver a arrancar.
+    conn.rollback()
+    cur = conn.cursor()
+    try:
+        cur.execute("BEGIN IMMEDIATE")
+        _discard_pdf(cur, pdf_id)
+        _log_discarded(cur, [path_text])
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+
+
+def _write_pdf(
+    path,
+    signature,
+    page_codes,
+    progress_callback=None,
+    file_stat=None,
+    publish_seconds=None,
+    cancel=None,
+):
+    with connection() as conn:
+        return _index_pdf(
+            conn,
+            path,
+            signature,
+            page_codes,
+            progress_callback=progress_callback,
+            file_stat=file_stat,
+            publish_seconds=publish_seconds,
+            cancel=cancel,
+        )
+
+
+def extract_pdf(
+    pdf_path,
+    progress_callback=None,
+    workers=1,
+    engine=None,
+    publish_seconds=None,
+    cancel=None,
+):
+    """Index one PDF; False when its cached codes are still valid.
+
+    With publish_seconds the pages become scannable in page order while the
+    rest of the PDF is still being read. cancel is a threading.Event that
+    aborts the indexing between pages (see _index_pdf).
+    """
+    engine = get_engine(engine).name
+    path = _resolve_pdf_path(pdf_path)
+    path_text = str(path)
+    file_stat = _file_stat(path)
+
+    with connection() as conn:
+        if _stat_unchanged(conn.cursor(), path_text, file_stat):
+            return False
+
+    signature = _file_signature(path)
+    with connection() as conn:
+        cur = conn.cursor()
+        if _is_cached(cur, path_text, signature):
+            _record_file_stat(cur, path_text, file_stat)
+            return False
+        page_cache = _load_page_cache(cur, path_text)
+
+    return _write_pdf(
+        path,
+        signature,
+        _iter_page_codes(
+            path_text, workers=workers, page_cache=page_cache, engine=engine
+        ),
+        progress_callback=progress_callback,
+        file_stat=file_stat,
+        publish_seconds=publish_seconds,
+        cancel=cancel,
+    )
+
+
+def _extract_all_pages(path_text, page_cache, engine=None):
+    # Se ejecuta en un proceso hijo: extrae un PDF completo sin tocar la base.
+    return list(_iter_page_codes(path_text, page_cache=page_cache, engine=engine))
+
+
+def extract_pdfs(
+    pdf_paths, progress_callback=None, workers=1, engine=None, publish_seconds=None
+):
+    """Index several PDFs, extracting up to `workers` files concurrently.
+
+    Returns one bool per input path (True = indexed, False = cache reused),
+    like extract_pdf. Files are written by this process in input order, so
+    cross_pdf duplicates do not depend on which extraction finishes first.
+    Only files whose size, mtime or inode changed are hashed, up to
+    `workers` at a time. With publish_seconds (progressive indexing) the
+    files are indexed one after another, each split among the workers, so
+    pages are published in order as they are read. progress_callback is
+    called per page, except when whole files are extracted in parallel:
+    then it is called once per file, as each extraction finishes.
+    """
+    engine = get_engine(engine).name
+    paths = [_resolve_pdf_path(pdf_path) for pdf_path in pdf_paths]
+    file_stats = [_file_stat(path) for path in paths]
+
+    with connection() as conn:
+        cur = conn.cursor()
+        to_hash = [
+            index
+            for index, (path, file_stat) in enumerate(zip(paths, file_stats))
+            if not _stat_unchanged(cur, str(path), file_stat)
+        ]
+
+    signatures = [None] * len(paths)
+    hashed = _file_signatures([paths[index] for index in to_hash], workers=workers)
+    for index, signature in zip(to_hash, hashed):
+        signatures[index] = signature
+
+    with connection() as conn:
+        cur = conn.cursor()
+        cached = [True] * len(paths)
+        for index in to_hash:
+            path_text = str(paths[index])
+            cached[index] = _is_cached(cur, path_text, signatures[index])
+            if cached[index]:
+                _record_file_stat(cur, path_text, file_stats[index])
+        pending = [index for index, is_cached in enumerate(cached) if not is_cached]
+        page_caches = {
+            index: _load_page_cache(cur, str(paths[index])) for index in pending
+        }
+
+    results = [False] * len(paths)
+
+    if workers <= 1 or len(pending) <= 1 or publish_seconds is not None:
+        for index in pending:
+            results[index] = _write_pdf(
+                paths[index],
+                signatures[index],
+                _iter_page_codes(
+                    str(paths[index]),
+                    workers=workers,
+                    page_cache=page_caches[index],
+                    engine=engine,
+                ),
+                progress_callback=progress_callback,
+                file_stat=file_stats[index],
+                publish_seconds=publish_seconds,
+            )
+        return results
+
+    with _process_pool(min(workers, len(pending))) as executor:
+        futures = {
+            executor.submit(
+                _extract_all_pages, str(paths[index]), page_caches[index], engine
+            ): index
+            for index in pending
+        }
+        done = {}
+        next_write = 0
+        try:
+            for future in as_completed(futures):
+                index = futures[future]
+                done[index] = future
+                if progress_callback is not None and future.exception() is None:
+                    total_pages = len(future.result())
+                    progress_callback(str(paths[index]), total_pages, total_pages)
+                # Se escribe en el orden de entrada en cuanto estan listos
+                # todos los anteriores; un error se levanta en su turno.
+                while next_write < len(pending) and pending[next_write] in done:
+                    index = pending[next_write]
+                    next_write += 1
+                    results[index] = _write_pdf(
+                        paths[index],
+                        signatures[index],
+                        done.pop(index).result(),
+                        file_stat=file_stats[index],
+                    )
+        finally:
+            for future in futures:
+                future.cancel()
+    return results
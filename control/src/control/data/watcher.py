@@ -0,0 +1,266 @@
+"""Background indexing of the PDFs that land in PDF_DIR.
+
+Each pass lists the folder and indexes, with extract_pdf, every PDF whose
+size and mtime stayed the same for `settle_seconds` (a copy in progress
+keeps changing them). Between passes the watcher sleeps on inotify where
+the platform has it, otherwise it polls every `poll_interval` seconds.
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import sqlite3
+import sys
+import threading
+import time
+from pathlib import Path
+
+from control.config import PDF_DIR
+from control.data.pdf_extractor import PUBLISH_SECONDS, IndexingCancelled, extract_pdf
+from control.database.db import connection
+
+WATCH_POLL_SECONDS = 2.0
+WATCH_SETTLE_SECONDS = 2.0
+# Con inotify igual se relista la carpeta cada tanto (eventos perdidos,
+# carpetas de red donde no llegan).
+INOTIFY_RESCAN_SECONDS = 60.0
+
+_IN_MODIFY = 0x002
+_IN_ATTRIB = 0x004
+_IN_CLOSE_WRITE = 0x008
+_IN_MOVED_FROM = 0x040
+_IN_MOVED_TO = 0x080
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_MASK = (
+    _IN_MODIFY
+    | _IN_ATTRIB
+    | _IN_CLOSE_WRITE
+    | _IN_MOVED_FROM
+    | _IN_MOVED_TO
+    | _IN_CREATE
+    | _IN_DELETE
+)
+
+
+class _Inotify:
+    """inotify descriptor on one folder; only used to wake the watcher."""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), _IN_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, "inotify_add_watch")
+        # stop() escribe aqui para cortar la espera.
+        self._wake_r, self._wake_w = os.pipe()
+
+    def wait(self, timeout):
+        """Block until something changes in the folder or timeout elapses."""
+        ready, _, _ = select.select([self.fd, self._wake_r], [], [], timeout)
+        if self.fd in ready:
+            _drain(self.fd)
+        return bool(ready)
+
+    def interrupt(self):
+        os.write(self._wake_w, b"\0")
+
+    def close(self):
+        for fd in (self.fd, self._wake_r, self._wake_w):
+            os.close(fd)
+
+
+def _drain(fd):
+    try:
+        while os.read(fd, 64 * 1024):
+            pass
+    except BlockingIOError:
+        pass
+
+
+def _open_inotify(directory):
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        return _Inotify(directory)
+    except (AttributeError, OSError):
+        # Sin inotify (libc sin el simbolo, limite de watches): sondeo.
+        return None
+
+
+def _list_pdfs(directory):
+    files = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if not entry.name.lower().endswith(".pdf"):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files[entry.path] = (stat.st_size, stat.st_mtime_ns)
+    return files
+
+
+def _log_watch_event(result, path, message=None):
+    details = {"pdf": Path(path).name, "result": result}
+    if message:
+        details["message"] = message
+    with connection() as conn:
+        conn.execute(
+            "INSERT INTO events (event_type, details) VALUES (?, ?)",
+            ("watch_index", json.dumps(details)),
+        )
+
+
+class FolderWatcher:
+    """Indexes new or changed PDFs of a folder as they finish arriving.
+
+    Outcomes ("indexed", "cached" or "error") go to the events table as
+    watch_index rows and to on_result(path, result, message). PDFs already
+    in the folder at start are only reported when they get (re)indexed or
+    fail. Extraction runs without the write lock and publishes pages as it
+    goes (progressive indexing), so scans are not blocked and a new lot can
+    be scanned before it is fully read.
+    """
+
+    def __init__(
+        self,
+        directory=None,
+        engine=None,
+        settle_seconds=WATCH_SETTLE_SECONDS,
+        poll_interval=WATCH_POLL_SECONDS,
+        on_result=None,
+        use_inotify=True,
+    ):
+        self.directory = Path(directory or PDF_DIR)
+        self.engine = engine
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.on_result = on_result
+        self.use_inotify = use_inotify
+        # path -> (stat, desde cuando no cambia) de lo que falta indexar.
+        self._pending = {}
+        # path -> stat con el que ya se proceso (indexado, cache o error).
+        self._handled = {}
+        # Lo que ya estaba al arrancar: si queda en cache no se reporta.
+        self._initial = None
+        self._stopped = threading.Event()
+        self._thread = None
+        self._notifier = None
+
+    def scan(self, now=None):
+        """One pass over the folder; return [(path, result)] of what was handled."""
+        now = time.monotonic() if now is None else now
+        files = _list_pdfs(self.directory)
+        for path in list(self._pending):
+            if path not in files:
+                del self._pending[path]
+        for path in list(self._handled):
+            if path not in files:
+                del self._handled[path]
+
+        if self._initial is None:
+            self._initial = dict(files)
+        handled = []
+        for path, stat in sorted(files.items()):
+            if self._stopped.is_set():
+                break
+            if self._handled.get(path) == stat:
+                continue
+            pending = self._pending.get(path)
+            if pending is None or pending[0] != stat:
+                # Nuevo o todavia cambiando: se espera a que se asiente.
+                self._pending[path] = (stat, now)
+                if self.settle_seconds > 0:
+                    continue
+            elif now - pending[1] < self.settle_seconds:
+                continue
+            result = self._index(path, stat, self._initial.get(path) != stat)
+            if result is not None:
+                handled.append((path, result))
+        return handled
+
+    def _index(self, path, stat, report_cached):
+        message = None
+        try:
+            indexed = extract_pdf(
+                path,
+                engine=self.engine,
+                publish_seconds=PUBLISH_SECONDS,
+                cancel=self._stopped,
+            )
+            result = "indexed" if indexed else "cached"
+        except IndexingCancelled:
+            # stop(): lo publicado ya se quito, se indexa en el proximo arranque.
+            return None
+        except sqlite3.OperationalError:
+            # Base bloqueada: se reintenta en la proxima pasada.
+            return None
+        except OSError:
+            # Borrado, o todavia abierto por quien lo copia: se vuelve a
+            # esperar a que se asiente.
+            self._pending.pop(path, None)
+            return None
+        except Exception as exc:  # PDF danado o incompleto: no detiene al vigilante
+            result = "error"
+            message = f"{type(exc).__name__}: {exc}"
+        self._pending.pop(path, None)
+        self._handled[path] = stat
+        if result == "cached" and not report_cached:
+            return result
+        try:
+            _log_watch_event(result, path, message)
+        except sqlite3.OperationalError:
+            pass
+        if self.on_result is not None:
+            self.on_result(path, result, message)
+        return result
+
+    def _timeout(self, default):
+        if not self._pending:
+            return default
+        settles = min(since for _stat, since in self._pending.values()) + self.settle_seconds
+        return max(0.05, min(default, settles - time.monotonic()))
+
+    def run(self):
+        """Watch until stop() is called."""
+        notifier = _open_inotify(self.directory) if self.use_inotify else None
+        self._notifier = notifier
+        try:
+            while not self._stopped.is_set():
+                self.scan()
+                if notifier is None:
+                    self._stopped.wait(self._timeout(self.poll_interval))
+                else:
+                    notifier.wait(self._timeout(INOTIFY_RESCAN_SECONDS))
+        finally:
+            self._notifier = None
+            if notifier is not None:
+                notifier.close()
+
+    def start(self):
+        # Sin daemon: al salir se espera a que el PDF en curso termine o se
+        # descarte, en lugar de cortarlo con hojas a medio publicar.
+        self._thread = threading.Thread(target=self.run, name="control-watch")
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stop watching; an indexing in progress is cancelled between pages."""
+        self._stopped.set()
+        notifier = self._notifier
+        if notifier is not None:
+            try:
+                notifier.interrupt()
+            except OSError:
+                pass  # ya cerrado: el hilo estaba terminando
+        if self._thread is not None:
+            self._thread.join(timeout)
@@ -1,23 +1,151 @@
 import sqlite3
+import threading
+from contextlib import contextmanager
+
 from control.config import DB_PATH, ensure_dirs
+from control.database.stats import refresh_pdf_stats
+
+# Subir al cambiar el esquema: init_db vuelve a correr las migraciones
+# (idempotentes) una vez en cada base.
+SCHEMA_VERSION = 5
+
+_local = threading.local()
+_prepare_lock = threading.Lock()
+_prepared_paths = set()
+
+
+def _prepare_database():
+    # Directory setup, legacy migration and WAL are persistent: once per
+    # process and database path is enough.
+    key = str(DB_PATH)
+    if key in _prepared_paths:
+        return
+    with _prepare_lock:
+        if key in _prepared_paths:
+            return
+        ensure_dirs()
+        conn = sqlite3.connect(DB_PATH, timeout=30)
+        try:
+            conn.execute("PRAGMA busy_timeout = 30000")
+            conn.execute("PRAGMA journal_mode = WAL")
+        finally:
+            conn.close()
+        _prepared_paths.add(key)
 
 
-def get_connection():
-    ensure_dirs()
-    conn = sqlite3.connect(DB_PATH, timeout=30)
+def _open_connection(read_only=False, check_same_thread=True):
+    if read_only:
+        conn = sqlite3.connect(
+            f"{DB_PATH.as_uri()}?mode=ro",
+            uri=True,
+            timeout=30,
+            check_same_thread=check_same_thread,
+        )
+    else:
+        conn = sqlite3.connect(DB_PATH, timeout=30, check_same_thread=check_same_thread)
     conn.execute("PRAGMA foreign_keys = ON")
     conn.execute("PRAGMA busy_timeout = 30000")
-    conn.execute("PRAGMA journal_mode = WAL")
     return conn
 
 
+def get_connection(check_same_thread=True, read_only=False):
+    """Return a new connection owned (and closed) by the caller."""
+    _prepare_database()
+    return _open_connection(read_only=read_only, check_same_thread=check_same_thread)
+
+
+def _pooled_connection(read_only=False):
+    pool = getattr(_local, "connections", None)
+    if pool is None:
+        pool = _local.connections = {}
+    key = (str(DB_PATH), read_only)
+    conn = pool.get(key)
+    if conn is None:
+        _prepare_database()
+        conn = pool[key] = _open_connection(read_only=read_only)
+    return conn
+
+
+@contextmanager
+def connection():
+    """Yield this thread's long-lived connection as a unit of work.
+
+    The outermost block commits on success and rolls back on error; nested
+    blocks on the same thread join the outer transaction.
+    """
+    conn = _pooled_connection()
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    try:
+        yield conn
+        if depth == 0:
+            conn.commit()
+    except BaseException:
+        if depth == 0:
+            conn.rollback()
+        raise
+    finally:
+        _local.depth = depth
+
+
+@contextmanager
+def read_connection():
+    """Yield this thread's long-lived read-only connection."""
+    conn = _pooled_connection(read_only=True)
+    try:
+        yield conn
+    finally:
+        if conn.in_transaction:
+            conn.rollback()
+
+
+class DataVersion:
+    """Counter that moves whenever any connection commits to the database.
+
+    PRAGMA data_version only changes for commits made through *other*
+    connections, so a dedicated connection that never writes sees them all.
+    current() returns None while the database cannot be opened.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn = None
+        self._path = None
+        self._seen = None
+        self._counter = 0
+
+    def current(self):
+        with self._lock:
+            path = str(DB_PATH)
+            try:
+                if self._conn is None or self._path != path:
+                    self._close()
+                    _prepare_database()
+                    self._conn = _open_connection(read_only=True, check_same_thread=False)
+                    self._path = path
+                value = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            except sqlite3.Error:
+                self._close()
+                return None
+            if value != self._seen:
+                self._seen = value
+                self._counter += 1
+            return self._counter
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = None
+        self._path = None
+        self._seen = None
+
+
 def _create_pages_table(cur, table_name="pages"):
     cur.execute(
         f"""
         CREATE TABLE {table_name} (
             page_number INTEGER NOT NULL CHECK(page_number >= 1),
             code TEXT NOT NULL CHECK(length(trim(code)) > 0),
-            scanned INTEGER NOT NULL DEFAULT 0 CHECK(scanned IN (0, 1)),
             pdf_id INTEGER NOT NULL,
             UNIQUE(pdf_id, code),
             FOREIGN KEY (pdf_id) REFERENCES pdf_files(id)
@@ -26,6 +154,23 @@ def _create_pages_table(cur, table_name="pages"):
     )
 
 
+def _create_page_state_table(cur):
+    # One row per page (not per code): a scan writes a single row.
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS page_state (
+            pdf_id INTEGER NOT NULL,
+            page_number INTEGER NOT NULL CHECK(page_number >= 1),
+            scanned INTEGER NOT NULL DEFAULT 0 CHECK(scanned IN (0, 1)),
+            scanned_at TEXT,
+            seq INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (pdf_id, page_number),
+            FOREIGN KEY (pdf_id) REFERENCES pdf_files(id)
+        ) WITHOUT ROWID
+        """
+    )
+
+
 def _table_sql(cur, table_name):
     cur.execute(
         "SELECT sql FROM sqlite_master WHERE type='table' AND name=?",
@@ -35,31 +180,52 @@ def _table_sql(cur, table_name):
     return row[0] if row and row[0] else ""
 
 
-def _normalize_pages_constraints(cur):
+def _normalize_pages_constraints(cur, columns):
     sql = _table_sql(cur, "pages").upper()
     required_tokens = (
         "CHECK(PAGE_NUMBER >= 1)",
         "CHECK(LENGTH(TRIM(CODE)) > 0)",
-        "CHECK(SCANNED IN (0, 1))",
         "UNIQUE(PDF_ID, CODE)",
     )
-    if all(token in sql for token in required_tokens):
+    if "scanned" not in columns and all(token in sql for token in required_tokens):
         return
 
-    _create_pages_table(cur, "pages_new")
+    # Databases before page_state kept the flag on every code row; a page
+    # counts as scanned when all of its codes were.
+    scanned = (
+        "MAX(CASE WHEN scanned = 1 THEN 1 ELSE 0 END)" if "scanned" in columns else "0"
+    )
     cur.execute(
-        """
-        INSERT INTO pages_new (page_number, code, scanned, pdf_id)
+        f"""
+        CREATE TEMP TABLE pages_normalized AS
         SELECT
-            COALESCE(MIN(CASE WHEN page_number >= 1 THEN page_number END), 1),
-            UPPER(TRIM(code)),
-            MAX(CASE WHEN scanned = 1 THEN 1 ELSE 0 END),
+            COALESCE(MIN(CASE WHEN page_number >= 1 THEN page_number END), 1)
+                AS page_number,
+            UPPER(TRIM(code)) AS code,
+            {scanned} AS scanned,
             pdf_id
         FROM pages
         WHERE pdf_id IS NOT NULL AND code IS NOT NULL AND TRIM(code) <> ''
         GROUP BY pdf_id, UPPER(TRIM(code))
         """
     )
+    _create_pages_table(cur, "pages_new")
+    cur.execute(
+        """
+        INSERT INTO pages_new (page_number, code, pdf_id)
+        SELECT page_number, code, pdf_id FROM pages_normalized
+        """
+    )
+    _create_page_state_table(cur)
+    cur.execute(
+        """
+        INSERT OR REPLACE INTO page_state (pdf_id, page_number, scanned)
+        SELECT pdf_id, page_number, MIN(scanned)
+        FROM pages_normalized
+        GROUP BY pdf_id, page_number
+        """
+    )
+    cur.execute("DROP TABLE pages_normalized")
     cur.execute("DROP TABLE pages")
     cur.execute("ALTER TABLE pages_new RENAME TO pages")
 
@@ -70,12 +236,14 @@ def _ensure_pages_schema(cur):
 
     if not has_pages:
         _create_pages_table(cur)
+        _create_page_state_table(cur)
         return
 
     cur.execute("PRAGMA table_info(pages)")
     columns = {row[1] for row in cur.fetchall()}
     if "pdf_id" in columns:
-        _normalize_pages_constraints(cur)
+        _normalize_pages_constraints(cur, columns)
+        _create_page_state_table(cur)
         return
 
     cur.execute(
@@ -92,21 +260,64 @@ def _ensure_pages_schema(cur):
     _create_pages_table(cur, "pages_new")
     cur.execute(
         """
-        INSERT INTO pages_new (page_number, code, scanned, pdf_id)
+        INSERT INTO pages_new (page_number, code, pdf_id)
         SELECT
             CASE WHEN page_number >= 1 THEN page_number ELSE 1 END,
             UPPER(TRIM(code)),
-            CASE WHEN scanned = 1 THEN 1 ELSE 0 END,
             ?
         FROM pages
         WHERE code IS NOT NULL AND TRIM(code) <> ''
         """,
         (legacy_pdf_id,),
     )
+    _create_page_state_table(cur)
+    cur.execute(
+        """
+        INSERT OR REPLACE INTO page_state (pdf_id, page_number, scanned)
+        SELECT
+            ?,
+            CASE WHEN page_number >= 1 THEN page_number ELSE 1 END,
+            MIN(CASE WHEN scanned = 1 THEN 1 ELSE 0 END)
+        FROM pages
+        WHERE code IS NOT NULL AND TRIM(code) <> ''
+        GROUP BY CASE WHEN page_number >= 1 THEN page_number ELSE 1 END
+        """,
+        (legacy_pdf_id,),
+    )
     cur.execute("DROP TABLE pages")
     cur.execute("ALTER TABLE pages_new RENAME TO pages")
 
 
+_PDF_FILES_COLUMNS = {
+    # Huella del archivo (tamano, mtime, inodo): si no cambia no se recalcula
+    # el hash completo al volver a cargar el PDF.
+    "file_size": "INTEGER",
+    "file_mtime_ns": "INTEGER",
+    "file_inode": "INTEGER",
+    # 1 mientras se publican sus hojas (indexacion progresiva).
+    "indexing": "INTEGER NOT NULL DEFAULT 0 CHECK(indexing IN (0, 1))",
+    # Sube cada vez que se reemplazan sus hojas (reindexado).
+    "generation": "INTEGER NOT NULL DEFAULT 0",
+}
+
+
+def _ensure_pdf_files_schema(cur):
+    cur.execute("PRAGMA table_info(pdf_files)")
+    columns = {row[1] for row in cur.fetchall()}
+    for column, definition in _PDF_FILES_COLUMNS.items():
+        if column not in columns:
+            cur.execute(f"ALTER TABLE pdf_files ADD COLUMN {column} {definition}")
+
+
+def _ensure_page_state_schema(cur):
+    # seq: numero de cambio (meta.page_state_seq) del ultimo escaneo o
+    # reinicio de la hoja; el indice de escaneo lee solo los posteriores.
+    cur.execute("PRAGMA table_info(page_state)")
+    if "seq" not in {row[1] for row in cur.fetchall()}:
+        cur.execute("ALTER TABLE page_state ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_page_state_seq ON page_state(seq)")
+
+
 def _ensure_duplicates_schema(cur):
     cur.execute(
         """
@@ -127,12 +338,70 @@ def _ensure_duplicates_schema(cur):
     )
 
 
+def _ensure_pdf_stats_schema(cur):
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='pdf_stats'")
+    if cur.fetchone() is not None:
+        return
+    cur.execute(
+        """
+        CREATE TABLE pdf_stats (
+            pdf_id INTEGER PRIMARY KEY,
+            codes INTEGER NOT NULL DEFAULT 0,
+            pages INTEGER NOT NULL DEFAULT 0,
+            scanned_pages INTEGER NOT NULL DEFAULT 0,
+            duplicates_same_pdf INTEGER NOT NULL DEFAULT 0,
+            duplicates_cross_pdf INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (pdf_id) REFERENCES pdf_files(id)
+        )
+        """
+    )
+    # Existing databases: backfill counters from the current rows.
+    refresh_pdf_stats(cur)
+
+
+def _schema_version(cur):
+    cur.execute("PRAGMA user_version")
+    return cur.fetchall()[0][0]
+
+
+def check_db(quick=False):
+    """Run SQLite's integrity check and the foreign key check.
+
+    Returns the problems found (empty when the database is healthy). Reads
+    every page of the file, so it is a maintenance command and not part of
+    startup; quick=True uses quick_check, which skips index contents.
+    """
+    with read_connection() as conn:
+        rows = conn.execute("PRAGMA quick_check" if quick else "PRAGMA integrity_check")
+        problems = [row[0] for row in rows if row[0] != "ok"]
+        for table, rowid, parent, _fk_id in conn.execute("PRAGMA foreign_key_check"):
+            problems.append(f"{table} fila {rowid}: referencia invalida a {parent}")
+    return problems
+
+
 def init_db(reset=False):
-    conn = get_connection()
-    try:
+    """Create or migrate the schema.
+
+    A database already at SCHEMA_VERSION (PRAGMA user_version) is left
+    untouched, so startup costs one header read; otherwise the migrations
+    below run once and record the version.
+    """
+    with connection() as conn:
         cur = conn.cursor()
+        if not reset and _schema_version(cur) >= SCHEMA_VERSION:
+            return
+        if not conn.in_transaction:
+            cur.execute("BEGIN IMMEDIATE")
+            # Otro proceso pudo migrar mientras se esperaba el lock.
+            if not reset and _schema_version(cur) >= SCHEMA_VERSION:
+                return
 
         if reset:
+            cur.execute("DROP TABLE IF EXISTS pdf_stats")
+            cur.execute("DROP TABLE IF EXISTS page_cache")
+            # Bases anteriores al esquema 4: su FK impide borrar pdf_files.
+            cur.execute("DROP TABLE IF EXISTS page_bitmaps")
+            cur.execute("DROP TABLE IF EXISTS page_state")
             cur.execute("DROP TABLE IF EXISTS code_duplicates")
             cur.execute("DROP TABLE IF EXISTS pages")
             cur.execute("DROP TABLE IF EXISTS pdf_files")
@@ -146,11 +415,21 @@ def init_db(reset=False):
                 file_name TEXT NOT NULL CHECK(length(trim(file_name)) > 0),
                 file_path TEXT UNIQUE NOT NULL,
                 signature TEXT NOT NULL CHECK(length(trim(signature)) > 0),
-                loaded_at TEXT DEFAULT (datetime('now'))
+                loaded_at TEXT DEFAULT (datetime('now')),
+                file_size INTEGER,
+                file_mtime_ns INTEGER,
+                file_inode INTEGER,
+                indexing INTEGER NOT NULL DEFAULT 0 CHECK(indexing IN (0, 1)),
+                generation INTEGER NOT NULL DEFAULT 0
             )
             """
         )
+        _ensure_pdf_files_schema(cur)
+        cur.execute(
+            "CREATE INDEX IF NOT EXISTS idx_pdf_files_name ON pdf_files(file_name, id)"
+        )
         _ensure_pages_schema(cur)
+        _ensure_page_state_schema(cur)
         cur.execute(
             "CREATE INDEX IF NOT EXISTS idx_pages_code ON pages(code)"
         )
@@ -169,12 +448,34 @@ def init_db(reset=False):
             "CREATE INDEX IF NOT EXISTS idx_dup_existing_loc "
             "ON code_duplicates(existing_pdf_id, existing_page_number)"
         )
+        # Los mapas de bits se arman en memoria desde page_state al cargar
+        # el indice; la tabla que los guardaba no se leia nunca.
+        cur.execute("DROP TABLE IF EXISTS page_bitmaps")
+        _ensure_pdf_stats_schema(cur)
+        cur.execute(
+            """
+            CREATE TABLE IF NOT EXISTS page_cache (
+                pdf_id INTEGER NOT NULL,
+                page_number INTEGER NOT NULL CHECK(page_number >= 1),
+                content_hash TEXT NOT NULL,
+                codes TEXT NOT NULL,
+                PRIMARY KEY (pdf_id, page_number),
+                FOREIGN KEY (pdf_id) REFERENCES pdf_files(id)
+            )
+            """
+        )
         cur.execute("""
         CREATE TABLE IF NOT EXISTS meta (
             key TEXT PRIMARY KEY,
             value TEXT
         )
         """)
+        # Identifica esta base: cambia con cada reset, cuando ids, generation
+        # y page_state_seq vuelven a empezar (ver ScanIndex.refresh).
+        cur.execute(
+            "INSERT OR IGNORE INTO meta (key, value) "
+            "VALUES ('database_id', lower(hex(randomblob(8))))"
+        )
         cur.execute("""
         CREATE TABLE IF NOT EXISTS events (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -185,12 +486,11 @@ def init_db(reset=False):
             details TEXT
         )
         """)
+        # Las migraciones reescriben tablas: se verifican una vez al migrar.
         cur.execute("PRAGMA foreign_key_check")
         broken_rows = cur.fetchall()
         if broken_rows:
             raise sqlite3.IntegrityError(
                 f"Integridad referencial invalida: {len(broken_rows)} fila(s)"
             )
-        conn.commit()
-    finally:
-        conn.close()
+        cur.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
@@ -0,0 +1,91 @@
+"""Write-behind buffer for rows of the events table."""
+
+import threading
+import time
+
+EVENT_MODES = ("sync", "buffered", "durable")
+DEFAULT_FLUSH_ROWS = 256
+DEFAULT_FLUSH_INTERVAL = 0.5
+
+INSERT_EVENT_SQL = (
+    "INSERT INTO events (ts, event_type, code, page_number, details) "
+    "VALUES (?, ?, ?, ?, ?)"
+)
+
+
+def event_timestamp():
+    # Mismo formato que datetime('now'): el evento conserva la hora del
+    # escaneo aunque se escriba despues.
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+
+
+class EventSink:
+    """Holds committed-but-unwritten events until a size or age threshold.
+
+    The owner writes the rows (take/restore) on its own connection; when
+    `on_due` is given a daemon thread calls it once the oldest row is
+    `flush_interval` seconds old.
+    """
+
+    def __init__(
+        self,
+        flush_rows=DEFAULT_FLUSH_ROWS,
+        flush_interval=DEFAULT_FLUSH_INTERVAL,
+        on_due=None,
+    ):
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._rows = []
+        self._oldest = None
+        self._stopped = threading.Event()
+        self._thread = None
+        if on_due is not None and flush_interval:
+            self._thread = threading.Thread(
+                target=self._run, args=(on_due,), name="control-events", daemon=True
+            )
+            self._thread.start()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._rows)
+
+    def add(self, rows):
+        """Queue rows; return True when the size threshold is reached."""
+        with self._lock:
+            if rows and not self._rows:
+                self._oldest = time.monotonic()
+            self._rows.extend(rows)
+            return len(self._rows) >= self.flush_rows
+
+    def due(self):
+        with self._lock:
+            if not self._rows:
+                return False
+            return (
+                len(self._rows) >= self.flush_rows
+                or time.monotonic() - self._oldest >= self.flush_interval
+            )
+
+    def take(self):
+        with self._lock:
+            rows, self._rows = self._rows, []
+            self._oldest = None
+            return rows
+
+    def restore(self, rows):
+        """Put back rows whose write failed, ahead of newer ones."""
+        with self._lock:
+            self._rows[:0] = rows
+            if self._rows:
+                self._oldest = time.monotonic()
+
+    def close(self):
+        # Sin join: el hilo puede estar esperando el lock de quien cierra.
+        self._stopped.set()
+
+    def _run(self, on_due):
+        tick = max(0.01, self.flush_interval / 2)
+        while not self._stopped.wait(tick):
+            if self.due():
+                on_due()
@@ -0,0 +1,112 @@
+"""Materialized per-PDF counters read by the dashboard and reports."""
+
+DUPLICATE_KINDS = ("cross_pdf", "same_pdf")
+
+
+def refresh_pdf_stats(cur, pdf_ids=None):
+    """Recompute pdf_stats rows from pages/page_state/code_duplicates.
+
+    With pdf_ids=None every PDF is recomputed; otherwise only those given
+    (each one reads just its own rows through the pdf_id indexes).
+    """
+    if pdf_ids is None:
+        cur.execute("DELETE FROM pdf_stats")
+        cur.execute("SELECT id FROM pdf_files")
+        pdf_ids = [row[0] for row in cur.fetchall()]
+
+    for pdf_id in sorted(set(pdf_ids)):
+        cur.execute(
+            """
+            SELECT
+                COUNT(*),
+                COUNT(DISTINCT p.page_number),
+                COUNT(DISTINCT CASE WHEN s.scanned = 1 THEN p.page_number END)
+            FROM pages p
+            LEFT JOIN page_state s
+                ON s.pdf_id = p.pdf_id AND s.page_number = p.page_number
+            WHERE p.pdf_id = ?
+            """,
+            (pdf_id,),
+        )
+        codes, pages, scanned_pages = cur.fetchone()
+        cur.execute(
+            """
+            SELECT
+                COALESCE(SUM(duplicate_kind = 'same_pdf'), 0),
+                COALESCE(SUM(duplicate_kind = 'cross_pdf'), 0)
+            FROM code_duplicates
+            WHERE new_pdf_id = ?
+            """,
+            (pdf_id,),
+        )
+        duplicates_same_pdf, duplicates_cross_pdf = cur.fetchone()
+        cur.execute(
+            """
+            INSERT OR REPLACE INTO pdf_stats (
+                pdf_id,
+                codes,
+                pages,
+                scanned_pages,
+                duplicates_same_pdf,
+                duplicates_cross_pdf
+            )
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (
+                pdf_id,
+                codes,
+                pages,
+                scanned_pages,
+                duplicates_same_pdf,
+                duplicates_cross_pdf,
+            ),
+        )
+
+
+def add_scanned_page(cur, pdf_id):
+    cur.execute(
+        "UPDATE pdf_stats SET scanned_pages = scanned_pages + 1 WHERE pdf_id = ?",
+        (pdf_id,),
+    )
+
+
+def reset_scanned_pages(cur):
+    cur.execute("UPDATE pdf_stats SET scanned_pages = 0")
+
+
+def load_totals(cur):
+    cur.execute(
+        """
+        SELECT
+            COUNT(f.id),
+            COALESCE(SUM(s.codes), 0),
+            COALESCE(SUM(s.pages), 0),
+            COALESCE(SUM(s.scanned_pages), 0),
+            COALESCE(SUM(s.duplicates_same_pdf), 0),
+            COALESCE(SUM(s.duplicates_cross_pdf), 0)
+        FROM pdf_files f
+        LEFT JOIN pdf_stats s ON s.pdf_id = f.id
+        """
+    )
+    (
+        total_pdfs,
+        total_codes,
+        total_pages,
+        scanned_pages,
+        duplicates_same_pdf,
+        duplicates_cross_pdf,
+    ) = cur.fetchone()
+    by_kind = {
+        "cross_pdf": duplicates_cross_pdf,
+        "same_pdf": duplicates_same_pdf,
+    }
+    return {
+        "total_pdfs": total_pdfs,
+        "total_codes": total_codes,
+        "total_pages": total_pages,
+        "scanned_pages": scanned_pages,
+        "total_duplicates": duplicates_same_pdf + duplicates_cross_pdf,
+        "duplicate_counts": {
+            kind: by_kind[kind] for kind in DUPLICATE_KINDS if by_kind[kind]
+        },
+    }
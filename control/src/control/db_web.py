@@ -1,23 +1,58 @@
+import argparse
+import base64
+import binascii
+import gzip
+import hashlib
 import html
 import json
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timezone
+from email.utils import formatdate, parsedate_to_datetime
 from http.server import BaseHTTPRequestHandler, HTTPServer
 from pathlib import Path
 from urllib.parse import quote
 from urllib.parse import parse_qs, urlparse
 
-from control.config import DB_PATH, ensure_dirs
-from control.reporting import render_audit_csv_text
+from control.database.db import DataVersion, read_connection
+from control.database.stats import load_totals
+from control.reporting import iter_audit_csv_chunks
+from control.service import JudgeClient, JudgeServiceError, content_length
 
 WEB_DIR = Path(__file__).resolve().parent / "web"
 INDEX_HTML = WEB_DIR / "index.html"
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+RECENT_EVENTS_LIMIT = 80
+CHANGE_FEED_LIMIT = 500
+CHANGE_FEED_MAX_WAIT = 60.0
+# Segundos que espera el cliente antes de reintentar cuando no hay hilos libres.
+CHANGE_FEED_RETRY_AFTER = 5
+# Eventos que cambian muchas hojas a la vez: el cliente recarga el dashboard.
+RELOAD_EVENT_TYPES = frozenset({"reset_scans", "extract_summary", "extract_discarded"})
+PAGE_STATUSES = ("pendiente", "escaneada", "duplicado")
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+MAX_SCAN_BODY_BYTES = 64 * 1024
+RESPONSE_CACHE_ENTRIES = 256
+GZIP_MIN_BYTES = 1024
+_STATUS_CONDITIONS = {
+    "pendiente": "duplicate_count = 0 AND scanned = 0",
+    "escaneada": "duplicate_count = 0 AND scanned = 1",
+    "duplicado": "duplicate_count > 0",
+}
 
 
-def _connect():
-    ensure_dirs()
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+@contextmanager
+def _cursor():
+    with read_connection() as conn:
+        cur = conn.cursor()
+        cur.row_factory = sqlite3.Row
+        yield cur
 
 
 def _read_frontend():
@@ -42,35 +77,55 @@ def _extract_file_name(details_text):
     return details.get("file_name")
 
 
-def _dashboard_payload():
-    with _connect() as conn:
-        cur = conn.cursor()
+def _summary_payload(totals):
+    return {
+        "total_pdfs": totals["total_pdfs"],
+        "total_codes": totals["total_codes"],
+        "total_pages": totals["total_pages"],
+        "scanned_pages": totals["scanned_pages"],
+        "pending_pages": max(0, totals["total_pages"] - totals["scanned_pages"]),
+        "total_duplicates": totals["total_duplicates"],
+        "duplicate_counts": totals["duplicate_counts"],
+    }
 
-        cur.execute("SELECT COUNT(*) FROM pdf_files")
-        total_pdfs = cur.fetchone()[0]
 
-        cur.execute("SELECT COUNT(*) FROM pages")
-        total_codes = cur.fetchone()[0]
+def _page_entry(row, dup_total):
+    return {
+        "pdf_id": row["pdf_id"],
+        "file_name": row["file_name"],
+        "page_number": row["page_number"],
+        "codes": row["codes"],
+        "scanned": bool(row["scanned"]),
+        "duplicate_count": dup_total,
+        "status": "duplicado"
+        if dup_total
+        else ("escaneada" if row["scanned"] else "pendiente"),
+    }
 
-        cur.execute("SELECT COUNT(DISTINCT pdf_id || ':' || page_number) FROM pages")
-        total_pages = cur.fetchone()[0]
 
-        cur.execute(
-            "SELECT COUNT(DISTINCT pdf_id || ':' || page_number) FROM pages WHERE scanned = 1"
-        )
-        scanned_pages = cur.fetchone()[0]
+def _event_entry(row):
+    return {
+        "id": row["id"],
+        "ts": row["ts"],
+        "event_type": row["event_type"],
+        "code": row["code"],
+        "page_number": row["page_number"],
+        "file_name": _extract_file_name(row["details"]),
+        "details": row["details"],
+    }
 
-        cur.execute("SELECT COUNT(*) FROM code_duplicates")
-        total_duplicates = cur.fetchone()[0]
 
-        duplicate_count_rows = _safe_query(
-            cur,
-            "SELECT duplicate_kind, COUNT(*) AS total "
-            "FROM code_duplicates GROUP BY duplicate_kind ORDER BY duplicate_kind",
-        )
-        duplicate_counts = {
-            row["duplicate_kind"]: row["total"] for row in duplicate_count_rows
-        }
+def _last_event_id(cur):
+    rows = _safe_query(cur, "SELECT COALESCE(MAX(id), 0) AS last_id FROM events")
+    return rows[0]["last_id"] if rows else 0
+
+
+def _dashboard_payload(include_pages=True):
+    with _cursor() as cur:
+
+        # Se lee antes que el resto: lo que ocurra despues llega por /api/changes.
+        last_event_id = _last_event_id(cur)
+        totals = load_totals(cur)
 
         loaded_rows = _safe_query(
             cur,
@@ -79,64 +134,56 @@ def _dashboard_payload():
                 f.id,
                 f.file_name,
                 f.file_path,
-                COUNT(p.code) AS codes,
-                COUNT(DISTINCT p.page_number) AS pages
+                COALESCE(s.codes, 0) AS codes,
+                COALESCE(s.pages, 0) AS pages
             FROM pdf_files f
-            LEFT JOIN pages p ON p.pdf_id = f.id
-            GROUP BY f.id, f.file_name, f.file_path
+            LEFT JOIN pdf_stats s ON s.pdf_id = f.id
             ORDER BY f.loaded_at DESC, f.id DESC
             """,
         )
         loaded_pdfs = [dict(row) for row in loaded_rows]
 
-        duplicate_page_rows = _safe_query(
-            cur,
-            """
-            SELECT pdf_id, page_number, COUNT(*) AS total FROM (
-                SELECT new_pdf_id AS pdf_id, new_page_number AS page_number FROM code_duplicates
-                UNION ALL
-                SELECT existing_pdf_id AS pdf_id, existing_page_number AS page_number FROM code_duplicates
+        pages = None
+        if include_pages:
+            duplicate_page_rows = _safe_query(
+                cur,
+                """
+                SELECT pdf_id, page_number, COUNT(*) AS total FROM (
+                    SELECT new_pdf_id AS pdf_id, new_page_number AS page_number FROM code_duplicates
+                    UNION ALL
+                    SELECT existing_pdf_id AS pdf_id, existing_page_number AS page_number FROM code_duplicates
+                )
+                GROUP BY pdf_id, page_number
+                """,
             )
-            GROUP BY pdf_id, page_number
-            """,
-        )
-        duplicate_pages = {
-            (row["pdf_id"], row["page_number"]): row["total"]
-            for row in duplicate_page_rows
-        }
+            duplicate_pages = {
+                (row["pdf_id"], row["page_number"]): row["total"]
+                for row in duplicate_page_rows
+            }
 
-        page_rows = _safe_query(
-            cur,
-            """
-            SELECT
-                p.pdf_id,
-                f.file_name,
-                p.page_number,
-                MIN(p.scanned) AS scanned,
-                COUNT(*) AS codes
-            FROM pages p
-            JOIN pdf_files f ON f.id = p.pdf_id
-            GROUP BY p.pdf_id, f.file_name, p.page_number
-            ORDER BY f.file_name, p.page_number
-            """,
-        )
-        pages = []
-        for row in page_rows:
-            key = (row["pdf_id"], row["page_number"])
-            dup_total = duplicate_pages.get(key, 0)
-            pages.append(
-                {
-                    "pdf_id": row["pdf_id"],
-                    "file_name": row["file_name"],
-                    "page_number": row["page_number"],
-                    "codes": row["codes"],
-                    "scanned": bool(row["scanned"]),
-                    "duplicate_count": dup_total,
-                    "status": "duplicado"
-                    if dup_total
-                    else ("escaneada" if row["scanned"] else "pendiente"),
-                }
+            page_rows = _safe_query(
+                cur,
+                """
+                SELECT
+                    p.pdf_id,
+                    f.file_name,
+                    p.page_number,
+                    COALESCE(MAX(s.scanned), 0) AS scanned,
+                    COUNT(*) AS codes
+                FROM pages p
+                JOIN pdf_files f ON f.id = p.pdf_id
+                LEFT JOIN page_state s
+                    ON s.pdf_id = p.pdf_id AND s.page_number = p.page_number
+                GROUP BY p.pdf_id, f.file_name, p.page_number
+                ORDER BY f.file_name, p.page_number
+                """,
             )
+            pages = [
+                _page_entry(
+                    row, duplicate_pages.get((row["pdf_id"], row["page_number"]), 0)
+                )
+                for row in page_rows
+            ]
 
         extract_rows = _safe_query(
             cur,
@@ -153,37 +200,269 @@ def _dashboard_payload():
 
         event_rows = _safe_query(
             cur,
-            "SELECT ts, event_type, code, page_number, details "
-            "FROM events ORDER BY id DESC LIMIT 80",
+            "SELECT id, ts, event_type, code, page_number, details "
+            "FROM events WHERE id <= ? ORDER BY id DESC LIMIT ?",
+            (last_event_id, RECENT_EVENTS_LIMIT),
         )
-        recent_events = []
-        for row in event_rows:
-            recent_events.append(
-                {
-                    "ts": row["ts"],
-                    "event_type": row["event_type"],
-                    "code": row["code"],
-                    "page_number": row["page_number"],
-                    "file_name": _extract_file_name(row["details"]),
-                    "details": row["details"],
-                }
-            )
+        recent_events = [_event_entry(row) for row in event_rows]
 
-    return {
-        "summary": {
-            "total_pdfs": total_pdfs,
-            "total_codes": total_codes,
-            "total_pages": total_pages,
-            "scanned_pages": scanned_pages,
-            "pending_pages": max(0, total_pages - scanned_pages),
-            "total_duplicates": total_duplicates,
-            "duplicate_counts": duplicate_counts,
-        },
+    payload = {
+        "last_event_id": last_event_id,
+        "scan_enabled": JUDGE_CLIENT is not None,
+        "summary": _summary_payload(totals),
         "loaded_pdfs": loaded_pdfs,
-        "pages": pages,
         "latest_extract": latest_extract,
         "recent_events": recent_events,
     }
+    if pages is not None:
+        payload["pages"] = pages
+    return payload
+
+
+def _pdf_page_rows(cur, pdf_id, after_page=0, last_page=None, status=None, limit=None):
+    """Grid rows of one PDF with page_number > after_page, in page order.
+
+    Reads pages through idx_pages_pdf_page and counts duplicates through
+    idx_dup_new_loc/idx_dup_existing_loc, so the cost depends on the rows
+    returned and not on the size of the tables.
+    """
+    conditions = ["p.pdf_id = ?", "p.page_number > ?"]
+    params = [pdf_id, after_page]
+    if last_page is not None:
+        conditions.append("p.page_number <= ?")
+        params.append(last_page)
+    sql = f"""
+        SELECT
+            p.pdf_id,
+            p.page_number,
+            COALESCE(MAX(s.scanned), 0) AS scanned,
+            COUNT(*) AS codes,
+            (
+                SELECT COUNT(*) FROM code_duplicates
+                WHERE new_pdf_id = p.pdf_id AND new_page_number = p.page_number
+            ) + (
+                SELECT COUNT(*) FROM code_duplicates
+                WHERE existing_pdf_id = p.pdf_id AND existing_page_number = p.page_number
+            ) AS duplicate_count
+        FROM pages p
+        LEFT JOIN page_state s
+            ON s.pdf_id = p.pdf_id AND s.page_number = p.page_number
+        WHERE {" AND ".join(conditions)}
+        GROUP BY p.pdf_id, p.page_number
+    """
+    if status is not None:
+        sql += f" HAVING {_STATUS_CONDITIONS[status]}"
+    sql += " ORDER BY p.pdf_id, p.page_number"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    return _safe_query(cur, sql, params)
+
+
+def _page_entry_for(row, file_name):
+    return _page_entry({**dict(row), "file_name": file_name}, row["duplicate_count"])
+
+
+def _changed_page_entries(cur, page_keys):
+    pages = []
+    file_names = {}
+    for pdf_id, page_number in sorted(page_keys):
+        if pdf_id not in file_names:
+            rows = _safe_query(cur, "SELECT file_name FROM pdf_files WHERE id = ?", (pdf_id,))
+            file_names[pdf_id] = rows[0]["file_name"] if rows else None
+        if file_names[pdf_id] is None:
+            continue
+        rows = _pdf_page_rows(cur, pdf_id, page_number - 1, page_number)
+        if rows:
+            pages.append(_page_entry_for(rows[0], file_names[pdf_id]))
+    return pages
+
+
+def encode_page_cursor(file_name, pdf_id, page_number):
+    raw = json.dumps([file_name, pdf_id, page_number], ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_page_cursor(token):
+    """Return (file_name, pdf_id, page_number) or raise ValueError."""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        file_name, pdf_id, page_number = json.loads(
+            base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        )
+    except (binascii.Error, UnicodeError, ValueError, TypeError) as exc:
+        raise ValueError("Cursor invalido") from exc
+    if not isinstance(file_name, str) or not all(
+        isinstance(value, int) for value in (pdf_id, page_number)
+    ):
+        raise ValueError("Cursor invalido")
+    return file_name, pdf_id, page_number
+
+
+def _pages_payload(
+    pdf_id=None,
+    status=None,
+    from_page=None,
+    to_page=None,
+    limit=DEFAULT_PAGE_SIZE,
+    after=None,
+):
+    """One page of the grid ordered by (file_name, pdf_id, page_number).
+
+    `after` is the next_cursor of the previous response (keyset pagination:
+    each request starts from an index seek instead of an OFFSET).
+    """
+    if status is not None and status not in PAGE_STATUSES:
+        raise ValueError("Estado invalido")
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    position = decode_page_cursor(after) if after else None
+    first_after = max(0, (from_page or 1) - 1)
+
+    with _cursor() as cur:
+        pdf_cur = cur.connection.cursor()
+        pdf_cur.row_factory = sqlite3.Row
+        conditions = []
+        params = []
+        if pdf_id is not None:
+            conditions.append("id = ?")
+            params.append(pdf_id)
+        if position is not None:
+            conditions.append("(file_name, id) >= (?, ?)")
+            params.extend(position[:2])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        pdf_cur.execute(
+            f"SELECT id, file_name FROM pdf_files {where} ORDER BY file_name, id",
+            params,
+        )
+
+        pages = []
+        for pdf in pdf_cur:
+            after_page = first_after
+            if position is not None and (pdf["file_name"], pdf["id"]) == position[:2]:
+                after_page = max(after_page, position[2])
+            rows = _pdf_page_rows(
+                cur,
+                pdf["id"],
+                after_page,
+                to_page,
+                status,
+                limit + 1 - len(pages),
+            )
+            pages.extend(_page_entry_for(row, pdf["file_name"]) for row in rows)
+            if len(pages) > limit:
+                break
+
+    next_cursor = None
+    if len(pages) > limit:
+        del pages[limit:]
+        last = pages[-1]
+        next_cursor = encode_page_cursor(
+            last["file_name"], last["pdf_id"], last["page_number"]
+        )
+    return {"pages": pages, "next_cursor": next_cursor, "limit": limit}
+
+
+def _changes_payload(since):
+    """Pages and events that changed after event id `since`.
+
+    `reload` asks the client to fetch /api/dashboard again: the database was
+    reset, too many events piled up, or an event touched many pages at once.
+    """
+    with _cursor() as cur:
+        event_rows = _safe_query(
+            cur,
+            "SELECT id, ts, event_type, code, page_number, details "
+            "FROM events WHERE id > ? ORDER BY id LIMIT ?",
+            (since, CHANGE_FEED_LIMIT + 1),
+        )
+        if not event_rows:
+            last_event_id = _last_event_id(cur)
+            if last_event_id < since:
+                return {"last_event_id": last_event_id, "reload": True}
+            return {"last_event_id": since, "reload": False, "events": [], "pages": []}
+
+        if len(event_rows) > CHANGE_FEED_LIMIT or any(
+            row["event_type"] in RELOAD_EVENT_TYPES for row in event_rows
+        ):
+            return {"last_event_id": event_rows[-1]["id"], "reload": True}
+
+        page_keys = set()
+        for row in event_rows:
+            if row["event_type"] != "scan_ok" or not row["details"]:
+                continue
+            try:
+                pdf_id = json.loads(row["details"]).get("pdf_id")
+            except Exception:
+                continue
+            if pdf_id is not None:
+                page_keys.add((pdf_id, row["page_number"]))
+
+        pages = _changed_page_entries(cur, page_keys)
+        totals = load_totals(cur)
+
+    return {
+        "last_event_id": event_rows[-1]["id"],
+        "reload": False,
+        "summary": _summary_payload(totals),
+        "pages": pages,
+        "events": [_event_entry(row) for row in reversed(event_rows)],
+    }
+
+
+class EventWatcher:
+    """Polls MAX(events.id) from one thread and wakes long-poll requests.
+
+    However many browsers are waiting, the database sees a single cheap
+    query per interval.
+    """
+
+    def __init__(self, interval=0.2):
+        self.interval = interval
+        self._condition = threading.Condition()
+        self._last_id = None
+        self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                with _cursor() as cur:
+                    last_id = _last_event_id(cur)
+            except sqlite3.Error:
+                last_id = None
+            with self._condition:
+                if last_id != self._last_id:
+                    self._last_id = last_id
+                    self._condition.notify_all()
+            time.sleep(self.interval)
+
+    def _start(self):
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="control-web-events", daemon=True
+                )
+                self._thread.start()
+
+    def wait(self, since, timeout, cancel=None):
+        """Block until the last event id differs from `since`, `cancel` is
+        set or timeout."""
+        self._start()
+        with self._condition:
+            self._condition.wait_for(
+                lambda: (cancel is not None and cancel.is_set())
+                or (self._last_id is not None and self._last_id != since),
+                timeout,
+            )
+
+    def wake(self):
+        """Make every waiter re-check its condition (after setting `cancel`)."""
+        with self._condition:
+            self._condition.notify_all()
+
+
+EVENT_WATCHER = EventWatcher()
+# Cliente del servicio de escaneo (control serve); None deshabilita /api/scan.
+JUDGE_CLIENT = None
 
 
 def _lookup_code_payload(code):
@@ -191,14 +470,15 @@ def _lookup_code_payload(code):
     if not normalized:
         return {"status": "empty", "code": ""}
 
-    with _connect() as conn:
-        cur = conn.cursor()
+    with _cursor() as cur:
         rows = _safe_query(
             cur,
             """
-            SELECT p.pdf_id, p.page_number, p.scanned, f.file_name
+            SELECT p.pdf_id, p.page_number, COALESCE(s.scanned, 0) AS scanned, f.file_name
             FROM pages p
             JOIN pdf_files f ON f.id = p.pdf_id
+            LEFT JOIN page_state s
+                ON s.pdf_id = p.pdf_id AND s.page_number = p.page_number
             WHERE p.code = ?
             ORDER BY f.file_name, p.page_number
             """,
@@ -224,12 +504,12 @@ def _lookup_code_payload(code):
     }
 
 
-def _pdf_file_response(pdf_id):
-    with _connect() as conn:
-        cur = conn.cursor()
+def _pdf_file_response(pdf_id, inline=False):
+    with _cursor() as cur:
         rows = _safe_query(
             cur,
-            "SELECT file_name, file_path FROM pdf_files WHERE id = ?",
+            "SELECT file_name, file_path, signature, file_size, file_mtime_ns "
+            "FROM pdf_files WHERE id = ?",
             (pdf_id,),
         )
     if not rows:
@@ -246,19 +526,219 @@ def _pdf_file_response(pdf_id):
         }
 
     filename = row["file_name"] or path.name
+    disposition = "inline" if inline else "attachment"
+    stat = path.stat()
+    if (row["file_size"], row["file_mtime_ns"]) == (stat.st_size, stat.st_mtime_ns):
+        etag = f'"{row["signature"]}"'
+    else:
+        # El archivo cambio y aun no se reindexa: la firma guardada es de
+        # otros bytes, asi que el validador sale del archivo actual.
+        etag = f'"{stat.st_size}-{stat.st_mtime_ns}"'
     return {
         "status": 200,
-        "content": path.read_bytes(),
+        "path": path,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
         "content_type": "application/pdf",
         "headers": {
-            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"
+            "Content-Disposition": f"{disposition}; filename*=UTF-8''{quote(filename)}",
+            "ETag": etag,
+            "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+            "Accept-Ranges": "bytes",
         },
     }
 
 
+class CachedBody:
+    """Serialized JSON body with its ETags; the gzip copy is built on demand.
+
+    The gzip copy is another representation, so it has its own strong ETag.
+    """
+
+    __slots__ = ("version", "etag", "gzip_etag", "body", "_gzipped")
+
+    def __init__(self, version, body):
+        self.version = version
+        self.body = body
+        self.etag = '"' + hashlib.sha1(body).hexdigest()[:20] + '"'
+        self.gzip_etag = self.etag[:-1] + '-gz"'
+        self._gzipped = None
+
+    def gzipped(self):
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+
+class ResponseCache:
+    """JSON bodies keyed by request, valid while the database version holds.
+
+    Any commit to the database moves the version, so a cached body is never
+    served after the data behind it changed.
+    """
+
+    def __init__(self, version_source, max_entries=RESPONSE_CACHE_ENTRIES):
+        self._version_source = version_source
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        # La version se lee antes de construir: si alguien escribe en medio,
+        # la entrada queda vieja y se reconstruye en la siguiente solicitud.
+        version = self._version_source.current()
+        if version is not None:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.version == version:
+                    self._entries.move_to_end(key)
+                    return entry
+
+        body = json.dumps(build(), ensure_ascii=False).encode("utf-8")
+        entry = CachedBody(version, body)
+        if version is not None:
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self._max_entries:
+                    self._entries.popitem(last=False)
+        return entry
+
+
+RESPONSE_CACHE = ResponseCache(DataVersion())
+
+
+def _pages_arguments(params):
+    arguments = {}
+    for name, key in (
+        ("pdf_id", "pdf_id"),
+        ("from_page", "from"),
+        ("to_page", "to"),
+        ("limit", "limit"),
+    ):
+        value = params.get(key, [""])[0]
+        if not value:
+            continue
+        if not value.isdigit():
+            raise ValueError(f"Parametro {key} invalido")
+        arguments[name] = int(value)
+    status = params.get("status", [""])[0]
+    if status:
+        arguments["status"] = status
+    after = params.get("after", [""])[0]
+    if after:
+        arguments["after"] = after
+    return arguments
+
+
+def _accepts_gzip(header):
+    for item in (header or "").split(","):
+        coding, _, params = item.partition(";")
+        if coding.strip().lower() not in ("gzip", "*"):
+            continue
+        quality = params.replace(" ", "").lower()
+        if not quality.startswith("q="):
+            return True
+        try:
+            return float(quality[2:]) > 0
+        except ValueError:
+            return False
+    return False
+
+
+def _parse_range(header, size):
+    """Return (start, end) inclusive for a single bytes range, None for the
+    whole file, or False when the range cannot be satisfied."""
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if match is None:
+        # Rangos multiples o unidades desconocidas: se envia el archivo completo.
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        length = int(last)
+        if length == 0:
+            return False
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _not_modified_since(header, mtime):
+    """True when an If-Modified-Since date is not older than mtime."""
+    if not header:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # Last-Modified se envia en segundos enteros.
+    return int(mtime) <= since.timestamp()
+
+
+def _same_origin(origin, host):
+    """True when there is no Origin header or it names this server's Host."""
+    if origin is None:
+        return True
+    return bool(host) and urlparse(origin).netloc.lower() == host.strip().lower()
+
+
 class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        length = content_length(self.headers)
+        if length is None:
+            self.close_connection = True
+            self._send_json({"error": "Content-Length invalido"}, status=400)
+            return
+        if parsed.path != "/api/scan" or length > MAX_SCAN_BODY_BYTES:
+            self.close_connection = True
+            self._send_json({"error": "Solicitud no soportada"}, status=404)
+            return
+        # Sin autenticacion: se rechazan los POST de otros sitios. Un
+        # formulario ajeno no puede enviar application/json sin preflight.
+        if not _same_origin(self.headers.get("Origin"), self.headers.get("Host")):
+            self.close_connection = True
+            self._send_json({"error": "Origen no permitido"}, status=403)
+            return
+        content_type = self.headers.get("Content-Type", "")
+        if content_type.split(";")[0].strip().lower() != "application/json":
+            self.close_connection = True
+            self._send_json({"error": "Se esperaba Content-Type application/json"}, status=415)
+            return
+        body = self.rfile.read(length) if length else b""
+        if JUDGE_CLIENT is None:
+            self._send_json(
+                {"error": "Escaneo web deshabilitado: inicia control-db con --judge-url"},
+                status=503,
+            )
+            return
+        try:
+            payload = json.loads(body or b"{}")
+            code = str(payload["code"]).strip()
+            mode = payload.get("mode", "verificacion")
+        except (KeyError, TypeError, ValueError):
+            self._send_json({"error": "Solicitud invalida"}, status=400)
+            return
+        if not code:
+            self._send_json({"error": "Codigo vacio"}, status=400)
+            return
+        try:
+            result = JUDGE_CLIENT.process_scan(code, mode=mode)
+        except JudgeServiceError as exc:
+            self._send_json({"error": str(exc)}, status=502)
+            return
+        self._send_json(result)
+
     def do_GET(self):
-        ensure_dirs()
         parsed = urlparse(self.path)
 
         if parsed.path == "/":
@@ -269,13 +749,55 @@ class Handler(BaseHTTPRequestHandler):
             return
 
         if parsed.path == "/api/dashboard":
-            self._send_json(_dashboard_payload())
+            params = parse_qs(parsed.query)
+            include_pages = params.get("pages", ["1"])[0] != "0"
+            self._send_cached_json(
+                lambda: _dashboard_payload(include_pages=include_pages)
+            )
+            return
+
+        if parsed.path == "/api/pages":
+            params = parse_qs(parsed.query)
+            try:
+                arguments = _pages_arguments(params)
+                self._send_cached_json(lambda: _pages_payload(**arguments))
+            except ValueError as exc:
+                self._send_json({"error": str(exc)}, status=400)
+            return
+
+        if parsed.path == "/api/changes":
+            params = parse_qs(parsed.query)
+            since = params.get("since", [""])[0]
+            if not since.isdigit():
+                self._send_json({"error": "Parametro since invalido"}, status=400)
+                return
+            try:
+                wait = float(params.get("wait", ["0"])[0])
+            except ValueError:
+                wait = 0.0
+            if wait > 0:
+                if not self.server.acquire_waiter():
+                    # Ya hay muchos long-polls ocupando hilos: el cliente
+                    # reintenta mas tarde con una consulta corta.
+                    self.send_response(204)
+                    self.send_header("Retry-After", str(CHANGE_FEED_RETRY_AFTER))
+                    self.end_headers()
+                    return
+                try:
+                    EVENT_WATCHER.wait(
+                        int(since),
+                        min(wait, CHANGE_FEED_MAX_WAIT),
+                        cancel=self.server.closing,
+                    )
+                finally:
+                    self.server.release_waiter()
+            self._send_json(_changes_payload(int(since)))
             return
 
         if parsed.path == "/api/code":
             params = parse_qs(parsed.query)
             code = params.get("value", [""])[0]
-            self._send_json(_lookup_code_payload(code))
+            self._send_cached_json(lambda: _lookup_code_payload(code))
             return
 
         if parsed.path == "/pdf-file":
@@ -284,25 +806,28 @@ class Handler(BaseHTTPRequestHandler):
             if not str(pdf_id).isdigit():
                 self._send_text("PDF invalido", status=400, content_type="text/plain; charset=utf-8")
                 return
-            response = _pdf_file_response(int(pdf_id))
+            inline = params.get("inline", [""])[0] == "1"
+            response = _pdf_file_response(int(pdf_id), inline=inline)
             if response is None:
                 self._send_text("PDF no encontrado", status=404, content_type="text/plain; charset=utf-8")
                 return
-            self._send_bytes(
-                response["content"],
-                response["content_type"],
-                status=response["status"],
-                headers=response["headers"],
-            )
+            if "path" not in response:
+                self._send_bytes(
+                    response["content"],
+                    response["content_type"],
+                    status=response["status"],
+                    headers=response["headers"],
+                )
+                return
+            self._send_file(response)
             return
 
         if parsed.path == "/report.csv":
-            csv_text = render_audit_csv_text()
             headers = {
                 "Content-Disposition": 'attachment; filename="auditoria.csv"'
             }
-            self._send_bytes(
-                csv_text.encode("utf-8"),
+            self._send_stream(
+                iter_audit_csv_chunks(),
                 "text/csv; charset=utf-8",
                 headers=headers,
             )
@@ -327,16 +852,21 @@ class Handler(BaseHTTPRequestHandler):
         self._send_text("<h2>404</h2>", status=404)
 
     def _page_detail(self, pdf_id, page_number):
-        with _connect() as conn:
-            cur = conn.cursor()
+        with _cursor() as cur:
             cur.execute("SELECT file_name FROM pdf_files WHERE id = ?", (pdf_id,))
             row = cur.fetchone()
             file_name = row["file_name"] if row else f"PDF {pdf_id}"
             cur.execute(
-                "SELECT code, scanned FROM pages WHERE pdf_id = ? AND page_number = ? ORDER BY code",
+                "SELECT code FROM pages WHERE pdf_id = ? AND page_number = ? ORDER BY code",
                 (pdf_id, page_number),
             )
             rows = cur.fetchall()
+            cur.execute(
+                "SELECT scanned FROM page_state WHERE pdf_id = ? AND page_number = ?",
+                (pdf_id, page_number),
+            )
+            state = cur.fetchone()
+            scanned = bool(state and state["scanned"])
 
         parts = [
             "<!doctype html><html lang='es'><head><meta charset='utf-8'>",
@@ -353,7 +883,7 @@ class Handler(BaseHTTPRequestHandler):
             parts.append(
                 "<tr>"
                 f"<td>{html.escape(row['code'])}</td>"
-                f"<td>{'Escaneado' if row['scanned'] else 'Pendiente'}</td>"
+                f"<td>{'Escaneado' if scanned else 'Pendiente'}</td>"
                 "</tr>"
             )
         parts.append("</tbody></table></body></html>")
@@ -366,6 +896,34 @@ class Handler(BaseHTTPRequestHandler):
             status=status,
         )
 
+    def _send_cached_json(self, build):
+        entry = RESPONSE_CACHE.get(self.path, build)
+        use_gzip = len(entry.body) >= GZIP_MIN_BYTES and _accepts_gzip(
+            self.headers.get("Accept-Encoding")
+        )
+        headers = {
+            "ETag": entry.gzip_etag if use_gzip else entry.etag,
+            "Cache-Control": "no-cache",
+            "Vary": "Accept-Encoding",
+        }
+        # Cualquiera de las dos codificaciones valida el mismo contenido.
+        if_none_match = {
+            tag.strip() for tag in (self.headers.get("If-None-Match") or "").split(",")
+        }
+        if if_none_match & {entry.etag, entry.gzip_etag, "*"}:
+            self.send_response(304)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            return
+
+        body = entry.body
+        if use_gzip:
+            body = entry.gzipped()
+            headers["Content-Encoding"] = "gzip"
+        headers["Content-Length"] = str(len(body))
+        self._send_bytes(body, "application/json; charset=utf-8", headers=headers)
+
     def _send_text(self, content, status=200, content_type="text/html; charset=utf-8"):
         self._send_bytes(content.encode("utf-8"), content_type, status=status)
 
@@ -378,11 +936,149 @@ class Handler(BaseHTTPRequestHandler):
         self.end_headers()
         self.wfile.write(content)
 
+    def _send_file(self, response):
+        headers = dict(response["headers"])
+        etag = headers["ETag"]
+        size = response["size"]
+
+        # If-None-Match manda sobre If-Modified-Since cuando vienen ambos.
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match is not None:
+            not_modified = if_none_match in (etag, "*")
+        else:
+            not_modified = _not_modified_since(
+                self.headers.get("If-Modified-Since"), response["mtime"]
+            )
+        if not_modified:
+            self.send_response(304)
+            for key in ("ETag", "Last-Modified", "Accept-Ranges"):
+                self.send_header(key, headers[key])
+            self.end_headers()
+            return
+
+        byte_range = None
+        if_range = self.headers.get("If-Range")
+        if if_range is None or if_range in (etag, headers["Last-Modified"]):
+            byte_range = _parse_range(self.headers.get("Range"), size)
+
+        if byte_range is False:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        status = 200
+        start, end = 0, size - 1
+        if byte_range is not None:
+            status = 206
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        length = max(0, end - start + 1)
+        headers["Content-Length"] = str(length)
+
+        self.send_response(status)
+        self.send_header("Content-Type", response["content_type"])
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+
+        with response["path"].open("rb") as handle:
+            try:
+                self.connection.sendfile(handle, offset=start, count=length)
+            except (BrokenPipeError, ConnectionResetError):
+                # El visor cancelo la descarga (habitual al saltar de pagina).
+                self.close_connection = True
+
+    def _send_stream(self, chunks, content_type, status=200, headers=None):
+        # Sin Content-Length: el cuerpo termina al cerrar la conexion.
+        self.close_connection = True
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Connection", "close")
+        if headers:
+            for key, value in headers.items():
+                self.send_header(key, value)
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(chunk)
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTPServer that handles requests on a bounded pool of threads.
+
+    Long-polls may hold at most `max_waiters` threads (half the pool by
+    default), so the rest keep serving regular requests; server_close()
+    answers the pending ones and waits for every thread to finish.
+    """
+
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, workers=16, max_waiters=None):
+        super().__init__(server_address, handler_class)
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="control-web"
+        )
+        if max_waiters is None:
+            max_waiters = workers // 2
+        self._waiters = threading.BoundedSemaphore(max_waiters) if max_waiters else None
+        # Al cerrar, los long-polls responden ya en vez de esperar su timeout.
+        self.closing = threading.Event()
+
+    def acquire_waiter(self):
+        """Reserve a thread for a long-poll; False when the cap is reached."""
+        return self._waiters is not None and self._waiters.acquire(blocking=False)
+
+    def release_waiter(self):
+        self._waiters.release()
+
+    def process_request(self, request, client_address):
+        self._executor.submit(self._process_request_thread, request, client_address)
+
+    def _process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        self.closing.set()
+        EVENT_WATCHER.wake()
+        super().server_close()
+        self._executor.shutdown(wait=True)
+
 
 def main():
-    server = HTTPServer(("127.0.0.1", 8000), Handler)
-    print("Servidor en http://127.0.0.1:8000")
-    server.serve_forever()
+    parser = argparse.ArgumentParser(prog="control-db")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=16,
+        help="Hilos que atienden solicitudes en paralelo",
+    )
+    parser.add_argument(
+        "--judge-url",
+        metavar="URL",
+        help="Servicio de escaneo (control serve) al que se envian los escaneos web",
+    )
+    args = parser.parse_args()
+
+    global JUDGE_CLIENT
+    if args.judge_url:
+        JUDGE_CLIENT = JudgeClient(args.judge_url)
+
+    server = PooledHTTPServer((args.host, args.port), Handler, workers=max(1, args.workers))
+    print(f"Servidor en http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
 
 
 if __name__ == "__main__":
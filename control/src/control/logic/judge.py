@@ -1,50 +1,179 @@
+import atexit
 import json
-
-from control.database.db import get_connection
+import sqlite3
+import threading
+
+from control.database.events import (
+    DEFAULT_FLUSH_INTERVAL,
+    DEFAULT_FLUSH_ROWS,
+    EVENT_MODES,
+    INSERT_EVENT_SQL,
+    EventSink,
+    event_timestamp,
+)
+from control.logic.scan_index import ScanIndex
 
 MAX_MISSING_PAGES = 10
 START_PAGE_BY_PDF = {}
 VALID_RESOLUTIONS = {"falso_duplicado", "hoja_descartada", "otro"}
+_SCAN_INDEX = None
+# Serializa los veredictos y el volcado de eventos sobre la conexion del indice.
+_JUDGE_LOCK = threading.RLock()
+_EVENT_MODE = "sync"
+_EVENT_SINK = None
+# Eventos de la unidad de trabajo en curso (modos buffered/durable).
+_PENDING_EVENTS = []
 
 
 def set_page_range(start_page=None):
-    START_PAGE_BY_PDF.clear()
-    if start_page is None or start_page == "":
-        return
-    # Kept for compatibility: applies to the first PDF scanned.
-    START_PAGE_BY_PDF["_default"] = max(1, int(start_page))
+    with _JUDGE_LOCK:
+        START_PAGE_BY_PDF.clear()
+        if start_page is None or start_page == "":
+            return
+        # Kept for compatibility: applies to the first PDF scanned.
+        START_PAGE_BY_PDF["_default"] = max(1, int(start_page))
 
 
 def reset_start_page():
-    START_PAGE_BY_PDF.clear()
+    with _JUDGE_LOCK:
+        START_PAGE_BY_PDF.clear()
 
 
 def get_start_page():
-    return dict(START_PAGE_BY_PDF)
+    with _JUDGE_LOCK:
+        return dict(START_PAGE_BY_PDF)
 
 
-def reset_scans():
-    conn = get_connection()
+def set_event_mode(
+    mode, flush_rows=DEFAULT_FLUSH_ROWS, flush_interval=DEFAULT_FLUSH_INTERVAL
+):
+    """Choose how scan events reach the events table.
+
+    sync: inside each scan's transaction (default).
+    durable: events are buffered and written in batches; each scan still
+        commits its scanned flag with a full fsync.
+    buffered: as durable, but scans commit with synchronous=NORMAL, so a
+        power loss may drop the last scans (an application crash does not).
+    Buffered events not yet written are lost if the process dies.
+    """
+    global _EVENT_MODE, _EVENT_SINK
+    if mode not in EVENT_MODES:
+        raise ValueError(f"Modo de eventos invalido: {mode}")
+    with _JUDGE_LOCK:
+        close_events()
+        _EVENT_MODE = mode
+        if mode != "sync":
+            _EVENT_SINK = EventSink(flush_rows, flush_interval, on_due=_flush_due_events)
+        if _SCAN_INDEX is not None:
+            _apply_synchronous(_SCAN_INDEX.conn)
+
+
+def flush_events():
+    """Write every buffered event now."""
+    with _JUDGE_LOCK:
+        sink = _EVENT_SINK
+        if sink is None or _SCAN_INDEX is None:
+            return
+        rows = sink.take()
+        if not rows:
+            return
+        conn = _SCAN_INDEX.conn
+        try:
+            conn.executemany(INSERT_EVENT_SQL, rows)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            sink.restore(rows)
+            raise
+
+
+def close_events():
+    """Flush and stop the event buffer (back to sync mode)."""
+    global _EVENT_MODE, _EVENT_SINK
+    with _JUDGE_LOCK:
+        sink = _EVENT_SINK
+        if sink is None:
+            return
+        sink.close()
+        flush_events()
+        _EVENT_SINK = None
+        _EVENT_MODE = "sync"
+
+
+def _flush_due_events():
     try:
-        cur = conn.cursor()
-        cur.execute("UPDATE pages SET scanned = 0")
-        _log_event(cur, "reset_scans")
-        conn.commit()
-        START_PAGE_BY_PDF.clear()
-    finally:
-        conn.close()
+        flush_events()
+    except sqlite3.Error:
+        # Base ocupada: se reintenta en el siguiente ciclo.
+        pass
+
+
+def _apply_synchronous(conn):
+    level = "NORMAL" if _EVENT_MODE == "buffered" else "FULL"
+    conn.execute(f"PRAGMA synchronous = {level}")
+
+
+def _scan_index():
+    global _SCAN_INDEX
+    if _SCAN_INDEX is None:
+        _SCAN_INDEX = ScanIndex()
+        _apply_synchronous(_SCAN_INDEX.conn)
+    _SCAN_INDEX.refresh()
+    return _SCAN_INDEX
+
+
+def load_index():
+    """Load the scan index now instead of on the first scan."""
+    with _JUDGE_LOCK:
+        _scan_index()
+
+
+def _publish_events():
+    if not _PENDING_EVENTS:
+        return
+    rows = list(_PENDING_EVENTS)
+    _PENDING_EVENTS.clear()
+    if _EVENT_SINK.add(rows):
+        try:
+            flush_events()
+        except sqlite3.Error:
+            pass
+
+
+def _rollback(conn, index):
+    _PENDING_EVENTS.clear()
+    conn.rollback()
+    index.invalidate()
+
+
+def reset_scans():
+    with _JUDGE_LOCK:
+        index = _scan_index()
+        conn = index.conn
+        try:
+            cur = conn.cursor()
+            index.reset_scans(cur)
+            _log_event(cur, "reset_scans")
+            conn.commit()
+            START_PAGE_BY_PDF.clear()
+        except Exception:
+            _rollback(conn, index)
+            raise
+        _publish_events()
 
 
 def _log_event(cur, event_type, code=None, page_number=None, details=None):
+    details_text = json.dumps(details) if details is not None else None
+    if _EVENT_SINK is not None:
+        # Se publica al sink solo si la transaccion del llamador confirma.
+        _PENDING_EVENTS.append(
+            (event_timestamp(), event_type, code, page_number, details_text)
+        )
+        return
     cur.execute(
         "INSERT INTO events (event_type, code, page_number, details) "
         "VALUES (?, ?, ?, ?)",
-        (
-            event_type,
-            code,
-            page_number,
-            json.dumps(details) if details is not None else None,
-        ),
+        (event_type, code, page_number, details_text),
     )
 
 
@@ -87,19 +216,24 @@ def classify_scan_error(
     if note:
         details["note"] = note
 
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
-        _log_event(
-            cur,
-            event_type,
-            code=code,
-            page_number=page_number,
-            details=details,
-        )
-        conn.commit()
-    finally:
-        conn.close()
+    with _JUDGE_LOCK:
+        # Por la conexion del indice: un commit de otra conexion lo haria
+        # refrescar en el proximo escaneo.
+        conn = _scan_index().conn
+        try:
+            _log_event(
+                conn.cursor(),
+                event_type,
+                code=code,
+                page_number=page_number,
+                details=details,
+            )
+            conn.commit()
+        except Exception:
+            _PENDING_EVENTS.clear()
+            conn.rollback()
+            raise
+        _publish_events()
 
 
 def _resolve_start_page(pdf_id, page_number):
@@ -112,166 +246,188 @@ def _resolve_start_page(pdf_id, page_number):
 
 
 def process_scan(scanned_code, mode="verificacion"):
-    conn = get_connection()
-    try:
-        cur = conn.cursor()
-        scanned_code = scanned_code.upper()
-
-        cur.execute(
-            """
-            SELECT p.pdf_id, p.page_number, p.scanned, f.file_name
-            FROM pages p
-            JOIN pdf_files f ON f.id = p.pdf_id
-            WHERE p.code = ?
-            ORDER BY f.file_name, p.page_number
-            """,
-            (scanned_code,),
-        )
-        rows = cur.fetchall()
-
-        if not rows:
-            _log_event(cur, "scan_error_not_found", code=scanned_code)
+    with _JUDGE_LOCK:
+        index = _scan_index()
+        conn = index.conn
+        try:
+            result = _judge_scan(index, conn.cursor(), scanned_code, mode)
             conn.commit()
-            return _result("ERROR", "Codigo no existe en PDFs cargados", code=scanned_code)
+        except Exception:
+            _rollback(conn, index)
+            raise
+        _publish_events()
+        return result
+
+
+def process_scans(codes, mode="verificacion"):
+    """Judge `codes` in order inside a single transaction.
+
+    Verdicts and events are the same as calling process_scan once per code;
+    if anything fails nothing is stored and the lot start pages are restored.
+    """
+    with _JUDGE_LOCK:
+        index = _scan_index()
+        conn = index.conn
+        start_pages = dict(START_PAGE_BY_PDF)
+        try:
+            cur = conn.cursor()
+            results = [_judge_scan(index, cur, code, mode) for code in codes]
+            conn.commit()
+        except Exception:
+            _rollback(conn, index)
+            START_PAGE_BY_PDF.clear()
+            START_PAGE_BY_PDF.update(start_pages)
+            raise
+        _publish_events()
+        return results
+
+
+def _judge_scan(index, cur, scanned_code, mode):
+    """Verdict for one code; writes through `cur` without committing."""
+    scanned_code = scanned_code.upper()
 
-        pdf_ids = {row[0] for row in rows}
-        if len(pdf_ids) > 1:
-            files = sorted({row[3] for row in rows})
+    rows = index.lookup(scanned_code)
+
+    if not rows:
+        indexing = index.indexing_files()
+        if indexing:
+            # Puede estar en una hoja que todavia no se publico.
             _log_event(
                 cur,
-                "scan_error_ambiguous_code",
+                "scan_error_still_indexing",
                 code=scanned_code,
-                details={"files": files},
+                details={"files": indexing},
             )
-            conn.commit()
             return _result(
                 "ERROR",
-                f"Codigo en multiples PDFs: {', '.join(files)}",
-                error_type="ambiguous_code",
+                f"Codigo aun no indexado, se esta indexando: {', '.join(indexing)}. "
+                "Vuelve a escanear en unos segundos",
+                error_type="still_indexing",
                 code=scanned_code,
             )
+        _log_event(cur, "scan_error_not_found", code=scanned_code)
+        return _result("ERROR", "Codigo no existe en PDFs cargados", code=scanned_code)
 
-        pdf_id, page_number, scanned, file_name = rows[0]
-
-        if scanned:
-            if mode == "verificacion":
-                _log_event(
-                    cur,
-                    "scan_error_already_scanned",
-                    code=scanned_code,
-                    page_number=page_number,
-                    details={"file_name": file_name, "pdf_id": pdf_id},
-                )
-                conn.commit()
-            return _result(
-                "ERROR",
-                f"Hoja {page_number} ya fue revisada ({file_name})",
-                error_type="already_scanned" if mode == "verificacion" else None,
-                code=scanned_code,
-                page_number=page_number,
-                file_name=file_name,
-                pdf_id=pdf_id,
-            )
+    pdf_ids = {row[0] for row in rows}
+    if len(pdf_ids) > 1:
+        files = sorted({row[3] for row in rows})
+        _log_event(
+            cur,
+            "scan_error_ambiguous_code",
+            code=scanned_code,
+            details={"files": files},
+        )
+        return _result(
+            "ERROR",
+            f"Codigo en multiples PDFs: {', '.join(files)}",
+            error_type="ambiguous_code",
+            code=scanned_code,
+        )
 
+    pdf_id, page_number, scanned, file_name = rows[0]
+
+    if scanned:
         if mode == "verificacion":
-            start_page = _resolve_start_page(pdf_id, page_number)
-            if page_number < start_page:
-                _log_event(
-                    cur,
-                    "scan_error_other_lot",
-                    code=scanned_code,
-                    page_number=page_number,
-                    details={
-                        "start_page": start_page,
-                        "file_name": file_name,
-                        "pdf_id": pdf_id,
-                    },
-                )
-                conn.commit()
-                return _result(
-                    "ERROR",
-                    f"Hoja {page_number} es de un lote anterior en {file_name} (inicio {start_page})",
-                    error_type="other_lot",
-                    code=scanned_code,
-                    page_number=page_number,
-                    file_name=file_name,
-                    pdf_id=pdf_id,
-                )
-        else:
-            # En secuencia no se usa inicio manual de lote; se valida
-            # contra el inicio real del PDF.
-            cur.execute(
-                "SELECT MIN(page_number) FROM pages WHERE pdf_id = ?",
-                (pdf_id,),
+            _log_event(
+                cur,
+                "scan_error_already_scanned",
+                code=scanned_code,
+                page_number=page_number,
+                details={"file_name": file_name, "pdf_id": pdf_id},
             )
-            row = cur.fetchone()
-            start_page = row[0] if row and row[0] is not None else page_number
-
-        cur.execute(
-            """
-            SELECT DISTINCT page_number
-            FROM pages
-            WHERE pdf_id = ? AND scanned = 0 AND page_number < ? AND page_number >= ?
-            ORDER BY page_number
-            """,
-            (pdf_id, page_number, start_page),
+        return _result(
+            "ERROR",
+            f"Hoja {page_number} ya fue revisada ({file_name})",
+            error_type="already_scanned" if mode == "verificacion" else None,
+            code=scanned_code,
+            page_number=page_number,
+            file_name=file_name,
+            pdf_id=pdf_id,
         )
-        missing_pages = [row[0] for row in cur.fetchall()]
 
-        if missing_pages:
-            shown = missing_pages[:MAX_MISSING_PAGES]
-            missing_str = ", ".join(str(p) for p in shown)
-            extra = len(missing_pages) - len(shown)
+    if mode == "verificacion":
+        start_page = _resolve_start_page(pdf_id, page_number)
+        if page_number < start_page:
             _log_event(
                 cur,
-                "scan_error_missing_pages",
+                "scan_error_other_lot",
                 code=scanned_code,
                 page_number=page_number,
                 details={
-                    "missing_pages": missing_pages,
+                    "start_page": start_page,
                     "file_name": file_name,
                     "pdf_id": pdf_id,
                 },
             )
-            conn.commit()
-            if extra > 0:
-                return _result(
-                    "ERROR",
-                    f"Faltan hojas anteriores en {file_name}: {missing_str} (+{extra} mas)",
-                    code=scanned_code,
-                    page_number=page_number,
-                    file_name=file_name,
-                    pdf_id=pdf_id,
-                )
             return _result(
                 "ERROR",
-                f"Faltan hojas anteriores en {file_name}: {missing_str}",
+                f"Hoja {page_number} es de un lote anterior en {file_name} (inicio {start_page})",
+                error_type="other_lot",
                 code=scanned_code,
                 page_number=page_number,
                 file_name=file_name,
                 pdf_id=pdf_id,
             )
+    else:
+        # En secuencia no se usa inicio manual de lote; se valida
+        # contra el inicio real del PDF.
+        first_page = index.first_page(pdf_id)
+        start_page = first_page if first_page is not None else page_number
 
-        cur.execute(
-            "UPDATE pages SET scanned = 1 WHERE pdf_id = ? AND page_number = ?",
-            (pdf_id, page_number),
-        )
+    shown, missing_total = index.missing_pages(
+        pdf_id, start_page, page_number, MAX_MISSING_PAGES
+    )
+
+    if missing_total:
+        missing_str = ", ".join(str(p) for p in shown)
+        extra = missing_total - len(shown)
         _log_event(
             cur,
-            "scan_ok",
+            "scan_error_missing_pages",
             code=scanned_code,
             page_number=page_number,
-            details={"file_name": file_name, "pdf_id": pdf_id},
+            details={
+                "missing_pages": shown,
+                "missing_total": missing_total,
+                "file_name": file_name,
+                "pdf_id": pdf_id,
+            },
         )
-        conn.commit()
-
+        if extra > 0:
+            return _result(
+                "ERROR",
+                f"Faltan hojas anteriores en {file_name}: {missing_str} (+{extra} mas)",
+                code=scanned_code,
+                page_number=page_number,
+                file_name=file_name,
+                pdf_id=pdf_id,
+            )
         return _result(
-            "OK",
-            f"Hoja {page_number} verificada correctamente ({file_name})",
+            "ERROR",
+            f"Faltan hojas anteriores en {file_name}: {missing_str}",
             code=scanned_code,
             page_number=page_number,
             file_name=file_name,
             pdf_id=pdf_id,
         )
-    finally:
-        conn.close()
+
+    index.mark_scanned(cur, pdf_id, page_number)
+    _log_event(
+        cur,
+        "scan_ok",
+        code=scanned_code,
+        page_number=page_number,
+        details={"file_name": file_name, "pdf_id": pdf_id},
+    )
+
+    return _result(
+        "OK",
+        f"Hoja {page_number} verificada correctamente ({file_name})",
+        code=scanned_code,
+        page_number=page_number,
+        file_name=file_name,
+        pdf_id=pdf_id,
+    )
+
+
+atexit.register(close_events)
@@ -0,0 +1,314 @@
+"""Resident scan index used by the judge."""
+
+from contextlib import contextmanager
+
+from control.database.db import get_connection
+from control.database.stats import add_scanned_page, reset_scanned_pages
+
+_PAGE_ROWS_SQL = """
+    SELECT p.pdf_id, p.page_number, p.code, COALESCE(s.scanned, 0)
+    FROM pages p
+    LEFT JOIN page_state s
+        ON s.pdf_id = p.pdf_id AND s.page_number = p.page_number
+"""
+
+
+def _current_seq(cur):
+    cur.execute("SELECT value FROM meta WHERE key = 'page_state_seq'")
+    row = cur.fetchone()
+    return int(row[0]) if row else 0
+
+
+def _database_id(cur):
+    cur.execute("SELECT value FROM meta WHERE key = 'database_id'")
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _next_seq(cur):
+    """Allocate the page_state change number of a write (inside its transaction)."""
+    cur.execute(
+        "INSERT INTO meta (key, value) VALUES ('page_state_seq', 1) "
+        "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+    )
+    return _current_seq(cur)
+
+
+class PageBitmap:
+    """Pages of one PDF as bitsets where bit n stands for page n."""
+
+    __slots__ = ("pages", "scanned")
+
+    def __init__(self, pages=0, scanned=0):
+        self.pages = pages
+        # Bit set when every code row of the page is scanned.
+        self.scanned = scanned
+
+    def __eq__(self, other):
+        if not isinstance(other, PageBitmap):
+            return NotImplemented
+        return (self.pages, self.scanned) == (other.pages, other.scanned)
+
+    def first_page(self):
+        if not self.pages:
+            return None
+        return (self.pages & -self.pages).bit_length() - 1
+
+    def mark_scanned(self, page_number):
+        self.scanned |= self.pages & (1 << page_number)
+
+    def mark_unscanned(self, page_number):
+        self.scanned &= ~(1 << page_number)
+
+    def reset(self):
+        self.scanned = 0
+
+    def missing(self, start_page, page_number, limit):
+        """Return (first `limit` pending pages, total pending) in [start, page)."""
+        if page_number <= start_page:
+            return [], 0
+        window = ((1 << page_number) - 1) ^ ((1 << start_page) - 1)
+        pending = self.pages & ~self.scanned & window
+        total = pending.bit_count()
+        shown = []
+        while pending and len(shown) < limit:
+            lowest = pending & -pending
+            shown.append(lowest.bit_length() - 1)
+            pending ^= lowest
+        return shown, total
+
+
+class ScanIndex:
+    """In-memory copy of pages/page_state/pdf_files that answers scan lookups.
+
+    The database stays the write-through store: every change made through
+    the index is written with its own long-lived connection. Commits made
+    by other connections bump PRAGMA data_version; refresh() then reads only
+    what changed: PDFs whose generation moved are reloaded, PDFs that were
+    indexing get the pages published since, and scans come from the
+    page_state rows with a newer seq. A reset database (new database_id, or
+    a seq that went back) is loaded again from scratch.
+    """
+
+    def __init__(self):
+        # Dedicated connection: data_version ignores this connection's own
+        # commits, so it cannot be the thread's pooled one. The judge's event
+        # flusher thread also writes through it, always under the judge lock.
+        self.conn = get_connection(check_same_thread=False)
+        self._data_version = None
+        # code -> [[pdf_id, page_number, scanned], ...] (one row per PDF)
+        self._codes = {}
+        # (pdf_id, page_number) -> rows of that page, shared with _codes
+        self._page_rows = {}
+        self._file_names = {}
+        # pdf_id -> (generation, indexing) as last read from pdf_files
+        self._files = {}
+        # pdf_id -> codes of the PDF, to drop them when it is re-indexed
+        self._pdf_codes = {}
+        # PDFs whose pages are still being published (progressive indexing)
+        self._indexing = []
+        # pdf_id -> PageBitmap, rebuilt from page_state on every load
+        self._bitmaps = {}
+        # Last page_state seq applied, and meta.database_id it belongs to.
+        self._seq = 0
+        self._database_id = None
+
+    def close(self):
+        self.conn.close()
+
+    def invalidate(self):
+        self._data_version = None
+
+    def refresh(self):
+        version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return
+        if self._data_version is None:
+            self._load()
+        else:
+            self._update()
+        self._data_version = version
+
+    @contextmanager
+    def _snapshot(self):
+        # Una sola transaccion de lectura: pdf_files, pages y page_state se
+        # leen consistentes aunque otro proceso este publicando hojas.
+        cur = self.conn.cursor()
+        cur.execute("BEGIN")
+        try:
+            yield cur
+        finally:
+            self.conn.commit()
+
+    def _load(self):
+        self._codes = {}
+        self._page_rows = {}
+        self._file_names = {}
+        self._files = {}
+        self._pdf_codes = {}
+        self._bitmaps = {}
+        with self._snapshot() as cur:
+            self._seq = _current_seq(cur)
+            self._database_id = _database_id(cur)
+            cur.execute("SELECT id, file_name, indexing, generation FROM pdf_files")
+            for pdf_id, file_name, indexing, generation in cur.fetchall():
+                self._file_names[pdf_id] = file_name
+                self._files[pdf_id] = (generation, indexing)
+            cur.execute(_PAGE_ROWS_SQL + " ORDER BY p.pdf_id, p.page_number")
+            self._add_rows(cur)
+        self._update_indexing()
+
+    def _update(self):
+        with self._snapshot() as cur:
+            seq = _current_seq(cur)
+            # Tras init_db(reset=True) los ids, generation y seq reinician:
+            # lo guardado no se puede comparar con la base nueva.
+            reset = _database_id(cur) != self._database_id or seq < self._seq
+            if not reset:
+                self._apply_changes(cur, seq)
+        if reset:
+            self._load()
+        else:
+            self._update_indexing()
+
+    def _apply_changes(self, cur, seq):
+        cur.execute("SELECT id, file_name, indexing, generation FROM pdf_files")
+        files = {row[0]: row[1:] for row in cur.fetchall()}
+        for pdf_id in [pdf_id for pdf_id in self._files if pdf_id not in files]:
+            self._drop_pdf(pdf_id)
+        for pdf_id, (file_name, indexing, generation) in files.items():
+            known = self._files.get(pdf_id)
+            if known is None or known[0] != generation:
+                # Nuevo o reindexado: se cargan todas sus hojas.
+                self._drop_pdf(pdf_id)
+                after = 0
+            elif known[1]:
+                # Se estaba indexando: las hojas se publican en orden.
+                bitmap = self._bitmaps.get(pdf_id)
+                after = bitmap.pages.bit_length() - 1 if bitmap else 0
+            else:
+                continue
+            self._file_names[pdf_id] = file_name
+            self._files[pdf_id] = (generation, indexing)
+            cur.execute(
+                _PAGE_ROWS_SQL
+                + " WHERE p.pdf_id = ? AND p.page_number > ? ORDER BY p.page_number",
+                (pdf_id, after),
+            )
+            self._add_rows(cur)
+        cur.execute(
+            "SELECT pdf_id, page_number, scanned FROM page_state WHERE seq > ?",
+            (self._seq,),
+        )
+        for pdf_id, page_number, scanned in cur:
+            self._set_scanned(pdf_id, page_number, scanned)
+        self._seq = seq
+
+    def _add_rows(self, rows):
+        for pdf_id, page_number, code, scanned in rows:
+            row = [pdf_id, page_number, scanned]
+            self._codes.setdefault(code, []).append(row)
+            self._pdf_codes.setdefault(pdf_id, []).append(code)
+            key = (pdf_id, page_number)
+            page_rows = self._page_rows.get(key)
+            bitmap = self._bitmaps.get(pdf_id)
+            if bitmap is None:
+                bitmap = self._bitmaps[pdf_id] = PageBitmap()
+            bit = 1 << page_number
+            if page_rows is None:
+                page_rows = self._page_rows[key] = []
+                bitmap.pages |= bit
+                bitmap.scanned |= bit
+            page_rows.append(row)
+            if not scanned:
+                bitmap.scanned &= ~bit
+
+    def _drop_pdf(self, pdf_id):
+        self._files.pop(pdf_id, None)
+        self._file_names.pop(pdf_id, None)
+        for code in self._pdf_codes.pop(pdf_id, ()):
+            rows = [row for row in self._codes[code] if row[0] != pdf_id]
+            if rows:
+                self._codes[code] = rows
+            else:
+                del self._codes[code]
+        bitmap = self._bitmaps.pop(pdf_id, None)
+        pages = bitmap.pages if bitmap else 0
+        while pages:
+            lowest = pages & -pages
+            del self._page_rows[(pdf_id, lowest.bit_length() - 1)]
+            pages ^= lowest
+
+    def _set_scanned(self, pdf_id, page_number, scanned):
+        rows = self._page_rows.get((pdf_id, page_number))
+        if not rows:
+            return
+        for row in rows:
+            row[2] = scanned
+        bitmap = self._bitmaps[pdf_id]
+        if scanned:
+            bitmap.mark_scanned(page_number)
+        else:
+            bitmap.mark_unscanned(page_number)
+
+    def _update_indexing(self):
+        self._indexing = sorted(
+            self._file_names[pdf_id]
+            for pdf_id, (_generation, indexing) in self._files.items()
+            if indexing
+        )
+
+    def lookup(self, code):
+        """Return [(pdf_id, page_number, scanned, file_name), ...] for code."""
+        return [
+            (pdf_id, page_number, scanned, self._file_names[pdf_id])
+            for pdf_id, page_number, scanned in self._codes.get(code, ())
+        ]
+
+    def indexing_files(self):
+        """Names of the PDFs still being indexed, whose codes may be missing."""
+        return list(self._indexing)
+
+    def first_page(self, pdf_id):
+        bitmap = self._bitmaps.get(pdf_id)
+        return bitmap.first_page() if bitmap else None
+
+    def missing_pages(self, pdf_id, start_page, page_number, limit):
+        """Return (first `limit` unscanned pages, total) in [start, page)."""
+        bitmap = self._bitmaps.get(pdf_id)
+        if bitmap is None:
+            return [], 0
+        return bitmap.missing(start_page, page_number, limit)
+
+    def mark_scanned(self, cur, pdf_id, page_number):
+        cur.execute(
+            """
+            INSERT INTO page_state (pdf_id, page_number, scanned, scanned_at, seq)
+            VALUES (?, ?, 1, datetime('now'), ?)
+            ON CONFLICT (pdf_id, page_number)
+            DO UPDATE SET scanned = 1, scanned_at = excluded.scanned_at,
+                seq = excluded.seq
+            """,
+            (pdf_id, page_number, _next_seq(cur)),
+        )
+        rows = self._page_rows.get((pdf_id, page_number), ())
+        if not any(row[2] for row in rows):
+            add_scanned_page(cur, pdf_id)
+        for row in rows:
+            row[2] = 1
+        bitmap = self._bitmaps.get(pdf_id)
+        if bitmap is not None:
+            bitmap.mark_scanned(page_number)
+
+    def reset_scans(self, cur):
+        cur.execute(
+            "UPDATE page_state SET scanned = 0, scanned_at = NULL, seq = ? "
+            "WHERE scanned = 1",
+            (_next_seq(cur),),
+        )
+        reset_scanned_pages(cur)
+        for rows in self._page_rows.values():
+            for row in rows:
+                row[2] = 0
+        for bitmap in self._bitmaps.values():
+            bitmap.reset()
@@ -1,22 +1,88 @@
 import argparse
+import csv
+import multiprocessing
+import os
 import sqlite3
 import sys
+import threading
 from pathlib import Path
 
-from control.database.db import init_db
-from control.data.pdf_extractor import extract_pdf, list_loaded_pdfs
+from control.database.db import check_db, init_db
+from control.data.pdf_extractor import (
+    PUBLISH_SECONDS,
+    discard_interrupted_indexing,
+    extract_pdfs,
+    list_loaded_pdfs,
+)
 from control.config import PDF_DIR, ensure_dirs
+from control.data.engines import ENGINE_NAMES, get_engine
+from control.data.watcher import WATCH_POLL_SECONDS, WATCH_SETTLE_SECONDS, FolderWatcher
+from control.database.events import EVENT_MODES
+from control.logic.judge import process_scans, set_event_mode
 from control.reporting import export_audit_csv
+from control.service import DEFAULT_HOST, DEFAULT_PORT, JudgeClient, JudgeServiceError, serve
 from control.ui.console import run_console
 
 SEQUENCE_MODE = "secuencia"
 VERIFICATION_MODE = "verificacion"
+DEFAULT_INDEX_WORKERS = max(1, (os.cpu_count() or 1) - 1)
 
 
 def _build_parser():
     parser = argparse.ArgumentParser(prog="control")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_INDEX_WORKERS,
+        help="Procesos para indexar en paralelo (1 = sin paralelismo)",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINE_NAMES,
+        help=(
+            "Motor de extraccion de texto: pdfplumber (por defecto, o "
+            "CONTROL_PDF_ENGINE), pypdf, raw (lee los content streams) o fast "
+            "(pypdf si esta instalado, si no raw). Los motores rapidos pueden "
+            "perder codigos: las hojas sin codigos, y con raw las que usan "
+            "fuentes o Form XObjects que no decodifica, se releen con pdfplumber"
+        ),
+    )
+    parser.add_argument(
+        "--event-mode",
+        choices=EVENT_MODES,
+        default="sync",
+        help=(
+            "Registro de eventos de escaneo: sync (en cada escaneo), durable "
+            "(eventos en lotes, hoja escaneada siempre en disco) o buffered "
+            "(eventos en lotes y commits sin fsync)"
+        ),
+    )
+    parser.add_argument(
+        "--service",
+        metavar="URL",
+        help="Envia los escaneos a un servicio compartido (control serve), "
+        "por ejemplo http://127.0.0.1:8765",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="Indexa en segundo plano los PDFs que llegan a la carpeta de PDFs "
+        "(en lugar de elegirlos al iniciar)",
+    )
+    parser.add_argument(
+        "--progressive",
+        action="store_true",
+        help="Indexa los PDFs elegidos en segundo plano: se puede escanear cada "
+        "hoja en cuanto queda indexada",
+    )
     subparsers = parser.add_subparsers(dest="command")
 
+    serve_parser = subparsers.add_parser(
+        "serve", help="Inicia el servicio de escaneo compartido entre estaciones"
+    )
+    serve_parser.add_argument("--host", default=DEFAULT_HOST)
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+
     report_parser = subparsers.add_parser("report", help="Exporta reporte de auditoria")
     report_parser.add_argument(
         "--csv",
@@ -27,6 +93,46 @@ def _build_parser():
         "--output",
         help="Ruta de salida del CSV (opcional)",
     )
+
+    watch_parser = subparsers.add_parser(
+        "watch", help="Vigila la carpeta de PDFs e indexa los que llegan"
+    )
+    watch_parser.add_argument(
+        "--interval",
+        type=float,
+        default=WATCH_POLL_SECONDS,
+        help="Segundos entre revisiones de la carpeta cuando no hay inotify",
+    )
+    watch_parser.add_argument(
+        "--settle",
+        type=float,
+        default=WATCH_SETTLE_SECONDS,
+        help="Segundos sin cambios de tamano/fecha antes de indexar un PDF",
+    )
+
+    check_parser = subparsers.add_parser(
+        "check-db", help="Verifica la integridad de la base (mantenimiento)"
+    )
+    check_parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="Verificacion rapida (quick_check, no revisa el contenido de los indices)",
+    )
+
+    batch_parser = subparsers.add_parser(
+        "scan-batch", help="Procesa un archivo de codigos escaneados sin conexion"
+    )
+    batch_parser.add_argument("file", help="Archivo de texto con un codigo por linea")
+    batch_parser.add_argument(
+        "--mode",
+        choices=[SEQUENCE_MODE, VERIFICATION_MODE],
+        default=VERIFICATION_MODE,
+        help="Modo de trabajo (por defecto verificacion)",
+    )
+    batch_parser.add_argument(
+        "--output",
+        help="CSV de resultados (por defecto <archivo>_resultados.csv)",
+    )
     return parser
 
 
@@ -39,6 +145,100 @@ def _run_report_command(args):
     return 0
 
 
+def _run_check_db_command(args):
+    try:
+        problems = check_db(quick=args.quick)
+    except sqlite3.DatabaseError as exc:
+        print(f"No se pudo verificar la base de datos: {exc}")
+        return 1
+    if not problems:
+        print("Base de datos OK")
+        return 0
+    print(f"Se encontraron {len(problems)} problema(s) de integridad:")
+    for problem in problems[:50]:
+        print(f"- {problem}")
+    print("Genera respaldo antes de continuar.")
+    return 1
+
+
+SCAN_RESULT_FIELDS = [
+    "line",
+    "code",
+    "status",
+    "error_type",
+    "file_name",
+    "page_number",
+    "message",
+]
+
+
+def _read_scan_codes(path):
+    with open(path, encoding="utf-8-sig") as handle:
+        return [
+            (line_number, line.strip())
+            for line_number, line in enumerate(handle, start=1)
+            if line.strip()
+        ]
+
+
+def _run_scan_batch_command(args, judge=None):
+    source = Path(args.file)
+    if not source.is_file():
+        print(f"No se encontro el archivo '{source}'")
+        return 1
+    output = Path(args.output) if args.output else source.with_name(
+        f"{source.stem}_resultados.csv"
+    )
+
+    lines = _read_scan_codes(source)
+    run_batch = judge.process_scans if judge is not None else process_scans
+    try:
+        results = run_batch([code for _, code in lines], mode=args.mode)
+    except sqlite3.OperationalError:
+        print("Base de datos bloqueada. Cierra otras instancias y vuelve a intentar.")
+        return 1
+
+    with output.open("w", encoding="utf-8", newline="") as handle:
+        writer = csv.DictWriter(handle, fieldnames=SCAN_RESULT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for (line_number, _), result in zip(lines, results):
+            writer.writerow({**result, "line": line_number})
+
+    ok = sum(1 for result in results if result["status"] == "OK")
+    print(f"Codigos procesados: {len(results)} | OK: {ok} | errores: {len(results) - ok}")
+    print(f"Resultados: {output}")
+    return 0
+
+
+def _print_watch_result(pdf_path, result, message):
+    name = Path(pdf_path).name
+    if result == "indexed":
+        print(f"PDF nuevo indexado: {name}")
+    elif result == "cached":
+        print(f"PDF sin cambios (cache): {name}")
+    else:
+        print(f"No se pudo indexar {name}: {message}")
+
+
+def _start_watcher(args):
+    return FolderWatcher(engine=args.engine, on_result=_print_watch_result).start()
+
+
+def _run_watch_command(args):
+    watcher = FolderWatcher(
+        engine=args.engine,
+        settle_seconds=max(0.0, args.settle),
+        poll_interval=max(0.1, args.interval),
+        on_result=_print_watch_result,
+    )
+    print(f"Vigilando '{PDF_DIR}' (Ctrl+C para salir)")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
 def _show_loaded_cache():
     loaded = list_loaded_pdfs()
     if not loaded:
@@ -116,6 +316,83 @@ def _print_progress(pdf_path, processed, total):
     print(f"Indexando {name}: pagina {processed}/{total}")
 
 
+def _print_index_results(results):
+    indexed = sum(1 for extracted in results if extracted)
+    reused = len(results) - indexed
+    print(f"PDFs indexados: {indexed} | cache reutilizada: {reused}")
+
+
+def _discard_failed():
+    # extract_pdfs ya quita lo publicado al fallar; si la base no lo dejo,
+    # se reintenta para no dejar el PDF como "indexandose".
+    try:
+        discard_interrupted_indexing()
+    except sqlite3.Error:
+        pass
+
+
+def _index_in_background(pdf_paths, args):
+    def run():
+        try:
+            results = extract_pdfs(
+                pdf_paths,
+                workers=max(1, args.workers),
+                engine=args.engine,
+                publish_seconds=PUBLISH_SECONDS,
+            )
+        except sqlite3.OperationalError:
+            print(
+                "No se pudo indexar por bloqueo de base de datos. "
+                "Cierra otras instancias y vuelve a intentar."
+            )
+            _discard_failed()
+            return
+        except Exception as exc:  # PDF danado: la consola sigue escaneando
+            print(f"No se pudo indexar: {type(exc).__name__}: {exc}")
+            _discard_failed()
+            return
+        _print_index_results(results)
+
+    thread = threading.Thread(target=run, name="control-index")
+    thread.start()
+    print(
+        f"Indexando {len(pdf_paths)} PDF(s) en segundo plano: cada hoja se puede "
+        "escanear en cuanto queda indexada"
+    )
+    return thread
+
+
+def _resume_interrupted(args):
+    # Hojas a medias de una indexacion progresiva que murio: se descartan y
+    # el PDF se vuelve a indexar desde cero.
+    try:
+        paths = discard_interrupted_indexing()
+    except sqlite3.OperationalError:
+        return None
+    for path in paths:
+        print(f"Indexacion interrumpida de {Path(path).name}: se descartaron sus hojas")
+    if args.command == "scan-batch":
+        return None
+    # Los de la carpeta vigilada los vuelve a indexar el vigilante.
+    watching = args.watch or args.command == "watch"
+    pending = [
+        path
+        for path in paths
+        if Path(path).exists() and not (watching and Path(path).parent == PDF_DIR)
+    ]
+    if not pending:
+        return None
+    return _index_in_background(pending, args)
+
+
+def _join_indexer(indexer):
+    if indexer is None:
+        return
+    if indexer.is_alive():
+        print("Esperando que termine la indexacion...")
+    indexer.join()
+
+
 def _choose_mode():
     print("Modo de trabajo:")
     print("1. Revisar secuencia")
@@ -129,52 +406,76 @@ def _choose_mode():
         print("Opcion invalida")
 
 
-def main():
-    parser = _build_parser()
-    args = parser.parse_args(sys.argv[1:])
-
-    ensure_dirs()
+def _run_with_service(args):
+    client = JudgeClient(args.service)
     try:
-        init_db()
-    except sqlite3.OperationalError:
-        print("Base de datos bloqueada. Cierra otras instancias y vuelve a intentar.")
+        client.health()
+    except JudgeServiceError as exc:
+        print(exc)
         return 1
-    except sqlite3.IntegrityError as exc:
-        print(
-            "Se detecto un problema de integridad en la base de datos. "
-            "Genera respaldo y revisa la consistencia antes de continuar."
-        )
-        print(f"Detalle: {exc}")
+
+    try:
+        if args.command == "scan-batch":
+            return _run_scan_batch_command(args, judge=client)
+        mode = _choose_mode()
+        print(f"Escaneo activo a traves del servicio {args.service}")
+        run_console(mode=mode, judge=client)
+    except JudgeServiceError as exc:
+        print(exc)
         return 1
+    return 0
 
-    if args.command == "report":
-        return _run_report_command(args)
+
+def _run_local(args):
+    if args.command == "watch":
+        return _run_watch_command(args)
+    if args.command == "serve":
+        watcher = _start_watcher(args) if args.watch else None
+        try:
+            serve(args.host, args.port)
+        finally:
+            if watcher is not None:
+                watcher.stop()
+        return 0
+    if args.command == "scan-batch":
+        return _run_scan_batch_command(args)
 
     _show_loaded_cache()
 
+    if args.watch:
+        print(f"Vigilando '{PDF_DIR}': los PDFs nuevos se indexan en segundo plano")
+        watcher = _start_watcher(args)
+        try:
+            run_console(mode=_choose_mode())
+        finally:
+            watcher.stop()
+        return 0
+
     pdf_paths = _choose_pdfs()
+    if pdf_paths and args.progressive:
+        indexer = _index_in_background(pdf_paths, args)
+        try:
+            run_console(mode=_choose_mode())
+        finally:
+            _join_indexer(indexer)
+        return 0
     if not pdf_paths:
         print("Continuando solo con lo que ya esta en cache")
     else:
-        indexed = 0
-        reused = 0
-        for pdf_path in pdf_paths:
-            try:
-                extracted = extract_pdf(
-                    pdf_path,
-                    progress_callback=_print_progress,
-                )
-            except sqlite3.OperationalError:
-                print(
-                    "No se pudo indexar por bloqueo de base de datos. "
-                    "Cierra otras instancias y vuelve a intentar."
-                )
-                return
-            if extracted:
-                indexed += 1
-            else:
-                reused += 1
-        print(f"PDFs indexados: {indexed} | cache reutilizada: {reused}")
+        try:
+            results = extract_pdfs(
+                pdf_paths,
+                progress_callback=_print_progress,
+                workers=max(1, args.workers),
+                engine=args.engine,
+            )
+        except sqlite3.OperationalError:
+            print(
+                "No se pudo indexar por bloqueo de base de datos. "
+                "Cierra otras instancias y vuelve a intentar."
+            )
+            return
+        _print_index_results(results)
 
     loaded = list_loaded_pdfs()
     if not loaded:
@@ -187,5 +488,49 @@ def main():
     return 0
 
 
+def main():
+    multiprocessing.freeze_support()
+    parser = _build_parser()
+    args = parser.parse_args(sys.argv[1:])
+
+    if args.service and args.command not in ("report", "check-db", "watch"):
+        if args.watch:
+            print("--watch se usa en la PC del servicio (control --watch serve)")
+            return 1
+        return _run_with_service(args)
+
+    try:
+        get_engine(args.engine)
+    except ValueError as exc:
+        print(exc)
+        return 1
+
+    ensure_dirs()
+    if args.command == "check-db":
+        return _run_check_db_command(args)
+    try:
+        init_db()
+    except sqlite3.OperationalError:
+        print("Base de datos bloqueada. Cierra otras instancias y vuelve a intentar.")
+        return 1
+    except sqlite3.IntegrityError as exc:
+        print(
+            "Se detecto un problema de integridad en la base de datos. "
+            "Genera respaldo y revisa la consistencia (control check-db) "
+            "antes de continuar."
+        )
+        print(f"Detalle: {exc}")
+        return 1
+
+    if args.command == "report":
+        return _run_report_command(args)
+    set_event_mode(args.event_mode)
+    resumed = _resume_interrupted(args)
+    try:
+        return _run_local(args)
+    finally:
+        _join_indexer(resumed)
+
+
 if __name__ == "__main__":
     sys.exit(main())
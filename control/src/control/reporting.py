@@ -6,6 +6,7 @@ from pathlib import Path
 
 from control.config import DATA_DIR
 from control.database.db import get_connection
+from control.database.stats import load_totals
 
 
 def _default_report_path():
@@ -16,94 +17,72 @@ def _default_report_path():
 
 
 def _load_summary(cur):
-    cur.execute("SELECT COUNT(*) FROM pdf_files")
-    loaded_pdfs = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM pages")
-    total_codes = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(DISTINCT pdf_id || ':' || page_number) FROM pages")
-    total_pages = cur.fetchone()[0]
-
-    cur.execute(
-        "SELECT COUNT(DISTINCT pdf_id || ':' || page_number) FROM pages WHERE scanned = 1"
-    )
-    scanned_pages = cur.fetchone()[0]
-
-    cur.execute("SELECT COUNT(*) FROM code_duplicates")
-    total_duplicates = cur.fetchone()[0]
+    totals = load_totals(cur)
 
     cur.execute("SELECT COUNT(*) FROM events")
     total_events = cur.fetchone()[0]
 
     return {
-        "loaded_pdfs": loaded_pdfs,
-        "total_codes": total_codes,
-        "total_pages": total_pages,
-        "scanned_pages": scanned_pages,
-        "pending_pages": max(0, total_pages - scanned_pages),
-        "total_duplicates": total_duplicates,
+        "loaded_pdfs": totals["total_pdfs"],
+        "total_codes": totals["total_codes"],
+        "total_pages": totals["total_pages"],
+        "scanned_pages": totals["scanned_pages"],
+        "pending_pages": max(0, totals["total_pages"] - totals["scanned_pages"]),
+        "total_duplicates": totals["total_duplicates"],
         "total_events": total_events,
     }
 
 
-def _append_summary_rows(rows, summary):
-    rows.append(
-        {
-            "section": "summary",
-            "kind": "totals",
-            "ts": datetime.now().isoformat(timespec="seconds"),
-            "loaded_pdfs": summary["loaded_pdfs"],
-            "total_codes": summary["total_codes"],
-            "total_pages": summary["total_pages"],
-            "scanned_pages": summary["scanned_pages"],
-            "pending_pages": summary["pending_pages"],
-            "total_duplicates": summary["total_duplicates"],
-            "total_events": summary["total_events"],
-        }
-    )
+def _iter_summary_rows(summary):
+    yield {
+        "section": "summary",
+        "kind": "totals",
+        "ts": datetime.now().isoformat(timespec="seconds"),
+        "loaded_pdfs": summary["loaded_pdfs"],
+        "total_codes": summary["total_codes"],
+        "total_pages": summary["total_pages"],
+        "scanned_pages": summary["scanned_pages"],
+        "pending_pages": summary["pending_pages"],
+        "total_duplicates": summary["total_duplicates"],
+        "total_events": summary["total_events"],
+    }
 
 
-def _append_loaded_pdfs_rows(cur, rows):
+def _iter_loaded_pdfs_rows(cur):
     cur.execute(
         """
-        SELECT f.file_name, f.file_path, COUNT(p.code) AS codes
+        SELECT f.file_name, f.file_path, COALESCE(s.codes, 0) AS codes
         FROM pdf_files f
-        LEFT JOIN pages p ON p.pdf_id = f.id
-        GROUP BY f.id, f.file_name, f.file_path
+        LEFT JOIN pdf_stats s ON s.pdf_id = f.id
         ORDER BY f.loaded_at DESC, f.id DESC
         """
     )
-    for file_name, file_path, codes in cur.fetchall():
-        rows.append(
-            {
-                "section": "loaded_pdf",
-                "kind": "pdf_cache",
-                "file_name": file_name,
-                "file_path": file_path,
-                "codes": codes,
-            }
-        )
-
-
-def _append_events_rows(cur, rows):
+    for file_name, file_path, codes in cur:
+        yield {
+            "section": "loaded_pdf",
+            "kind": "pdf_cache",
+            "file_name": file_name,
+            "file_path": file_path,
+            "codes": codes,
+        }
+
+
+def _iter_events_rows(cur):
     cur.execute(
         "SELECT ts, event_type, code, page_number, details FROM events ORDER BY id DESC"
     )
-    for ts, event_type, code, page_number, details in cur.fetchall():
-        rows.append(
-            {
-                "section": "event",
-                "kind": event_type,
-                "ts": ts,
-                "code": code,
-                "page_number": page_number,
-                "details": details,
-            }
-        )
-
-
-def _append_duplicates_rows(cur, rows):
+    for ts, event_type, code, page_number, details in cur:
+        yield {
+            "section": "event",
+            "kind": event_type,
+            "ts": ts,
+            "code": code,
+            "page_number": page_number,
+            "details": details,
+        }
+
+
+def _iter_duplicates_rows(cur):
     cur.execute(
         """
         SELECT d.detected_at, d.code, d.duplicate_kind,
@@ -123,53 +102,55 @@ def _append_duplicates_rows(cur, rows):
         new_page_number,
         existing_file_name,
         existing_page_number,
-    ) in cur.fetchall():
-        rows.append(
-            {
-                "section": "duplicate",
-                "kind": duplicate_kind,
-                "ts": detected_at,
-                "code": code,
-                "new_file_name": new_file_name,
-                "new_page_number": new_page_number,
-                "existing_file_name": existing_file_name,
-                "existing_page_number": existing_page_number,
-            }
-        )
-
-
-def _append_extract_summary_rows(cur, rows):
+    ) in cur:
+        yield {
+            "section": "duplicate",
+            "kind": duplicate_kind,
+            "ts": detected_at,
+            "code": code,
+            "new_file_name": new_file_name,
+            "new_page_number": new_page_number,
+            "existing_file_name": existing_file_name,
+            "existing_page_number": existing_page_number,
+        }
+
+
+def _iter_extract_summary_rows(cur):
     cur.execute(
         "SELECT ts, details FROM events WHERE event_type = 'extract_summary' ORDER BY id DESC"
     )
-    for ts, details in cur.fetchall():
+    for ts, details in cur:
         parsed = {}
         if details:
             try:
                 parsed = json.loads(details)
             except Exception:
                 parsed = {"raw_details": details}
-        rows.append(
-            {
-                "section": "extract_summary",
-                "kind": "extract_summary",
-                "ts": ts,
-                "details": json.dumps(parsed, ensure_ascii=False),
-            }
-        )
+        yield {
+            "section": "extract_summary",
+            "kind": "extract_summary",
+            "ts": ts,
+            "details": json.dumps(parsed, ensure_ascii=False),
+        }
+
+
+def iter_audit_rows():
+    """Yield audit rows section by section, streaming from database cursors."""
+    # Dedicated read-only connection: the generator may stay suspended
+    # between rows, so it cannot share the thread's pooled one.
+    conn = get_connection(read_only=True)
+    try:
+        yield from _iter_summary_rows(_load_summary(conn.cursor()))
+        yield from _iter_loaded_pdfs_rows(conn.cursor())
+        yield from _iter_extract_summary_rows(conn.cursor())
+        yield from _iter_events_rows(conn.cursor())
+        yield from _iter_duplicates_rows(conn.cursor())
+    finally:
+        conn.close()
 
 
 def build_audit_rows():
-    rows = []
-    with get_connection() as conn:
-        cur = conn.cursor()
-        summary = _load_summary(cur)
-        _append_summary_rows(rows, summary)
-        _append_loaded_pdfs_rows(cur, rows)
-        _append_extract_summary_rows(cur, rows)
-        _append_events_rows(cur, rows)
-        _append_duplicates_rows(cur, rows)
-    return rows
+    return list(iter_audit_rows())
 
 
 def _fieldnames():
@@ -197,12 +178,23 @@ def _fieldnames():
     ]
 
 
-def render_audit_csv_text():
+def iter_audit_csv_chunks(chunk_size=64 * 1024):
+    """Yield the audit CSV as UTF-8 byte chunks of about chunk_size bytes."""
     buffer = io.StringIO()
     writer = csv.DictWriter(buffer, fieldnames=_fieldnames(), extrasaction="ignore")
     writer.writeheader()
-    writer.writerows(build_audit_rows())
-    return buffer.getvalue()
+    for row in iter_audit_rows():
+        writer.writerow(row)
+        if buffer.tell() >= chunk_size:
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def render_audit_csv_text():
+    return b"".join(iter_audit_csv_chunks()).decode("utf-8")
 
 
 def export_audit_csv(output_path=None):
@@ -212,6 +204,6 @@ def export_audit_csv(output_path=None):
     with target.open("w", newline="", encoding="utf-8") as handle:
         writer = csv.DictWriter(handle, fieldnames=_fieldnames(), extrasaction="ignore")
         writer.writeheader()
-        writer.writerows(build_audit_rows())
+        writer.writerows(iter_audit_rows())
 
     return target
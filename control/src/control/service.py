@@ -0,0 +1,250 @@
+"""Local judge service: one process owns the database and the scan state.
+
+Stations send scans over HTTP/JSON instead of opening the SQLite file
+themselves, so verdicts are serialized by the judge lock and the lot start
+pages (START_PAGE_BY_PDF) are shared by every station.
+"""
+
+import http.client
+import json
+import sqlite3
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from control.logic import judge
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_URL = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}"
+MAX_BODY_BYTES = 64 * 1024 * 1024
+
+
+class JudgeServiceError(RuntimeError):
+    """The judge service could not be reached or rejected the request."""
+
+
+def content_length(headers):
+    """Return the request's Content-Length (0 when absent), None if invalid."""
+    value = headers.get("Content-Length")
+    if value is None:
+        return 0
+    value = value.strip()
+    # Solo digitos: un "-1" haria que rfile.read() espere al cierre del cliente.
+    if not (value.isascii() and value.isdigit()):
+        return None
+    return int(value)
+
+
+def _scan(payload):
+    return judge.process_scan(str(payload["code"]), mode=payload.get("mode", "verificacion"))
+
+
+def _scans(payload):
+    codes = [str(code) for code in payload["codes"]]
+    return judge.process_scans(codes, mode=payload.get("mode", "verificacion"))
+
+
+def _classify(payload):
+    judge.classify_scan_error(
+        payload["error_type"],
+        payload["resolution"],
+        code=payload.get("code"),
+        page_number=payload.get("page_number"),
+        file_name=payload.get("file_name"),
+        note=payload.get("note"),
+    )
+    return {"status": "ok"}
+
+
+def _reset_scans(_payload):
+    judge.reset_scans()
+    return {"status": "ok"}
+
+
+def _reset_start_page(_payload):
+    judge.reset_start_page()
+    return {"status": "ok"}
+
+
+def _set_page_range(payload):
+    judge.set_page_range(payload.get("start_page"))
+    return {"status": "ok"}
+
+
+POST_ROUTES = {
+    "/scan": _scan,
+    "/scans": _scans,
+    "/classify": _classify,
+    "/reset-scans": _reset_scans,
+    "/reset-start-page": _reset_start_page,
+    "/page-range": _set_page_range,
+}
+
+
+class JudgeHandler(BaseHTTPRequestHandler):
+    # Conexiones persistentes: cada estacion reutiliza la suya. Sin Nagle,
+    # la respuesta corta no espera el ACK retrasado del cliente (~40 ms).
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/health":
+            self._send_json({"status": "ok"})
+            return
+        if path == "/start-page":
+            self._send_json(judge.get_start_page())
+            return
+        self._send_json({"error": "Ruta no encontrada"}, status=404)
+
+    def do_POST(self):
+        route = POST_ROUTES.get(urlparse(self.path).path)
+        length = content_length(self.headers)
+        if length is None:
+            self.close_connection = True
+            self._send_json({"error": "Content-Length invalido"}, status=400)
+            return
+        if length > MAX_BODY_BYTES:
+            self.close_connection = True
+            self._send_json({"error": "Solicitud demasiado grande"}, status=413)
+            return
+        body = self.rfile.read(length) if length else b""
+        if route is None:
+            self._send_json({"error": "Ruta no encontrada"}, status=404)
+            return
+        try:
+            payload = json.loads(body or b"{}")
+            if not isinstance(payload, dict):
+                raise ValueError("Se esperaba un objeto JSON")
+            result = route(payload)
+        except (KeyError, TypeError, ValueError) as exc:
+            self._send_json({"error": f"Solicitud invalida: {exc}"}, status=400)
+            return
+        except sqlite3.OperationalError as exc:
+            self._send_json({"error": f"Base de datos ocupada: {exc}"}, status=503)
+            return
+        self._send_json(result)
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class JudgeServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def serve(host=DEFAULT_HOST, port=DEFAULT_PORT):
+    judge.load_index()
+    server = JudgeServer((host, port), JudgeHandler)
+    print(f"Servicio de escaneo en http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        judge.close_events()
+
+
+class JudgeClient:
+    """Same calls as control.logic.judge, answered by a judge service.
+
+    Each thread keeps its own persistent connection. A failed request is not
+    retried: the scan may already have been judged.
+    """
+
+    def __init__(self, url=DEFAULT_URL, timeout=30):
+        parsed = urlparse(url)
+        if parsed.scheme != "http" or not parsed.hostname:
+            raise ValueError(f"URL de servicio invalida: {url}")
+        self.url = url
+        self._host = parsed.hostname
+        self._port = parsed.port or 80
+        self._timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(
+                self._host, self._port, timeout=self._timeout
+            )
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def _request(self, method, path, payload=None):
+        conn = self._connection()
+        headers = {}
+        body = None
+        if payload is not None:
+            body = json.dumps(payload).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, OSError) as exc:
+            self.close()
+            raise JudgeServiceError(
+                f"No se pudo contactar el servicio de escaneo en {self.url}: {exc}"
+            ) from exc
+        try:
+            result = json.loads(data or b"null")
+        except ValueError as exc:
+            raise JudgeServiceError("Respuesta invalida del servicio de escaneo") from exc
+        if response.status >= 400:
+            message = result.get("error") if isinstance(result, dict) else None
+            raise JudgeServiceError(message or f"Error {response.status} del servicio")
+        return result
+
+    def health(self):
+        return self._request("GET", "/health")
+
+    def process_scan(self, scanned_code, mode="verificacion"):
+        return self._request("POST", "/scan", {"code": scanned_code, "mode": mode})
+
+    def process_scans(self, codes, mode="verificacion"):
+        return self._request("POST", "/scans", {"codes": list(codes), "mode": mode})
+
+    def classify_scan_error(
+        self, error_type, resolution, code=None, page_number=None, file_name=None, note=None
+    ):
+        self._request(
+            "POST",
+            "/classify",
+            {
+                "error_type": error_type,
+                "resolution": resolution,
+                "code": code,
+                "page_number": page_number,
+                "file_name": file_name,
+                "note": note,
+            },
+        )
+
+    def reset_scans(self):
+        self._request("POST", "/reset-scans", {})
+
+    def reset_start_page(self):
+        self._request("POST", "/reset-start-page", {})
+
+    def set_page_range(self, start_page=None):
+        self._request("POST", "/page-range", {"start_page": start_page})
+
+    def get_start_page(self):
+        return self._request("GET", "/start-page")
@@ -8,14 +8,7 @@ try:
 except ImportError:
     winsound = None
 
-from control.logic.judge import (
-    classify_scan_error,
-    process_scan,
-    set_page_range,
-    reset_start_page,
-    get_start_page,
-    reset_scans,
-)
+from control.logic import judge as local_judge
 
 RESOLUTION_OPTIONS = {
     "1": "falso_duplicado",
@@ -106,7 +99,7 @@ def _beep_error():
     print("\a", end="", flush=True)
 
 
-def _ask_resolution(result):
+def _ask_resolution(result, judge):
     if result["error_type"] not in {"already_scanned", "other_lot"}:
         return
 
@@ -127,7 +120,7 @@ def _ask_resolution(result):
     if resolution == "otro":
         note = input("Describe el caso: ").strip() or None
 
-    classify_scan_error(
+    judge.classify_scan_error(
         result["error_type"],
         resolution,
         code=result.get("code"),
@@ -138,8 +131,13 @@ def _ask_resolution(result):
     print("Clasificacion guardada")
 
 
-def run_console(start_page=None, mode="verificacion"):
-    set_page_range(start_page)
+def run_console(start_page=None, mode="verificacion", judge=None):
+    # judge: control.logic.judge o un JudgeClient del servicio compartido.
+    judge = judge or local_judge
+    if start_page is not None or judge is local_judge:
+        # El servicio compartido conserva los inicios de lote de las demas
+        # estaciones: solo se cambian si se pide un inicio explicito.
+        judge.set_page_range(start_page)
     print("=== CONTROL DE HOJAS ===")
     print(f"Modo: {mode}")
     print("Escanea un codigo o escribe 'exit'")
@@ -153,15 +151,15 @@ def run_console(start_page=None, mode="verificacion"):
         if code.lower() == "exit":
             break
         if code.lower() == "reset":
-            reset_start_page()
+            judge.reset_start_page()
             print("Inicio del lote reiniciado")
             continue
         if code.lower() == "reset-scan":
-            reset_scans()
+            judge.reset_scans()
             print("Se limpiaron las hojas escaneadas")
             continue
         if code.lower() == "status":
-            current = get_start_page()
+            current = judge.get_start_page()
             if current is None:
                 print("Inicio actual: (sin definir)")
             elif isinstance(current, dict):
@@ -176,9 +174,9 @@ def run_console(start_page=None, mode="verificacion"):
             _beep_error()
             print("Beep enviado")
             continue
-        result = process_scan(code, mode=mode)
+        result = judge.process_scan(code, mode=mode)
         print(f"[{result['status']}] {result['message']}")
         if result["status"] == "ERROR":
             _beep_error()
             if mode == "verificacion":
-                _ask_resolution(result)
+                _ask_resolution(result, judge)
@@ -0,0 +1,66 @@
+"""Minimal PDF writer for the extraction tests (Helvetica as /F1)."""
+
+
+def _stream(content, attrs=b""):
+    return b"<< %s/Length %d >>\nstream\n%s\nendstream" % (attrs, len(content), content)
+
+
+def write_pdf(path, pages):
+    """Write a PDF with one page per item of pages.
+
+    An item is a content stream, or (content, {name: form_content}) to give
+    the page Form XObjects it can draw with "/name Do".
+    """
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+        b"/Encoding /WinAnsiEncoding >>",
+    ]
+    kids = []
+    for page in pages:
+        content, forms = page if isinstance(page, tuple) else (page, {})
+        xobjects = []
+        for name, form in forms.items():
+            objects.append(
+                _stream(
+                    form,
+                    b"/Type /XObject /Subtype /Form /BBox [0 0 612 792] "
+                    b"/Resources << /Font << /F1 3 0 R >> >> ",
+                )
+            )
+            xobjects.append(b"/%s %d 0 R" % (name.encode("ascii"), len(objects)))
+        objects.append(_stream(content))
+        resources = b"/Font << /F1 3 0 R >>"
+        if xobjects:
+            resources += b" /XObject << " + b" ".join(xobjects) + b" >>"
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << %s >> /Contents %d 0 R >>" % (resources, len(objects))
+        )
+        kids.append(b"%d 0 R" % len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(kids), len(kids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    path.write_bytes(bytes(out))
+
+
+def lines(*texts, size=12):
+    """Content stream (or form) showing one text line per argument."""
+    body = b" ".join(
+        b"1 0 0 1 50 %d Tm (%s) Tj" % (750 - 20 * index, text.encode("latin-1"))
+        for index, text in enumerate(texts)
+    )
+    return b"BT /F1 %d Tf " % size + body + b" ET"
@@ -0,0 +1,253 @@
+import importlib
+import sqlite3
+import threading
+
+import pytest
+
+
+def _reload_modules():
+    import control.config as config
+    import control.database.db as db
+
+    importlib.reload(config)
+    importlib.reload(db)
+    return config, db
+
+
+def test_init_db_moves_scanned_flags_to_page_state(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    config, db = _reload_modules()
+    config.ensure_dirs()
+
+    conn = sqlite3.connect(config.DB_PATH)
+    conn.executescript(
+        """
+        CREATE TABLE pdf_files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            file_name TEXT NOT NULL,
+            file_path TEXT UNIQUE NOT NULL,
+            signature TEXT NOT NULL,
+            loaded_at TEXT
+        );
+        CREATE TABLE pages (
+            page_number INTEGER NOT NULL CHECK(page_number >= 1),
+            code TEXT NOT NULL CHECK(length(trim(code)) > 0),
+            scanned INTEGER NOT NULL DEFAULT 0 CHECK(scanned IN (0, 1)),
+            pdf_id INTEGER NOT NULL,
+            UNIQUE(pdf_id, code),
+            FOREIGN KEY (pdf_id) REFERENCES pdf_files(id)
+        );
+        INSERT INTO pdf_files (file_name, file_path, signature)
+        VALUES ('a.pdf', 'C:/a.pdf', 'sig-a');
+        INSERT INTO pages (page_number, code, scanned, pdf_id) VALUES
+            (1, 'MIG001', 1, 1), (1, 'MIG002', 1, 1),
+            (2, 'MIG003', 1, 1), (2, 'MIG004', 0, 1),
+            (3, 'MIG005', 0, 1);
+        """
+    )
+    conn.commit()
+    conn.close()
+
+    db.init_db()
+    db.init_db()
+
+    conn = db.get_connection()
+    try:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(pages)")}
+        file_columns = {row[1] for row in conn.execute("PRAGMA table_info(pdf_files)")}
+        state_columns = {row[1] for row in conn.execute("PRAGMA table_info(page_state)")}
+        codes = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+        states = conn.execute(
+            "SELECT pdf_id, page_number, scanned FROM page_state ORDER BY page_number"
+        ).fetchall()
+        scanned_pages = conn.execute(
+            "SELECT scanned_pages FROM pdf_stats WHERE pdf_id = 1"
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+    assert version == db.SCHEMA_VERSION
+    assert "scanned" not in columns
+    assert {
+        "file_size",
+        "file_mtime_ns",
+        "file_inode",
+        "indexing",
+        "generation",
+    } <= file_columns
+    assert "seq" in state_columns
+    assert codes == 5
+    # Una hoja cuenta como escaneada solo si lo estaban todos sus codigos.
+    assert states == [(1, 1, 1), (1, 2, 0), (1, 3, 0)]
+    assert scanned_pages == 1
+
+
+def test_init_db_skips_migrations_once_schema_is_current(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    _config, db = _reload_modules()
+    db.init_db(reset=True)
+
+    def fail(_cur):
+        raise AssertionError("migracion repetida")
+
+    monkeypatch.setattr(db, "_ensure_pages_schema", fail)
+    db.init_db()
+
+    with pytest.raises(AssertionError):
+        db.init_db(reset=True)
+
+
+def test_check_db_reports_broken_references(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    config, db = _reload_modules()
+    db.init_db(reset=True)
+    assert db.check_db() == []
+
+    conn = sqlite3.connect(config.DB_PATH)
+    conn.execute("INSERT INTO pages (page_number, code, pdf_id) VALUES (1, 'HUERF1', 99)")
+    conn.commit()
+    conn.close()
+
+    problems = db.check_db(quick=True)
+    assert problems == ["pages fila 1: referencia invalida a pdf_files"]
+
+
+def test_reset_drops_the_old_page_bitmaps_table(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    config, db = _reload_modules()
+    db.init_db(reset=True)
+
+    # Base de una version que guardaba los mapas de bits.
+    conn = sqlite3.connect(config.DB_PATH)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute(
+        """
+        CREATE TABLE page_bitmaps (
+            pdf_id INTEGER PRIMARY KEY,
+            pages BLOB NOT NULL,
+            scanned BLOB NOT NULL,
+            FOREIGN KEY (pdf_id) REFERENCES pdf_files(id)
+        )
+        """
+    )
+    conn.execute(
+        "INSERT INTO pdf_files (file_name, file_path, signature) VALUES ('a.pdf', 'a', 's')"
+    )
+    conn.execute("INSERT INTO page_bitmaps VALUES (1, X'02', X'')")
+    conn.commit()
+    conn.close()
+
+    db.init_db(reset=True)
+
+    conn = sqlite3.connect(config.DB_PATH)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+    finally:
+        conn.close()
+    assert "page_bitmaps" not in tables
+
+
+def _meta_keys(config):
+    conn = sqlite3.connect(config.DB_PATH)
+    try:
+        rows = conn.execute("SELECT key FROM meta WHERE key LIKE 'prueba_%' ORDER BY key")
+        return [row[0] for row in rows]
+    finally:
+        conn.close()
+
+
+def _insert_key(conn, key):
+    conn.execute("INSERT INTO meta (key, value) VALUES (?, 1)", (key,))
+
+
+def test_connection_commits_the_outermost_block_and_rolls_back_on_error(
+    monkeypatch, tmp_path
+):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    config, db = _reload_modules()
+    db.init_db(reset=True)
+
+    with db.connection() as conn:
+        _insert_key(conn, "prueba_a")
+    assert _meta_keys(config) == ["prueba_a"]
+
+    # Los bloques anidados se unen a la transaccion del externo.
+    with db.connection() as outer:
+        _insert_key(outer, "prueba_b")
+        with db.connection() as inner:
+            assert inner is outer
+            _insert_key(inner, "prueba_c")
+        assert outer.in_transaction
+        assert _meta_keys(config) == ["prueba_a"]
+    assert _meta_keys(config) == ["prueba_a", "prueba_b", "prueba_c"]
+
+    with pytest.raises(RuntimeError):
+        with db.connection() as outer:
+            _insert_key(outer, "prueba_d")
+            with db.connection() as inner:
+                _insert_key(inner, "prueba_e")
+                raise RuntimeError("falla")
+    assert not outer.in_transaction
+    assert _meta_keys(config) == ["prueba_a", "prueba_b", "prueba_c"]
+
+    # Tras el error el siguiente bloque vuelve a ser el externo.
+    with db.connection() as conn:
+        assert conn is outer
+        _insert_key(conn, "prueba_f")
+    assert _meta_keys(config) == ["prueba_a", "prueba_b", "prueba_c", "prueba_f"]
+
+
+def test_read_connection_is_read_only_and_ends_its_transaction(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    config, db = _reload_modules()
+    db.init_db(reset=True)
+
+    with db.read_connection() as conn:
+        conn.execute("BEGIN")
+        conn.execute("SELECT COUNT(*) FROM meta").fetchone()
+        with pytest.raises(sqlite3.OperationalError):
+            _insert_key(conn, "prueba_a")
+    assert not conn.in_transaction
+    with db.read_connection() as again:
+        assert again is conn
+    with db.connection() as writer:
+        assert writer is not conn
+
+
+def test_pooled_connections_are_separate_per_thread(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    config, db = _reload_modules()
+    db.init_db(reset=True)
+
+    with db.connection() as main_writer, db.read_connection() as main_reader:
+        pass
+    seen = {}
+    errors = []
+
+    def worker(name):
+        try:
+            with db.connection() as writer:
+                _insert_key(writer, f"prueba_{name}")
+                with db.connection() as nested:
+                    assert nested is writer
+            with db.read_connection() as reader:
+                pass
+            seen[name] = (writer, reader)
+            # Una conexion de otro hilo no se puede usar aqui.
+            with pytest.raises(sqlite3.ProgrammingError):
+                main_writer.execute("SELECT 1")
+        except BaseException as exc:
+            # Los asserts fallidos se revisan en el hilo principal.
+            errors.append(exc)
+
+    threads = [threading.Thread(target=worker, args=(name,)) for name in ("x", "y")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    connections = [main_writer, main_reader, *seen["x"], *seen["y"]]
+    assert len({id(conn) for conn in connections}) == len(connections)
+    assert _meta_keys(config) == ["prueba_x", "prueba_y"]
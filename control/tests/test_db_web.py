@@ -0,0 +1,528 @@
+import gzip
+import http.client
+import importlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.request import urlopen
+
+from control.db_web import _parse_range
+
+
+def _reload_modules():
+    import control.config as config
+    import control.database.db as db
+    import control.data.pdf_extractor as pdf_extractor
+    import control.db_web as db_web
+    import control.logic.judge as judge
+
+    importlib.reload(config)
+    importlib.reload(db)
+    importlib.reload(pdf_extractor)
+    importlib.reload(judge)
+    importlib.reload(db_web)
+    return db, pdf_extractor, judge, db_web
+
+
+def _pages(pdf_extractor, *page_codes):
+    total = len(page_codes)
+    return [
+        pdf_extractor.PageCodes(index, total, codes)
+        for index, codes in enumerate(page_codes, start=1)
+    ]
+
+
+def test_parse_range_single_ranges():
+    assert _parse_range(None, 100) is None
+    assert _parse_range("bytes=0-9", 100) == (0, 9)
+    assert _parse_range("bytes=90-", 100) == (90, 99)
+    assert _parse_range("bytes=-10", 100) == (90, 99)
+    assert _parse_range("bytes=50-500", 100) == (50, 99)
+
+
+def test_parse_range_unsatisfiable_or_ignored():
+    assert _parse_range("bytes=100-", 100) is False
+    assert _parse_range("bytes=-0", 100) is False
+    assert _parse_range("bytes=9-3", 100) is False
+    assert _parse_range("bytes=0-1,5-6", 100) is None
+    assert _parse_range("items=0-1", 100) is None
+
+
+def test_changes_feed_returns_only_new_events_and_changed_pages(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor, judge, db_web = _reload_modules()
+    db.init_db(reset=True)
+    pdf_extractor._write_pdf(
+        Path("C:/a.pdf"), "sig-a", _pages(pdf_extractor, ["F00001"], ["F00002"], ["F00003"])
+    )
+
+    dashboard = db_web._dashboard_payload()
+    since = dashboard["last_event_id"]
+    assert db_web._changes_payload(since) == {
+        "last_event_id": since,
+        "reload": False,
+        "events": [],
+        "pages": [],
+    }
+
+    assert judge.process_scan("F00001", mode="secuencia")["status"] == "OK"
+    judge.process_scan("NOEXISTE", mode="secuencia")
+    changes = db_web._changes_payload(since)
+
+    assert not changes["reload"]
+    assert [event["event_type"] for event in changes["events"]] == [
+        "scan_error_not_found",
+        "scan_ok",
+    ]
+    assert changes["last_event_id"] == changes["events"][0]["id"]
+    assert changes["pages"] == [
+        {
+            "pdf_id": 1,
+            "file_name": "a.pdf",
+            "page_number": 1,
+            "codes": 1,
+            "scanned": True,
+            "duplicate_count": 0,
+            "status": "escaneada",
+        }
+    ]
+    assert changes["summary"]["scanned_pages"] == 1
+    assert db_web._dashboard_payload()["pages"][0] == changes["pages"][0]
+
+    judge.reset_scans()
+    assert db_web._changes_payload(changes["last_event_id"])["reload"]
+    # Un id mayor que el ultimo (base reiniciada) tambien fuerza recarga.
+    assert db_web._changes_payload(10_000)["reload"]
+
+
+def _index_grid_fixture(pdf_extractor):
+    pdf_extractor._write_pdf(
+        Path("C:/b.pdf"),
+        "sig-b",
+        _pages(pdf_extractor, ["G00001"], ["G00002", "G00003"], ["G00004"], ["G00005"]),
+    )
+    pdf_extractor._write_pdf(
+        Path("C:/a.pdf"),
+        "sig-a",
+        _pages(pdf_extractor, ["H00001"], ["G00002"], ["H00003"]),
+    )
+
+
+def test_pages_api_walks_every_page_with_keyset_cursor(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor, judge, db_web = _reload_modules()
+    db.init_db(reset=True)
+    _index_grid_fixture(pdf_extractor)
+    assert judge.process_scan("G00001", mode="secuencia")["status"] == "OK"
+
+    walked = []
+    cursor = None
+    while True:
+        result = db_web._pages_payload(limit=2, after=cursor)
+        assert len(result["pages"]) <= 2
+        walked.extend(result["pages"])
+        cursor = result["next_cursor"]
+        if cursor is None:
+            break
+
+    assert walked == db_web._dashboard_payload()["pages"]
+    assert [(page["file_name"], page["page_number"]) for page in walked] == [
+        ("a.pdf", 1),
+        ("a.pdf", 2),
+        ("a.pdf", 3),
+        ("b.pdf", 1),
+        ("b.pdf", 2),
+        ("b.pdf", 3),
+        ("b.pdf", 4),
+    ]
+
+    pending = db_web._pages_payload(pdf_id=1, status="pendiente", from_page=2, to_page=4)
+    assert [page["page_number"] for page in pending["pages"]] == [3, 4]
+    duplicated = db_web._pages_payload(status="duplicado")
+    assert [(page["pdf_id"], page["page_number"]) for page in duplicated["pages"]] == [
+        (2, 2),
+        (1, 2),
+    ]
+    assert [
+        page["page_number"] for page in db_web._pages_payload(status="escaneada")["pages"]
+    ] == [1]
+    assert "pages" not in db_web._dashboard_payload(include_pages=False)
+
+
+def test_pages_api_query_plans_use_indexes(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor, judge, db_web = _reload_modules()
+    db.init_db(reset=True)
+    _index_grid_fixture(pdf_extractor)
+
+    conn = db._pooled_connection(read_only=True)
+    statements = []
+    conn.set_trace_callback(statements.append)
+    try:
+        first = db_web._pages_payload(limit=3, status="pendiente", from_page=1, to_page=3)
+        db_web._pages_payload(limit=3, status="pendiente", after=first["next_cursor"])
+        db_web._pages_payload(pdf_id=2, limit=3)
+    finally:
+        conn.set_trace_callback(None)
+
+    selects = [sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+    assert any("FROM pages" in sql for sql in selects)
+    for sql in selects:
+        plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+        for detail in plan:
+            assert "TEMP B-TREE" not in detail, (sql, plan)
+            if detail.startswith("SCAN"):
+                assert "USING COVERING INDEX idx_pdf_files_name" in detail, (sql, plan)
+        if "FROM pages" in sql:
+            assert any(
+                "USING COVERING INDEX idx_pages_pdf_page" in detail for detail in plan
+            )
+            assert any("SEARCH s USING PRIMARY KEY" in detail for detail in plan)
+            assert any("idx_dup_new_loc" in detail for detail in plan)
+            assert any("idx_dup_existing_loc" in detail for detail in plan)
+
+
+def test_accepts_gzip_honours_quality():
+    from control.db_web import _accepts_gzip
+
+    assert _accepts_gzip("gzip, deflate, br")
+    assert _accepts_gzip("br;q=1.0, gzip;q=0.8")
+    assert _accepts_gzip("*")
+    assert not _accepts_gzip("gzip;q=0")
+    assert not _accepts_gzip("br")
+    assert not _accepts_gzip(None)
+
+
+def test_response_cache_reuses_body_until_database_changes(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor, judge, db_web = _reload_modules()
+    db.init_db(reset=True)
+    _index_grid_fixture(pdf_extractor)
+
+    cache = db_web.ResponseCache(db.DataVersion())
+    builds = []
+
+    def build():
+        builds.append(1)
+        return db_web._dashboard_payload()
+
+    first = cache.get("/api/dashboard", build)
+    second = cache.get("/api/dashboard", build)
+    assert second is first
+    assert len(builds) == 1
+
+    assert judge.process_scan("G00001", mode="secuencia")["status"] == "OK"
+    third = cache.get("/api/dashboard", build)
+    assert len(builds) == 2
+    assert third.etag != first.etag
+    assert gzip.decompress(third.gzipped()) == third.body
+
+
+@contextmanager
+def _running_server(db_web, workers):
+    server = db_web.PooledHTTPServer(("127.0.0.1", 0), db_web.Handler, workers=workers)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server, f"http://127.0.0.1:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join(5)
+
+
+def _watch_waiters(server):
+    held = threading.Event()
+    acquire = server.acquire_waiter
+
+    def acquire_waiter():
+        acquired = acquire()
+        if acquired:
+            held.set()
+        return acquired
+
+    server.acquire_waiter = acquire_waiter
+    return held
+
+
+def _pool_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith("control-web_")]
+
+
+def test_long_polls_leave_threads_for_regular_requests(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor, judge, db_web = _reload_modules()
+    db.init_db(reset=True)
+    _index_grid_fixture(pdf_extractor)
+    since = db_web._dashboard_payload()["last_event_id"]
+
+    with _running_server(db_web, workers=2) as (server, url):
+        held = _watch_waiters(server)
+        changes = []
+        waiter = threading.Thread(
+            target=lambda: changes.append(
+                json.load(urlopen(f"{url}/api/changes?since={since}&wait=30", timeout=30))
+            )
+        )
+        waiter.start()
+        assert held.wait(5)
+
+        # El unico hilo de long-poll esta ocupado: el segundo no espera.
+        started = time.perf_counter()
+        with urlopen(f"{url}/api/changes?since={since}&wait=30", timeout=5) as response:
+            assert response.status == 204
+            assert response.headers["Retry-After"] == str(db_web.CHANGE_FEED_RETRY_AFTER)
+        with urlopen(f"{url}/api/dashboard?pages=0", timeout=5) as response:
+            assert response.status == 200
+            assert json.load(response)["last_event_id"] == since
+        assert time.perf_counter() - started < 2
+
+        assert judge.process_scan("G00001", mode="secuencia")["status"] == "OK"
+        waiter.join(10)
+        assert not waiter.is_alive()
+        assert [event["event_type"] for event in changes[0]["events"]] == ["scan_ok"]
+
+
+def test_pooled_server_serves_concurrent_requests_and_closes_cleanly(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor, judge, db_web = _reload_modules()
+    db.init_db(reset=True)
+    _index_grid_fixture(pdf_extractor)
+    since = db_web._dashboard_payload()["last_event_id"]
+
+    server = db_web.PooledHTTPServer(("127.0.0.1", 0), db_web.Handler, workers=4)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    held = _watch_waiters(server)
+    changes = []
+    waiter = threading.Thread(
+        target=lambda: changes.append(
+            json.load(urlopen(f"{url}/api/changes?since={since}&wait=30", timeout=30))
+        )
+    )
+    waiter.start()
+    assert held.wait(5)
+
+    statuses = []
+    lock = threading.Lock()
+
+    def client(path):
+        with urlopen(url + path, timeout=10) as response:
+            response.read()
+            with lock:
+                statuses.append(response.status)
+
+    paths = ["/api/dashboard?pages=0", "/api/pages?limit=2", "/api/code?value=G00002"] * 8
+    clients = [threading.Thread(target=client, args=(path,)) for path in paths]
+    for client_thread in clients:
+        client_thread.start()
+    for client_thread in clients:
+        client_thread.join(10)
+    assert statuses == [200] * len(paths)
+    assert 0 < len(_pool_threads()) <= 4
+
+    # Cerrar no espera los 30 s del long-poll: responde sin cambios y los
+    # hilos del pool terminan.
+    started = time.perf_counter()
+    server.shutdown()
+    server.server_close()
+    assert time.perf_counter() - started < 5
+    thread.join(5)
+    waiter.join(5)
+    assert changes == [db_web._changes_payload(since)]
+    assert _pool_threads() == []
+
+
+def _get(server, path, **headers):
+    conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+    try:
+        conn.request("GET", path, headers={k.replace("_", "-"): v for k, v in headers.items()})
+        response = conn.getresponse()
+        return response.status, response.headers, response.read()
+    finally:
+        conn.close()
+
+
+def _post(server, path, body, **headers):
+    conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+    try:
+        conn.request(
+            "POST", path, body=body, headers={k.replace("_", "-"): v for k, v in headers.items()}
+        )
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def test_scan_api_rejects_cross_site_posts(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor, judge, db_web = _reload_modules()
+    db.init_db(reset=True)
+    body = json.dumps({"code": "F00001"})
+
+    with _running_server(db_web, workers=2) as (server, url):
+        host = url.removeprefix("http://")
+        # Formulario de otro sitio: text/plain no necesita preflight.
+        assert _post(
+            server, "/api/scan", body, Content_Type="text/plain", Origin=url
+        )[0] == 415
+        assert _post(server, "/api/scan", body)[0] == 415
+
+        status, payload = _post(
+            server,
+            "/api/scan",
+            body,
+            Content_Type="application/json",
+            Origin="http://evil.example",
+        )
+        assert (status, payload) == (403, {"error": "Origen no permitido"})
+        assert _post(
+            server, "/api/scan", body, Content_Type="application/json", Origin="null"
+        )[0] == 403
+
+        # Misma pagina (o un cliente sin Origin): pasa los controles y llega
+        # al escaneo, deshabilitado sin --judge-url.
+        assert _post(
+            server,
+            "/api/scan",
+            body,
+            Content_Type="application/json; charset=utf-8",
+            Origin=f"http://{host}",
+        )[0] == 503
+        assert _post(server, "/api/scan", body, Content_Type="application/json")[0] == 503
+
+
+def test_pdf_file_honours_ranges_and_validators(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor, judge, db_web = _reload_modules()
+    db.init_db(reset=True)
+    content = bytes(range(256)) * 4
+    pdf_path = tmp_path / "a.pdf"
+    pdf_path.write_bytes(content)
+    os.utime(pdf_path, (1_700_000_000, 1_700_000_000))
+    pdf_extractor._write_pdf(
+        pdf_path,
+        "sig-a",
+        _pages(pdf_extractor, ["F00001"]),
+        file_stat=pdf_extractor._file_stat(pdf_path),
+    )
+    path = "/pdf-file?id=1&inline=1"
+
+    with _running_server(db_web, workers=2) as (server, _url):
+        status, headers, body = _get(server, path)
+        assert (status, body) == (200, content)
+        etag, last_modified = headers["ETag"], headers["Last-Modified"]
+        assert etag == '"sig-a"'
+        assert last_modified == "Tue, 14 Nov 2023 22:13:20 GMT"
+        assert headers["Accept-Ranges"] == "bytes"
+
+        status, headers, body = _get(server, path, Range="bytes=10-19")
+        assert (status, body) == (206, content[10:20])
+        assert headers["Content-Range"] == "bytes 10-19/1024"
+        assert headers["Content-Length"] == "10"
+
+        status, headers, body = _get(server, path, Range="bytes=2000-")
+        assert (status, body) == (416, b"")
+        assert headers["Content-Range"] == "bytes */1024"
+
+        status, headers, body = _get(server, path, If_None_Match=etag)
+        assert (status, body) == (304, b"")
+        assert headers["ETag"] == etag
+        assert _get(server, path, If_None_Match='"otra"')[0] == 200
+
+        assert _get(server, path, If_Modified_Since=last_modified)[0] == 304
+        assert _get(server, path, If_Modified_Since="Tue, 14 Nov 2023 22:13:19 GMT")[0] == 200
+        assert _get(server, path, If_Modified_Since="no es fecha")[0] == 200
+        # If-None-Match manda: con otro ETag se envia aunque la fecha coincida.
+        assert (
+            _get(server, path, If_None_Match='"otra"', If_Modified_Since=last_modified)[0]
+            == 200
+        )
+
+        # If-Range que no coincide: archivo completo en vez del rango.
+        status, headers, body = _get(server, path, Range="bytes=10-19", If_Range='"otra"')
+        assert (status, body) == (200, content)
+        assert "Content-Range" not in headers
+        for validator in (etag, last_modified):
+            status, _headers, body = _get(
+                server, path, Range="bytes=-4", If_Range=validator
+            )
+            assert (status, body) == (206, content[-4:])
+
+
+def test_pdf_file_replaced_before_reindex_gets_a_new_validator(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor, judge, db_web = _reload_modules()
+    db.init_db(reset=True)
+    pdf_path = tmp_path / "a.pdf"
+    pdf_path.write_bytes(b"A" * 1024)
+    os.utime(pdf_path, (1_700_000_000, 1_700_000_000))
+    pdf_extractor._write_pdf(
+        pdf_path,
+        "sig-a",
+        _pages(pdf_extractor, ["F00001"]),
+        file_stat=pdf_extractor._file_stat(pdf_path),
+    )
+    path = "/pdf-file?id=1"
+
+    with _running_server(db_web, workers=2) as (server, _url):
+        old_etag = _get(server, path)[1]["ETag"]
+        assert old_etag == '"sig-a"'
+
+        # Mismo tamano, otros bytes: el PDF se reemplazo pero no se reindexo.
+        new_content = b"B" * 1024
+        pdf_path.write_bytes(new_content)
+        os.utime(pdf_path, ns=(1_700_000_100_000_000_001, 1_700_000_100_000_000_001))
+
+        status, headers, body = _get(server, path, If_None_Match=old_etag)
+        assert (status, body) == (200, new_content)
+        assert headers["ETag"] == '"1024-1700000100000000001"'
+
+        # Un rango pedido con el ETag viejo no se pega sobre los bytes viejos.
+        status, headers, body = _get(
+            server, path, Range="bytes=512-", If_Range=old_etag
+        )
+        assert (status, body) == (200, new_content)
+        assert "Content-Range" not in headers
+
+        status, _headers, body = _get(
+            server, path, Range="bytes=512-", If_Range=headers["ETag"]
+        )
+        assert (status, body) == (206, new_content[512:])
+
+
+def test_gzip_and_identity_bodies_have_different_etags(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor, judge, db_web = _reload_modules()
+    db.init_db(reset=True)
+    _index_grid_fixture(pdf_extractor)
+
+    with _running_server(db_web, workers=2) as (server, _url):
+        status, plain_headers, plain = _get(server, "/api/dashboard")
+        assert status == 200
+        assert "Content-Encoding" not in plain_headers
+        status, gzip_headers, compressed = _get(
+            server, "/api/dashboard", Accept_Encoding="gzip"
+        )
+        assert status == 200
+        assert gzip_headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(compressed) == plain
+
+        plain_etag, gzip_etag = plain_headers["ETag"], gzip_headers["ETag"]
+        assert plain_etag != gzip_etag
+        assert gzip_etag == plain_etag[:-1] + '-gz"'
+
+        # Cualquiera de las dos valida; el 304 lleva el ETag de lo que se enviaria.
+        for tag in (plain_etag, gzip_etag, f'"otro", {plain_etag}'):
+            status, headers, _body = _get(
+                server, "/api/dashboard", Accept_Encoding="gzip", If_None_Match=tag
+            )
+            assert (status, headers["ETag"]) == (304, gzip_etag)
+            status, headers, _body = _get(server, "/api/dashboard", If_None_Match=tag)
+            assert (status, headers["ETag"]) == (304, plain_etag)
+        assert _get(server, "/api/dashboard", If_None_Match='"otro"')[0] == 200
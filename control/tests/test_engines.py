@@ -0,0 +1,175 @@
+import importlib
+
+import pytest
+
+from control.data.engines import PdfplumberEngine, scan_content_text
+from pdf_samples import lines, write_pdf
+
+
+def _reload_modules():
+    import control.config as config
+    import control.database.db as db
+    import control.data.engines as engines
+    import control.data.pdf_extractor as pdf_extractor
+
+    importlib.reload(config)
+    importlib.reload(db)
+    importlib.reload(engines)
+    importlib.reload(pdf_extractor)
+    return db, pdf_extractor
+
+
+# Anchos de Helvetica (milesimas de em) de los caracteres usados en _spread.
+_HELVETICA_WIDTHS = {"H": 722, "O": 778, "J": 500, "A": 667, "-": 333}
+
+
+def _spread(code):
+    # Una letra por operador: solo el analisis de layout de pdfplumber une
+    # los caracteres en una palabra.
+    parts = []
+    x = 50.0
+    for char in code:
+        parts.append(b"1 0 0 1 %.2f 700 Tm (%s) Tj" % (x, char.encode("ascii")))
+        x += _HELVETICA_WIDTHS.get(char, 556) * 12 / 1000
+    return b"BT /F1 12 Tf " + b" ".join(parts) + b" ET"
+
+
+def test_scan_content_text_reads_show_operators():
+    data = (
+        b"BT /F1 12 Tf 72 700 Td (HOJA-0001 Lote) Tj 0 -14 Td "
+        b"[(AB)-10(C1)20(23)-400(X)] TJ (a\\(b\\)c (anidado)) Tj <41424331> Tj ET"
+    )
+
+    text = scan_content_text(data)
+
+    assert "HOJA-0001 Lote" in text
+    assert "ABC123 X" in text
+    assert "a(b)c (anidado)" in text
+    assert "ABC1" in text
+
+
+class _OldPage:
+    # Hoja de pdfplumber anterior a 0.11: sin close().
+    def __init__(self):
+        self.flushed = False
+
+    def extract_text(self):
+        return "HOJA OLD-000001"
+
+    def flush_cache(self):
+        self.flushed = True
+
+
+def test_pdfplumber_text_releases_pages_without_close():
+    page = _OldPage()
+
+    assert PdfplumberEngine().text(page) == "HOJA OLD-000001"
+    assert page.flushed
+
+
+@pytest.mark.parametrize("engine", ["pdfplumber", "raw", "pypdf"])
+def test_engines_extract_the_same_codes(monkeypatch, tmp_path, engine):
+    if engine == "pypdf":
+        pytest.importorskip("pypdf")
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor = _reload_modules()
+    pdf_path = tmp_path / "lote.pdf"
+    write_pdf(
+        pdf_path,
+        [
+            lines("Lote HOJA-0001 cantidad 12", "Ref LT00000017-"),
+            lines("HOJA-0002", "HOJA-0001 repetida"),
+            lines("Sin codigos en esta hoja"),
+        ],
+    )
+
+    pages = list(pdf_extractor._iter_page_codes(str(pdf_path), engine=engine))
+
+    assert [page.codes for page in pages] == [
+        ["HOJA-0001", "LT00000017"],
+        ["HOJA-0002", "HOJA-0001"],
+        [],
+    ]
+
+
+def test_fast_engine_falls_back_to_pdfplumber_for_pages_without_codes(
+    monkeypatch, tmp_path
+):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor = _reload_modules()
+    db.init_db(reset=True)
+    pdf_path = tmp_path / "lote.pdf"
+    write_pdf(pdf_path, [lines("HOJA-0001"), _spread("HOJA-0002")])
+
+    raw = pdf_extractor.get_engine("raw")
+    with raw.open(str(pdf_path)) as pages:
+        assert pdf_extractor._extract_codes(raw.text(pages[1])) == []
+
+    assert pdf_extractor.extract_pdf(pdf_path, engine="raw")
+
+    conn = db.get_connection()
+    try:
+        rows = conn.execute("SELECT page_number, code FROM pages ORDER BY page_number").fetchall()
+        hashes = [row[0] for row in conn.execute("SELECT content_hash FROM page_cache")]
+    finally:
+        conn.close()
+    assert rows == [(1, "HOJA-0001"), (2, "HOJA-0002")]
+
+    # La cache del motor raw no se reutiliza con pdfplumber.
+    pages = list(
+        pdf_extractor._iter_page_codes(
+            str(pdf_path), page_cache=dict.fromkeys(hashes, ["X"]), engine="pdfplumber"
+        )
+    )
+    assert not any(page.cache_hit for page in pages)
+
+
+
+def test_raw_engine_rereads_pages_it_decodes_only_partially(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor = _reload_modules()
+    pdf_path = tmp_path / "lote.pdf"
+    write_pdf(
+        pdf_path,
+        [
+            lines("HOJA-0001 Lote y a 3 cajas"),
+            # Codigo suelto mas otro dibujado letra por letra.
+            lines("HOJA-0002") + b" " + _spread("HOJA-0003"),
+            # Codigo en la hoja mas otro dentro de una Form XObject.
+            (lines("HOJA-0004") + b" q /X1 Do Q", {"X1": lines("", "HOJA-0005")}),
+        ],
+    )
+
+    raw = pdf_extractor.get_engine("raw")
+    with raw.open(str(pdf_path)) as pages:
+        texts = [raw.text(page) for page in pages]
+        assert [pdf_extractor._extract_codes(text) for text in texts] == [
+            ["HOJA-0001"],
+            ["HOJA-0002"],
+            ["HOJA-0004"],
+        ]
+        assert [raw.may_miss_codes(page, text) for page, text in zip(pages, texts)] == [
+            False,
+            True,
+            True,
+        ]
+
+    pages = list(pdf_extractor._iter_page_codes(str(pdf_path), engine="raw"))
+    assert [sorted(page.codes) for page in pages] == [
+        ["HOJA-0001"],
+        ["HOJA-0002", "HOJA-0003"],
+        ["HOJA-0004", "HOJA-0005"],
+    ]
+
+
+def test_raw_engine_trusts_only_latin_fonts():
+    from control.data.engines import _latin_font
+    from pdfminer.psparser import LIT
+
+    helvetica = {"Subtype": LIT("Type1"), "BaseFont": LIT("Helvetica")}
+    assert _latin_font(helvetica)
+    assert _latin_font({**helvetica, "Encoding": LIT("WinAnsiEncoding")})
+    assert not _latin_font({**helvetica, "Encoding": {"Differences": [48, LIT("A")]}})
+    assert not _latin_font({**helvetica, "FontDescriptor": {"FontFile": object()}})
+    assert not _latin_font({"Subtype": LIT("Type0"), "Encoding": LIT("Identity-H")})
+    assert not _latin_font({"Subtype": LIT("Type3")})
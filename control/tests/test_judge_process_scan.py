@@ -22,8 +22,12 @@ def _seed_pdf(cur, file_name, file_path, signature):
 
 def _seed_page(cur, page_number, code, pdf_id, scanned=0):
     cur.execute(
-        "INSERT INTO pages (page_number, code, scanned, pdf_id) VALUES (?, ?, ?, ?)",
-        (page_number, code, scanned, pdf_id),
+        "INSERT INTO pages (page_number, code, pdf_id) VALUES (?, ?, ?)",
+        (page_number, code, pdf_id),
+    )
+    cur.execute(
+        "INSERT OR REPLACE INTO page_state (pdf_id, page_number, scanned) VALUES (?, ?, ?)",
+        (pdf_id, page_number, scanned),
     )
 
 
@@ -50,8 +54,13 @@ def test_process_scan_ok_marks_page_scanned(monkeypatch, tmp_path):
     conn = db.get_connection()
     try:
         cur = conn.cursor()
-        cur.execute("SELECT scanned FROM pages WHERE pdf_id = ? AND code = ?", (pdf_id, "ABC123"))
-        assert cur.fetchone()[0] == 1
+        cur.execute(
+            "SELECT scanned, scanned_at FROM page_state WHERE pdf_id = ? AND page_number = 1",
+            (pdf_id,),
+        )
+        scanned, scanned_at = cur.fetchone()
+        assert scanned == 1
+        assert scanned_at is not None
     finally:
         conn.close()
 
@@ -66,6 +75,28 @@ def test_process_scan_not_found(monkeypatch, tmp_path):
     assert result["message"] == "Codigo no existe en PDFs cargados"
 
 
+def test_process_scan_still_indexing(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, judge = _reload_modules()
+    db.init_db(reset=True)
+
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        pdf_id = _seed_pdf(cur, "a.pdf", "C:/a.pdf", "sig-a")
+        _seed_page(cur, 1, "IDX001", pdf_id)
+        cur.execute("UPDATE pdf_files SET indexing = 1 WHERE id = ?", (pdf_id,))
+        conn.commit()
+    finally:
+        conn.close()
+
+    assert judge.process_scan("IDX001", mode="verificacion")["status"] == "OK"
+    result = judge.process_scan("IDX002", mode="verificacion")
+    assert result["status"] == "ERROR"
+    assert result["error_type"] == "still_indexing"
+    assert "a.pdf" in result["message"]
+
+
 def test_process_scan_ambiguous_code_across_pdfs(monkeypatch, tmp_path):
     monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
     db, judge = _reload_modules()
@@ -177,3 +208,130 @@ def test_process_scan_sequence_mode_ignores_start_page_rule(monkeypatch, tmp_pat
     result = judge.process_scan("P004BB", mode="secuencia")
     assert result["status"] == "OK"
     assert result["error_type"] is None
+
+
+def test_process_scan_sees_pages_committed_by_other_connections(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, judge = _reload_modules()
+    db.init_db(reset=True)
+
+    first = judge.process_scan("LATE01", mode="secuencia")
+    assert first["message"] == "Codigo no existe en PDFs cargados"
+
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        pdf_id = _seed_pdf(cur, "late.pdf", "C:/late.pdf", "sig-late")
+        _seed_page(cur, 1, "LATE01", pdf_id, scanned=0)
+        _seed_page(cur, 2, "LATE02", pdf_id, scanned=0)
+        conn.commit()
+    finally:
+        conn.close()
+
+    second = judge.process_scan("LATE02", mode="secuencia")
+    assert second["status"] == "ERROR"
+    assert "Faltan hojas anteriores en late.pdf: 1" == second["message"]
+
+    assert judge.process_scan("LATE01", mode="secuencia")["status"] == "OK"
+    assert judge.process_scan("LATE02", mode="secuencia")["status"] == "OK"
+
+
+def _seed_batch_fixture(db):
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        pdf1 = _seed_pdf(cur, "a.pdf", "C:/a.pdf", "sig-a")
+        pdf2 = _seed_pdf(cur, "b.pdf", "C:/b.pdf", "sig-b")
+        for page in range(1, 6):
+            _seed_page(cur, page, f"BAT{page:03d}", pdf1)
+        _seed_page(cur, 1, "OTR001", pdf2)
+        _seed_page(cur, 2, "OTR002", pdf2)
+        _seed_page(cur, 3, "BAT001", pdf2)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _stored_scan_state(db):
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT pdf_id, page_number, scanned FROM page_state ORDER BY pdf_id, page_number"
+        )
+        pages = cur.fetchall()
+        cur.execute("SELECT event_type, code, page_number, details FROM events ORDER BY id")
+        events = cur.fetchall()
+    finally:
+        conn.close()
+    return pages, events
+
+
+def test_process_scans_matches_serial_process_scan(monkeypatch, tmp_path):
+    codes = [
+        "bat002", "BAT003", "BAT001", "BAT003", "NOPE01", "BAT005",
+        "OTR002", "OTR001", "OTR002", "BAT004", "BAT005",
+    ]
+    outcomes = []
+    for run, batch in enumerate((False, True)):
+        monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path / str(run)))
+        db, judge = _reload_modules()
+        db.init_db(reset=True)
+        _seed_batch_fixture(db)
+
+        if batch:
+            results = judge.process_scans(codes, mode="verificacion")
+        else:
+            results = [judge.process_scan(code, mode="verificacion") for code in codes]
+        outcomes.append((results, _stored_scan_state(db), judge.get_start_page()))
+
+    assert outcomes[1] == outcomes[0]
+    statuses = [result["status"] for result in outcomes[1][0]]
+    assert statuses.count("OK") == 5
+
+
+def test_process_scans_rolls_back_everything_on_failure(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, judge = _reload_modules()
+    db.init_db(reset=True)
+    _seed_batch_fixture(db)
+    before = _stored_scan_state(db)
+
+    try:
+        judge.process_scans(["BAT002", "BAT003", None], mode="verificacion")
+    except AttributeError:
+        pass
+    else:
+        raise AssertionError("process_scans debia fallar")
+
+    assert _stored_scan_state(db) == before
+    assert judge.get_start_page() == {}
+    assert judge.process_scan("BAT003", mode="verificacion")["status"] == "OK"
+
+
+def test_buffered_events_are_written_in_batches_after_commit(monkeypatch, tmp_path):
+    codes = ["BAT001", "BAT002", "NOPE01", "BAT002", "BAT004", "OTR001"]
+    outcomes = []
+    for run, mode in enumerate(("sync", "durable")):
+        monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path / str(run)))
+        db, judge = _reload_modules()
+        db.init_db(reset=True)
+        _seed_batch_fixture(db)
+        judge.set_event_mode(mode, flush_rows=4, flush_interval=0)
+        try:
+            results = [judge.process_scan(code, mode="verificacion") for code in codes[:3]]
+            if mode == "durable":
+                # Aun bajo el umbral: la hoja ya esta marcada, el evento no.
+                pages, events = _stored_scan_state(db)
+                assert events == []
+                assert (1, 2, 1) in pages
+            results += [judge.process_scan(code, mode="verificacion") for code in codes[3:]]
+            if mode == "durable":
+                # El cuarto evento alcanzo el umbral y se escribio el lote.
+                assert len(_stored_scan_state(db)[1]) == 4
+        finally:
+            judge.close_events()
+        outcomes.append((results, _stored_scan_state(db)))
+
+    assert outcomes[1] == outcomes[0]
+    assert len(outcomes[1][1][1]) == len(codes)
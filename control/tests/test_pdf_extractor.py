@@ -0,0 +1,647 @@
+import importlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+from pdf_samples import lines, write_pdf
+
+
+def _reload_modules():
+    import control.config as config
+    import control.database.db as db
+    import control.data.pdf_extractor as pdf_extractor
+
+    importlib.reload(config)
+    importlib.reload(db)
+    importlib.reload(pdf_extractor)
+    return db, pdf_extractor
+
+
+def _pages(pdf_extractor, *page_codes):
+    total = len(page_codes)
+    return [
+        pdf_extractor.PageCodes(index, total, codes)
+        for index, codes in enumerate(page_codes, start=1)
+    ]
+
+
+def _summaries(db):
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "SELECT details FROM events WHERE event_type = 'extract_summary' ORDER BY id"
+        )
+        return [json.loads(row[0]) for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def test_index_pdf_registers_same_and_cross_pdf_duplicates(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor = _reload_modules()
+    db.init_db(reset=True)
+
+    assert pdf_extractor._write_pdf(
+        Path("C:/a.pdf"),
+        "sig-a",
+        _pages(pdf_extractor, ["X00001", "X00002"], ["X00002", "X00003"], [], ["X00001"]),
+    )
+    assert pdf_extractor._write_pdf(
+        Path("C:/b.pdf"),
+        "sig-b",
+        _pages(pdf_extractor, ["X00002", "Y00001"], ["Y00001"]),
+    )
+    assert not pdf_extractor._write_pdf(Path("C:/b.pdf"), "sig-b", _pages(pdf_extractor))
+
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("SELECT pdf_id, page_number, code FROM pages ORDER BY rowid")
+        pages = cur.fetchall()
+        cur.execute(
+            "SELECT code, duplicate_kind, new_pdf_id, new_page_number, "
+            "existing_pdf_id, existing_page_number FROM code_duplicates ORDER BY id"
+        )
+        duplicates = cur.fetchall()
+    finally:
+        conn.close()
+
+    assert pages == [
+        (1, 1, "X00001"),
+        (1, 1, "X00002"),
+        (1, 2, "X00003"),
+        (2, 1, "X00002"),
+        (2, 1, "Y00001"),
+    ]
+    assert duplicates == [
+        ("X00002", "same_pdf", 1, 2, 1, 1),
+        ("X00001", "same_pdf", 1, 4, 1, 1),
+        ("X00002", "cross_pdf", 2, 1, 1, 1),
+        ("Y00001", "same_pdf", 2, 2, 2, 1),
+    ]
+
+    first, second = _summaries(db)
+    assert first == {
+        "pdf": "a.pdf",
+        "start_page": 1,
+        "end_page": 4,
+        "total_pages": 4,
+        "pages_processed": 4,
+        "codes_found": 5,
+        "inserted": 3,
+        "duplicates": 2,
+        "duplicates_same_pdf": 2,
+        "duplicates_cross_pdf": 0,
+        "cache_hits": 0,
+        "cache_misses": 4,
+    }
+    assert (second["inserted"], second["duplicates_same_pdf"], second["duplicates_cross_pdf"]) == (
+        2,
+        1,
+        1,
+    )
+
+
+def test_pdf_stats_follow_indexing_scans_and_reset(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor = _reload_modules()
+    import control.database.stats as stats
+    import control.logic.judge as judge
+
+    importlib.reload(judge)
+    db.init_db(reset=True)
+
+    pdf_extractor._write_pdf(
+        Path("C:/a.pdf"), "sig-a", _pages(pdf_extractor, ["S00001", "S00002"], ["S00003"])
+    )
+    pdf_extractor._write_pdf(
+        Path("C:/b.pdf"), "sig-b", _pages(pdf_extractor, ["S00001"], ["S00004"])
+    )
+    assert judge.process_scan("S00002", mode="secuencia")["status"] == "OK"
+
+    def totals():
+        conn = db.get_connection()
+        try:
+            return stats.load_totals(conn.cursor())
+        finally:
+            conn.close()
+
+    assert totals() == {
+        "total_pdfs": 2,
+        "total_codes": 5,
+        "total_pages": 4,
+        "scanned_pages": 1,
+        "total_duplicates": 1,
+        "duplicate_counts": {"cross_pdf": 1},
+    }
+
+    # Reindexar a.pdf borra el duplicado registrado por b.pdf.
+    pdf_extractor._write_pdf(Path("C:/a.pdf"), "sig-a2", _pages(pdf_extractor, ["S00009"]))
+    assert totals()["total_duplicates"] == 0
+    assert totals()["total_codes"] == 3
+
+    judge.reset_scans()
+    assert totals()["scanned_pages"] == 0
+
+
+def test_index_pdf_extracts_without_holding_the_write_lock(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor = _reload_modules()
+    import control.logic.judge as judge
+
+    importlib.reload(judge)
+    db.init_db(reset=True)
+    pdf_extractor._write_pdf(Path("C:/a.pdf"), "sig-a", _pages(pdf_extractor, ["L00001"]))
+    pdf_extractor._write_pdf(
+        Path("C:/big.pdf"), "sig-big", _pages(pdf_extractor, ["L00002"])
+    )
+    scans = []
+
+    def slow_pages():
+        # Mientras se "extrae" big.pdf (reindexado), otra estacion escanea
+        # a.pdf sin esperar el lock.
+        for page in _pages(pdf_extractor, ["L00003"], ["L00004"]):
+            conn = db.get_connection()
+            conn.execute("PRAGMA busy_timeout = 0")
+            try:
+                conn.execute(
+                    "INSERT INTO meta (key, value) VALUES (?, 'x')", (f"p{page.page_index}",)
+                )
+                conn.commit()
+            finally:
+                conn.close()
+            scans.append(judge.process_scan("L00001", mode="secuencia")["status"])
+            yield page
+
+    assert pdf_extractor._write_pdf(Path("C:/big.pdf"), "sig-big2", slow_pages())
+
+    assert scans == ["OK", "ERROR"]
+    conn = db.get_connection()
+    try:
+        codes = conn.execute(
+            "SELECT p.code FROM pages p JOIN pdf_files f ON f.id = p.pdf_id "
+            "WHERE f.file_name = 'big.pdf' ORDER BY p.code"
+        ).fetchall()
+    finally:
+        conn.close()
+    assert codes == [("L00003",), ("L00004",)]
+
+
+def test_progressive_indexing_publishes_pages_in_order(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor = _reload_modules()
+    import control.logic.judge as judge
+
+    importlib.reload(judge)
+    db.init_db(reset=True)
+    pdf_extractor._write_pdf(Path("C:/a.pdf"), "sig-a", _pages(pdf_extractor, ["PRA001"]))
+    verdicts = []
+
+    def pages_with_scans():
+        pages = _pages(
+            pdf_extractor, ["PRB001", "PRA001"], ["PRB002", "PRB001"], ["PRB003", "PRA001"]
+        )
+        for page in pages:
+            if page.page_index == 2:
+                # La hoja 1 ya se publico; la 3 todavia no.
+                for code in ("PRB001", "PRB003"):
+                    result = judge.process_scan(code, mode="secuencia")
+                    verdicts.append((result["status"], result["error_type"]))
+            yield page
+
+    assert pdf_extractor._write_pdf(
+        Path("C:/b.pdf"), "sig-b", pages_with_scans(), publish_seconds=0
+    )
+
+    assert verdicts == [("OK", None), ("ERROR", "still_indexing")]
+    assert judge.process_scan("PRB003", mode="secuencia")["status"] == "ERROR"
+    assert judge.process_scan("PRB009", mode="secuencia")["error_type"] is None
+    summary = _summaries(db)[-1]
+    assert summary["inserted"] == 4
+    assert summary["duplicates_same_pdf"] == 2
+    assert summary["duplicates_cross_pdf"] == 2
+
+    conn = db.get_connection()
+    try:
+        duplicates = conn.execute(
+            "SELECT code, new_page_number, existing_pdf_id, existing_page_number "
+            "FROM code_duplicates ORDER BY id"
+        ).fetchall()
+        indexing = conn.execute("SELECT SUM(indexing) FROM pdf_files").fetchone()[0]
+    finally:
+        conn.close()
+    assert duplicates == [
+        ("PRA001", 1, 1, 1),
+        ("PRB001", 2, 2, 1),
+        ("PRA001", 3, 1, 1),
+        ("PRA001", 3, 2, 1),
+    ]
+    assert indexing == 0
+
+
+def test_failed_progressive_indexing_discards_published_pages(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor = _reload_modules()
+    import control.logic.judge as judge
+
+    importlib.reload(judge)
+    db.init_db(reset=True)
+    pdf_extractor._write_pdf(Path("C:/a.pdf"), "sig-a", _pages(pdf_extractor, ["PRC001"]))
+    path = Path("C:/c.pdf")
+    verdicts = []
+
+    def interrupted():
+        yield from _pages(pdf_extractor, ["PRC001"], ["PRC002"], ["PRC003"])[:2]
+        # Las hojas 1 y 2 ya se publicaron; la 3 no.
+        verdicts.append(judge.process_scan("PRC003", mode="secuencia")["error_type"])
+        raise RuntimeError("extraccion cortada")
+
+    with pytest.raises(RuntimeError):
+        pdf_extractor._write_pdf(path, "sig-c", interrupted(), publish_seconds=0)
+
+    assert verdicts == ["still_indexing"]
+    # Sin hojas a medias ni "indexando" para siempre: el codigo no existe.
+    result = judge.process_scan("PRC002", mode="secuencia")
+    assert (result["status"], result["error_type"]) == ("ERROR", None)
+    conn = db.get_connection()
+    try:
+        files = conn.execute("SELECT file_name, indexing FROM pdf_files").fetchall()
+        codes = [row[0] for row in conn.execute("SELECT code FROM pages ORDER BY code")]
+        duplicates = conn.execute("SELECT COUNT(*) FROM code_duplicates").fetchone()[0]
+        stats = conn.execute("SELECT COUNT(*) FROM pdf_stats").fetchone()[0]
+        discarded = conn.execute(
+            "SELECT details FROM events WHERE event_type = 'extract_discarded'"
+        ).fetchall()
+        assert not pdf_extractor._is_cached(conn.cursor(), str(path), "sig-c")
+    finally:
+        conn.close()
+    assert files == [("a.pdf", 0)]
+    assert codes == ["PRC001"]
+    assert (duplicates, stats) == (0, 1)
+    assert [json.loads(row[0]) for row in discarded] == [{"files": ["c.pdf"]}]
+
+    assert pdf_extractor._write_pdf(
+        path, "sig-c", _pages(pdf_extractor, ["PRC001"], ["PRC002"], ["PRC003"])
+    )
+    conn = db.get_connection()
+    try:
+        codes = [row[0] for row in conn.execute("SELECT code FROM pages ORDER BY code")]
+        indexing = conn.execute("SELECT indexing FROM pdf_files").fetchall()
+    finally:
+        conn.close()
+    assert codes == ["PRC001", "PRC001", "PRC002", "PRC003"]
+    assert indexing == [(0,), (0,)]
+
+
+def test_discard_interrupted_indexing_keeps_running_ones(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor = _reload_modules()
+    db.init_db(reset=True)
+
+    # Lo que deja un proceso que murio publicando (o que sigue publicando).
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        for name, code in (("muerto.pdf", "PRM001"), ("vivo.pdf", "PRV001")):
+            cur.execute(
+                "INSERT INTO pdf_files (file_name, file_path, signature, indexing) "
+                "VALUES (?, ?, ?, 1)",
+                (name, f"C:/{name}", f"sig-{name}"),
+            )
+            live_id = cur.lastrowid
+            cur.execute(
+                "INSERT INTO pages (page_number, code, pdf_id) VALUES (1, ?, ?)",
+                (code, live_id),
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+    lock = pdf_extractor._lock_indexing(live_id)
+    try:
+        assert pdf_extractor.discard_interrupted_indexing() == ["C:/muerto.pdf"]
+        # Otro escritor no le pisa las hojas al que sigue publicando.
+        assert not pdf_extractor._write_pdf(
+            Path("C:/vivo.pdf"), "sig-vivo.pdf", _pages(pdf_extractor, ["PRV009"])
+        )
+        assert pdf_extractor.discard_interrupted_indexing() == []
+    finally:
+        os.close(lock)
+
+    conn = db.get_connection()
+    try:
+        codes = [row[0] for row in conn.execute("SELECT code FROM pages ORDER BY code")]
+    finally:
+        conn.close()
+    assert codes == ["PRV001"]
+    assert pdf_extractor.discard_interrupted_indexing() == ["C:/vivo.pdf"]
+    assert list((tmp_path / "indexing").glob("*.lock")) == []
+
+
+def _write_lot(tmp_path):
+    # Tres PDFs de 7 hojas con duplicados dentro de cada PDF y entre PDFs.
+    paths = []
+    for name in ("a", "b", "c"):
+        page_codes = [[f"{name.upper()}{page:05d}"] for page in range(1, 8)]
+        page_codes[1].append("SHARED01")
+        page_codes[4].append(f"{name.upper()}00001")
+        page_codes[6].append("SHARED02" if name != "a" else "SHARED01")
+        path = tmp_path / f"{name}.pdf"
+        write_pdf(path, [lines(*codes) for codes in page_codes])
+        paths.append(path)
+    return paths
+
+
+def _index_snapshot(db):
+    conn = db.get_connection()
+    try:
+        pages = conn.execute(
+            """
+            SELECT f.file_name, p.page_number, p.code
+            FROM pages p JOIN pdf_files f ON f.id = p.pdf_id
+            ORDER BY f.file_name, p.page_number, p.code
+            """
+        ).fetchall()
+        duplicates = conn.execute(
+            """
+            SELECT d.code, d.duplicate_kind, n.file_name, d.new_page_number,
+                e.file_name, d.existing_page_number
+            FROM code_duplicates d
+            JOIN pdf_files n ON n.id = d.new_pdf_id
+            JOIN pdf_files e ON e.id = d.existing_pdf_id
+            ORDER BY d.id
+            """
+        ).fetchall()
+    finally:
+        conn.close()
+    return pages, duplicates, _summaries(db)
+
+
+@pytest.mark.parametrize("publish_seconds", [None, 0.0])
+def test_extract_pdfs_gives_the_same_index_with_any_worker_count(
+    monkeypatch, tmp_path, publish_seconds
+):
+    # None: un proceso por PDF; 0.0 (progresivo): las hojas de cada PDF se
+    # reparten en tramos de 2 entre los procesos.
+    paths = _write_lot(tmp_path)
+    snapshots = []
+    for workers in (1, 2):
+        monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path / f"workers_{workers}"))
+        db, pdf_extractor = _reload_modules()
+        monkeypatch.setattr(pdf_extractor, "PARALLEL_CHUNK_PAGES", 2)
+        db.init_db(reset=True)
+        assert pdf_extractor.extract_pdfs(
+            paths, workers=workers, engine="raw", publish_seconds=publish_seconds
+        ) == [True, True, True]
+        snapshots.append(_index_snapshot(db))
+
+    pages, duplicates, summaries = snapshots[0]
+    assert len(pages) == 8 + 9 + 9
+    assert {kind for _code, kind, *_rest in duplicates} == {"same_pdf", "cross_pdf"}
+    assert [summary["pdf"] for summary in summaries] == ["a.pdf", "b.pdf", "c.pdf"]
+    assert snapshots[1] == snapshots[0]
+
+
+def test_extract_pdfs_writes_in_input_order_whatever_finishes_first(monkeypatch, tmp_path):
+    paths = []
+    for name in ("a", "b", "c"):
+        path = tmp_path / f"{name}.pdf"
+        path.write_bytes(b"%PDF " + name.encode())
+        paths.append(path)
+    codes = {
+        "a.pdf": [["SHARED01"], ["A00002"]],
+        "b.pdf": [["B00001"], ["SHARED01", "SHARED02"]],
+        "c.pdf": [["SHARED02"], ["SHARED01"]],
+    }
+
+    def run(finish_order):
+        progress = []
+
+        def extract_all_pages(path_text, _page_cache, _engine):
+            name = Path(path_text).name
+            position = finish_order.index(name)
+            # Cada extraccion termina despues de que se informo la anterior.
+            deadline = time.monotonic() + 5
+            while position and finish_order[position - 1] not in progress:
+                assert time.monotonic() < deadline
+                time.sleep(0.005)
+            return _pages(pdf_extractor, *codes[name])
+
+        monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path / "_".join(finish_order)))
+        db, pdf_extractor = _reload_modules()
+        monkeypatch.setattr(
+            pdf_extractor, "_process_pool", lambda workers: ThreadPoolExecutor(workers)
+        )
+        monkeypatch.setattr(pdf_extractor, "_extract_all_pages", extract_all_pages)
+        db.init_db(reset=True)
+        results = pdf_extractor.extract_pdfs(
+            paths,
+            workers=3,
+            progress_callback=lambda path_text, processed, total: progress.append(
+                Path(path_text).name
+            ),
+        )
+        assert results == [True, True, True]
+        assert progress == finish_order
+        return _index_snapshot(db)
+
+    in_order = run(["a.pdf", "b.pdf", "c.pdf"])
+    reversed_order = run(["c.pdf", "b.pdf", "a.pdf"])
+    assert reversed_order == in_order
+    duplicates = in_order[1]
+    assert duplicates == [
+        ("SHARED01", "cross_pdf", "b.pdf", 2, "a.pdf", 1),
+        ("SHARED02", "cross_pdf", "c.pdf", 1, "b.pdf", 2),
+        ("SHARED01", "cross_pdf", "c.pdf", 2, "a.pdf", 1),
+        ("SHARED01", "cross_pdf", "c.pdf", 2, "b.pdf", 2),
+    ]
+
+
+def test_extract_pdf_hashes_only_files_whose_stat_changed(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor = _reload_modules()
+    db.init_db(reset=True)
+    paths = [tmp_path / f"lote_{index}.pdf" for index in range(3)]
+    for index, path in enumerate(paths):
+        path.write_bytes(b"%PDF lote " + bytes([index]))
+        os.utime(path, ns=(1_000_000_000_000, 1_000_000_000_000))
+
+    hashed = []
+    file_signature = pdf_extractor._file_signature
+
+    def counting_signature(path):
+        hashed.append(path.name)
+        return file_signature(path)
+
+    monkeypatch.setattr(pdf_extractor, "_file_signature", counting_signature)
+    monkeypatch.setattr(
+        pdf_extractor,
+        "_iter_page_codes",
+        lambda path_text, **_kwargs: iter(
+            _pages(pdf_extractor, [f"LOTE{Path(path_text).stem[-1]}00001"])
+        ),
+    )
+    # Los procesos del pool (spawn) no verian el reemplazo de arriba.
+    monkeypatch.setattr(
+        pdf_extractor, "_process_pool", lambda workers: ThreadPoolExecutor(workers)
+    )
+
+    assert pdf_extractor.extract_pdfs(paths, workers=2) == [True, True, True]
+    assert sorted(hashed) == ["lote_0.pdf", "lote_1.pdf", "lote_2.pdf"]
+
+    # Recarga sin cambios: ni un hash.
+    hashed.clear()
+    assert pdf_extractor.extract_pdfs(paths, workers=2) == [False, False, False]
+    assert not pdf_extractor.extract_pdf(paths[0])
+    assert hashed == []
+
+    # Solo cambia el mtime: se hashea una vez y se guarda la nueva huella.
+    os.utime(paths[1], ns=(2_000_000_000_000, 2_000_000_000_000))
+    assert not pdf_extractor.extract_pdf(paths[1])
+    assert not pdf_extractor.extract_pdf(paths[1])
+    assert hashed == ["lote_1.pdf"]
+
+    # Contenido nuevo con el mismo tamano: mtime distinto, se reindexa.
+    hashed.clear()
+    paths[2].write_bytes(b"%PDF lote \x09")
+    os.utime(paths[2], ns=(3_000_000_000_000, 3_000_000_000_000))
+    assert pdf_extractor.extract_pdfs(paths) == [False, False, True]
+    assert hashed == ["lote_2.pdf"]
+
+    # Archivo recien modificado: no se confia en su huella todavia.
+    hashed.clear()
+    os.utime(paths[0])
+    assert not pdf_extractor.extract_pdf(paths[0])
+    assert not pdf_extractor.extract_pdf(paths[0])
+    assert hashed == ["lote_0.pdf", "lote_0.pdf"]
+
+
+def _reference_extract_codes(text):
+    # Implementacion original (token por token), referencia del tokenizador.
+    import re
+
+    seen = set()
+    codes = []
+    for token in re.findall(r"\b[A-Z0-9][A-Z0-9\-]{5,}\b", (text or "").upper()):
+        code = token.strip().upper().strip("-")
+        if len(code) < 6 or not any(char.isdigit() for char in code) or code in seen:
+            continue
+        seen.add(code)
+        codes.append(code)
+    return codes
+
+
+def _write_form_pdf(path, codes, mtime_s):
+    # Mismo content stream en todas las hojas: el texto esta en la Form
+    # XObject de cada una.
+    write_pdf(path, [(b"q /X1 Do Q", {"X1": lines(code)}) for code in codes])
+    os.utime(path, ns=(mtime_s * 10**9, mtime_s * 10**9))
+
+
+def _page_rows(db):
+    conn = db.get_connection()
+    try:
+        return conn.execute(
+            "SELECT page_number, code FROM pages ORDER BY page_number, code"
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("engine", ["pdfplumber", "raw", "pypdf"])
+def test_page_cache_key_covers_form_xobjects(monkeypatch, tmp_path, engine):
+    if engine == "pypdf":
+        pytest.importorskip("pypdf")
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor = _reload_modules()
+    db.init_db(reset=True)
+    pdf_path = tmp_path / "formas.pdf"
+    _write_form_pdf(pdf_path, ["AAA001", "BBB002", "CCC003"], 1_000)
+    assert pdf_extractor.extract_pdf(pdf_path, engine=engine)
+
+    _write_form_pdf(pdf_path, ["AAA001", "ZZZ002", "CCC003"], 2_000)
+    assert pdf_extractor.extract_pdf(pdf_path, engine=engine)
+
+    assert _page_rows(db) == [(1, "AAA001"), (2, "ZZZ002"), (3, "CCC003")]
+    summary = _summaries(db)[-1]
+    assert (summary["cache_hits"], summary["cache_misses"]) == (2, 1)
+    assert summary["duplicates"] == 0
+
+
+def test_reindex_reuses_cached_codes_of_moved_and_unchanged_pages(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor = _reload_modules()
+    db.init_db(reset=True)
+    pdf_path = tmp_path / "lote.pdf"
+    first = lines("PCA001")
+    second = lines("PCB002 PCA001")
+    write_pdf(pdf_path, [first, second, lines("PCC003"), lines("PCD004")])
+    os.utime(pdf_path, ns=(10**12, 10**12))
+    assert pdf_extractor.extract_pdf(pdf_path)
+    summary = _summaries(db)[-1]
+    assert (summary["cache_hits"], summary["cache_misses"]) == (0, 4)
+
+    # Hojas 1 y 2 intercambiadas, la 3 editada y la 4 igual.
+    write_pdf(pdf_path, [second, first, lines("PCE005"), lines("PCD004")])
+    os.utime(pdf_path, ns=(2 * 10**12, 2 * 10**12))
+    assert pdf_extractor.extract_pdf(pdf_path)
+
+    summary = _summaries(db)[-1]
+    assert (summary["cache_hits"], summary["cache_misses"]) == (3, 1)
+    assert _page_rows(db) == [(1, "PCA001"), (1, "PCB002"), (3, "PCE005"), (4, "PCD004")]
+    conn = db.get_connection()
+    try:
+        duplicates = conn.execute(
+            "SELECT code, duplicate_kind, new_page_number, existing_page_number "
+            "FROM code_duplicates"
+        ).fetchall()
+        cached = conn.execute(
+            "SELECT page_number, codes FROM page_cache ORDER BY page_number"
+        ).fetchall()
+    finally:
+        conn.close()
+    assert duplicates == [("PCA001", "same_pdf", 2, 1)]
+    assert [(page, json.loads(codes)) for page, codes in cached] == [
+        (1, ["PCB002", "PCA001"]),
+        (2, ["PCA001"]),
+        (3, ["PCE005"]),
+        (4, ["PCD004"]),
+    ]
+
+
+def test_extract_codes_matches_reference_on_random_text():
+    import random
+
+    from control.data.pdf_extractor import _extract_codes
+
+    # Letras, digitos y guiones mas separadores y caracteres de palabra que
+    # no entran en el patron (acentos, "_", digitos no ASCII, "ß" -> "SS").
+    alphabet = (
+        "ABCDEF0123456789abcz-" * 4
+        + "--- \n\t.,;:/()_ÉéñßıŉﬁÀ²٣"
+    )
+    rng = random.Random(20240519)
+    samples = [
+        "",
+        "ABC123 abc123 ABC-123 ABCDEF ABC12 ABC123--- -ABC123-",
+        "HOJA-0001_ HOJA-0001-É ÉHOJA0001 straße1 ﬁle12345 A1-----ß",
+    ]
+    for _ in range(3000):
+        samples.append("".join(rng.choice(alphabet) for _ in range(rng.randint(0, 120))))
+    # Paginas densas con codigos repetidos, como las de los PDFs reales.
+    for _ in range(20):
+        samples.append(
+            " ".join(
+                rng.choice(["LOTE-", "AB", "X", ""]) + str(rng.randint(0, 99999))
+                + rng.choice(["", "-", "--", "_", "é"])
+                for _ in range(500)
+            )
+        )
+
+    for text in samples:
+        assert _extract_codes(text) == _reference_extract_codes(text), text
@@ -0,0 +1,69 @@
+import csv
+import importlib
+import io
+import sqlite3
+
+import pytest
+
+
+def _reload_modules():
+    import control.config as config
+    import control.database.db as db
+    import control.reporting as reporting
+
+    importlib.reload(config)
+    importlib.reload(db)
+    importlib.reload(reporting)
+    return db, reporting
+
+
+def test_audit_csv_chunks_stream_every_row(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, reporting = _reload_modules()
+    db.init_db(reset=True)
+
+    conn = db.get_connection()
+    try:
+        conn.executemany(
+            "INSERT INTO events (event_type, code) VALUES (?, ?)",
+            [("scan_ok", f"CODE{index:04d}") for index in range(500)],
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+    chunks = list(reporting.iter_audit_csv_chunks(chunk_size=1024))
+    assert len(chunks) > 1
+    assert all(len(chunk) < 2048 for chunk in chunks)
+
+    rows = list(csv.DictReader(io.StringIO(b"".join(chunks).decode("utf-8"))))
+    assert list(rows[0]) == reporting._fieldnames()
+    assert rows[0]["section"] == "summary"
+    assert rows[0]["total_events"] == "500"
+    events = [row for row in rows if row["section"] == "event"]
+    assert len(events) == 500
+    assert events[0]["code"] == "CODE0499"
+
+    exported = reporting.export_audit_csv(tmp_path / "audit.csv")
+    exported_rows = list(csv.DictReader(exported.open(encoding="utf-8", newline="")))
+    assert len(exported_rows) == len(rows)
+
+
+def test_audit_rows_stream_from_a_read_only_connection(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, reporting = _reload_modules()
+    db.init_db(reset=True)
+    opened = []
+    get_connection = reporting.get_connection
+
+    def recording_connection(**kwargs):
+        conn = get_connection(**kwargs)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(reporting, "get_connection", recording_connection)
+    rows = reporting.iter_audit_rows()
+    assert next(rows)["section"] == "summary"
+    with pytest.raises(sqlite3.OperationalError):
+        opened[0].execute("INSERT INTO events (event_type) VALUES ('scan_ok')")
+    assert list(rows) == []
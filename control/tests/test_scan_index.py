@@ -0,0 +1,240 @@
+import importlib
+from pathlib import Path
+
+from control.logic.scan_index import PageBitmap, ScanIndex
+
+
+def _reload_modules():
+    import control.config as config
+    import control.database.db as db
+    import control.logic.judge as judge
+
+    importlib.reload(config)
+    importlib.reload(db)
+    importlib.reload(judge)
+    return db, judge
+
+
+def test_page_bitmap_missing_returns_first_pages_and_total():
+    bitmap = PageBitmap()
+    for page_number in range(1, 31):
+        bitmap.pages |= 1 << page_number
+    bitmap.mark_scanned(1)
+    bitmap.mark_scanned(5)
+    bitmap.mark_scanned(99)
+
+    shown, total = bitmap.missing(1, 20, limit=3)
+
+    assert shown == [2, 3, 4]
+    assert total == 17
+    assert bitmap.missing(6, 6, limit=3) == ([], 0)
+    assert bitmap.first_page() == 1
+    assert not bitmap.scanned & (1 << 99)
+
+
+def test_page_bitmaps_resync_from_page_state(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, judge = _reload_modules()
+    db.init_db(reset=True)
+
+    conn = db.get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(
+            "INSERT INTO pdf_files (file_name, file_path, signature) VALUES (?, ?, ?)",
+            ("a.pdf", "C:/a.pdf", "sig-a"),
+        )
+        pdf_id = cur.lastrowid
+        cur.executemany(
+            "INSERT INTO pages (page_number, code, pdf_id) VALUES (?, ?, ?)",
+            [(1, "BIT001", pdf_id), (2, "BIT002", pdf_id), (3, "BIT003", pdf_id)],
+        )
+        conn.commit()
+        # Los mapas de bits viven solo en memoria.
+        assert not conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'page_bitmaps'"
+        ).fetchall()
+    finally:
+        conn.close()
+
+    assert judge.process_scan("BIT001", mode="secuencia")["status"] == "OK"
+    index = judge._SCAN_INDEX
+    assert index._bitmaps[pdf_id] == PageBitmap(0b1110, 0b0010)
+
+    # Escaneo hecho por otra estacion: al refrescar se toma de page_state.
+    other = ScanIndex()
+    try:
+        other.refresh()
+        other.mark_scanned(other.conn.cursor(), pdf_id, 2)
+        other.conn.commit()
+    finally:
+        other.close()
+
+    result = judge.process_scan("BIT003", mode="secuencia")
+    assert result["status"] == "OK"
+    assert index._bitmaps[pdf_id] == PageBitmap(0b1110, 0b1110)
+
+
+def _index_state(index):
+    return (
+        {code: sorted(map(tuple, rows)) for code, rows in index._codes.items()},
+        {key: sorted(map(tuple, rows)) for key, rows in index._page_rows.items()},
+        {pdf_id: (bitmap.pages, bitmap.scanned) for pdf_id, bitmap in index._bitmaps.items()},
+        dict(index._file_names),
+        index.indexing_files(),
+    )
+
+
+def _fresh_state():
+    fresh = ScanIndex()
+    try:
+        fresh.refresh()
+        return _index_state(fresh)
+    finally:
+        fresh.close()
+
+
+def test_refresh_reads_only_changes_from_other_connections(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, judge = _reload_modules()
+    import control.config as config
+    import control.data.pdf_extractor as pdf_extractor
+
+    importlib.reload(pdf_extractor)
+    db.init_db(reset=True)
+
+    codes_by_pdf = {
+        "a": [["INA001"], ["INA002"], ["INA003"]],
+        "b": [["INB001"], ["INB002", "INA002"]],
+        "c": [["INC001"], ["INC002"], ["INC003"]],
+    }
+    indexed = {}
+
+    def iter_page_codes(path_text, **_kwargs):
+        stem = Path(path_text).stem
+        pages = codes_by_pdf[stem]
+        for page_index, codes in enumerate(pages, start=1):
+            yield pdf_extractor.PageCodes(page_index, len(pages), codes)
+            # Lo que ve el juez mientras se publica el resto.
+            indexed.setdefault(stem, []).append(judge.process_scan(codes[0])["status"])
+
+    monkeypatch.setattr(pdf_extractor, "_iter_page_codes", iter_page_codes)
+
+    def write(stem, data):
+        path = config.PDF_DIR / f"{stem}.pdf"
+        path.write_bytes(data)
+        return path
+
+    pdf_extractor.extract_pdfs([write("a", b"%PDF a"), write("b", b"%PDF b")])
+    judge.load_index()
+    index = judge._SCAN_INDEX
+    loads = []
+    load = ScanIndex._load
+    monkeypatch.setattr(
+        ScanIndex, "_load", lambda self: loads.append(self is index) or load(self)
+    )
+
+    # Otra estacion escanea y luego reinicia.
+    other = ScanIndex()
+    try:
+        other.refresh()
+        pdf_b = other.lookup("INB001")[0][0]
+        other.mark_scanned(other.conn.cursor(), pdf_b, 1)
+        other.conn.commit()
+        judge.load_index()
+        assert index.lookup("INB001")[0][2] == 1
+        assert _index_state(index) == _fresh_state()
+
+        other.refresh()
+        other.reset_scans(other.conn.cursor())
+        other.conn.commit()
+        judge.load_index()
+        assert index.lookup("INB001")[0][2] == 0
+        assert _index_state(index) == _fresh_state()
+    finally:
+        other.close()
+
+    # Reindexado de a.pdf con otro contenido y c.pdf publicado hoja a hoja.
+    codes_by_pdf["a"] = [["INA009"], ["INA002"]]
+    pdf_extractor.extract_pdf(write("a", b"%PDF a v2"))
+    judge.load_index()
+    assert index.lookup("INA001") == []
+    assert _index_state(index) == _fresh_state()
+
+    pdf_extractor.extract_pdf(write("c", b"%PDF c"), publish_seconds=0)
+    # Cada hoja publicada ya se puede escanear antes de que termine el PDF.
+    assert indexed["c"] == ["OK", "OK", "OK"]
+    judge.load_index()
+    assert index.indexing_files() == []
+    assert _index_state(index) == _fresh_state()
+
+    assert True not in loads
+
+
+def test_classify_scan_error_does_not_refresh_the_index(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, judge = _reload_modules()
+    db.init_db(reset=True)
+    judge.load_index()
+    index = judge._SCAN_INDEX
+    version = index._data_version
+
+    judge.classify_scan_error("already_scanned", "otro", code="CLS001", note="x")
+    judge.load_index()
+
+    assert index._data_version == version
+    conn = db.get_connection()
+    try:
+        rows = conn.execute("SELECT event_type, code FROM events").fetchall()
+    finally:
+        conn.close()
+    assert rows == [("scan_resolution_already_scanned", "CLS001")]
+
+
+def test_refresh_reloads_after_a_reset_from_another_connection(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, judge = _reload_modules()
+    import control.data.pdf_extractor as pdf_extractor
+
+    importlib.reload(pdf_extractor)
+    db.init_db(reset=True)
+
+    def write(name, *page_codes):
+        pdf_extractor._write_pdf(
+            Path(f"C:/{name}.pdf"),
+            f"sig-{name}",
+            [
+                pdf_extractor.PageCodes(page, len(page_codes), codes)
+                for page, codes in enumerate(page_codes, start=1)
+            ],
+        )
+
+    def scan(pages):
+        other = ScanIndex()
+        try:
+            other.refresh()
+            for page in pages:
+                other.mark_scanned(other.conn.cursor(), 1, page)
+            other.conn.commit()
+        finally:
+            other.close()
+
+    write("a", ["RSA001"], ["RSA002"], ["RSA003"])
+    scan([1, 2])
+    index = ScanIndex()
+    try:
+        index.refresh()
+        assert index.lookup("RSA002") == [(1, 2, 1, "a.pdf")]
+
+        # Otra conexion reinicia la base: el PDF nuevo reutiliza el id 1 con la
+        # misma generation, y el seq vuelve a pasar al que tenia el indice.
+        db.init_db(reset=True)
+        write("z", ["RSZ001"], ["RSZ002"], ["RSZ003"], ["RSZ004"])
+        scan([1, 3, 4])
+
+        index.refresh()
+        assert index.lookup("RSA002") == []
+        assert index.lookup("RSZ002") == [(1, 2, 0, "z.pdf")]
+        assert _index_state(index) == _fresh_state()
+    finally:
+        index.close()
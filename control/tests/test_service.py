@@ -0,0 +1,114 @@
+import http.client
+import importlib
+import threading
+from pathlib import Path
+
+import pytest
+
+
+def _reload_modules():
+    import control.config as config
+    import control.database.db as db
+    import control.data.pdf_extractor as pdf_extractor
+    import control.logic.judge as judge
+    import control.service as service
+
+    importlib.reload(config)
+    importlib.reload(db)
+    importlib.reload(pdf_extractor)
+    importlib.reload(judge)
+    importlib.reload(service)
+    return db, pdf_extractor, judge, service
+
+
+def test_service_serializes_scans_from_several_clients(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor, judge, service = _reload_modules()
+    db.init_db(reset=True)
+    pages = 40
+    codes = [f"SRV{page:04d}" for page in range(1, pages + 1)]
+    pdf_extractor._write_pdf(
+        Path("C:/a.pdf"),
+        "sig-a",
+        [pdf_extractor.PageCodes(page, pages, [code]) for page, code in enumerate(codes, 1)],
+    )
+
+    server = service.JudgeServer(("127.0.0.1", 0), service.JudgeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        client = service.JudgeClient(url)
+        verdicts = []
+        lock = threading.Lock()
+
+        def station():
+            results = [client.process_scan(code, mode="secuencia") for code in codes]
+            with lock:
+                verdicts.extend(results)
+
+        stations = [threading.Thread(target=station) for _ in range(3)]
+        for station_thread in stations:
+            station_thread.start()
+        for station_thread in stations:
+            station_thread.join()
+
+        ok_pages = sorted(r["page_number"] for r in verdicts if r["status"] == "OK")
+        assert ok_pages == list(range(1, pages + 1))
+
+        # El inicio de lote vive en el servicio y lo comparten las estaciones.
+        client.reset_scans()
+        other = service.JudgeClient(url)
+        other.set_page_range(5)
+        assert client.process_scan("SRV0005")["status"] == "OK"
+        assert other.get_start_page() == {"1": 5}
+        assert other.process_scan("SRV0003")["error_type"] == "other_lot"
+
+        with pytest.raises(service.JudgeServiceError):
+            client.classify_scan_error("already_scanned", "no_existe")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_client_reports_unreachable_service():
+    from control.service import JudgeClient, JudgeServiceError
+
+    client = JudgeClient("http://127.0.0.1:9")
+    with pytest.raises(JudgeServiceError):
+        client.process_scan("X00001")
+
+
+def _post_with_length(server, path, length):
+    conn = http.client.HTTPConnection(*server.server_address, timeout=5)
+    try:
+        conn.putrequest("POST", path)
+        conn.putheader("Content-Type", "application/json")
+        conn.putheader("Content-Length", length)
+        conn.endheaders()
+        return conn.getresponse().status
+    finally:
+        conn.close()
+
+
+def test_invalid_content_length_is_rejected_without_reading(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    db, pdf_extractor, judge, service = _reload_modules()
+    db.init_db(reset=True)
+    import control.db_web as db_web
+
+    importlib.reload(db_web)
+    servers = [
+        (service.JudgeServer(("127.0.0.1", 0), service.JudgeHandler), "/scan"),
+        (db_web.PooledHTTPServer(("127.0.0.1", 0), db_web.Handler, workers=2), "/api/scan"),
+    ]
+    for server, path in servers:
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            # Con -1 el hilo quedaba leyendo hasta que el cliente cerrara.
+            for length in ("-1", "abc", "1e3", "²"):
+                assert _post_with_length(server, path, length) == 400
+        finally:
+            server.shutdown()
+            server.server_close()
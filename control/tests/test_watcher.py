@@ -0,0 +1,163 @@
+import importlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+
+def _reload_modules():
+    import control.config as config
+    import control.database.db as db
+    import control.data.pdf_extractor as pdf_extractor
+    import control.data.watcher as watcher
+
+    importlib.reload(config)
+    importlib.reload(db)
+    importlib.reload(pdf_extractor)
+    importlib.reload(watcher)
+    return config, db, pdf_extractor, watcher
+
+
+def _fake_pages(pdf_extractor):
+    # Un codigo por archivo, derivado del nombre; "roto" falla como un PDF danado.
+    def iter_page_codes(path_text, **_kwargs):
+        stem = Path(path_text).stem
+        if stem.startswith("roto"):
+            raise ValueError("PDF incompleto")
+        return iter([pdf_extractor.PageCodes(1, 1, [f"W{stem.upper()}01"])])
+
+    return iter_page_codes
+
+
+def _write(path, data, mtime_s):
+    path.write_bytes(data)
+    os.utime(path, ns=(mtime_s * 10**9, mtime_s * 10**9))
+
+
+def _watch_events(db):
+    conn = db.get_connection()
+    try:
+        rows = conn.execute(
+            "SELECT details FROM events WHERE event_type = 'watch_index' ORDER BY id"
+        ).fetchall()
+    finally:
+        conn.close()
+    return [json.loads(row[0]) for row in rows]
+
+
+def _codes(db):
+    conn = db.get_connection()
+    try:
+        return [row[0] for row in conn.execute("SELECT code FROM pages ORDER BY code")]
+    finally:
+        conn.close()
+
+
+def test_watcher_indexes_settled_pdfs_and_records_events(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    config, db, pdf_extractor, watcher = _reload_modules()
+    config.ensure_dirs()
+    db.init_db(reset=True)
+    monkeypatch.setattr(pdf_extractor, "_iter_page_codes", _fake_pages(pdf_extractor))
+
+    _write(config.PDF_DIR / "viejo.pdf", b"%PDF viejo", 1_000)
+    assert pdf_extractor.extract_pdf(config.PDF_DIR / "viejo.pdf")
+    reported = []
+    folder = watcher.FolderWatcher(
+        settle_seconds=2, on_result=lambda path, result, _msg: reported.append(result)
+    )
+
+    # Lo que ya estaba y sigue en cache no se reporta.
+    assert folder.scan(now=0) == []
+    assert [result for _path, result in folder.scan(now=3)] == ["cached"]
+    assert reported == []
+
+    # Un PDF copiandose: se indexa cuando deja de cambiar.
+    nuevo = config.PDF_DIR / "nuevo.pdf"
+    _write(nuevo, b"%PDF nu", 2_000)
+    assert folder.scan(now=10) == []
+    _write(nuevo, b"%PDF nuevo completo", 2_001)
+    assert folder.scan(now=11) == []
+    assert folder.scan(now=12.5) == []
+    assert folder.scan(now=13) == [(str(nuevo), "indexed")]
+    assert folder.scan(now=20) == []
+
+    _write(config.PDF_DIR / "roto.pdf", b"%PDF", 3_000)
+    folder.scan(now=30)
+    assert folder.scan(now=32) == [(str(config.PDF_DIR / "roto.pdf"), "error")]
+    # No se reintenta hasta que el archivo cambie.
+    assert folder.scan(now=40) == []
+
+    assert reported == ["indexed", "error"]
+    assert _codes(db) == ["WNUEVO01", "WVIEJO01"]
+    events = _watch_events(db)
+    assert [(event["pdf"], event["result"]) for event in events] == [
+        ("nuevo.pdf", "indexed"),
+        ("roto.pdf", "error"),
+    ]
+    assert events[1]["message"] == "ValueError: PDF incompleto"
+
+
+@pytest.mark.parametrize("use_inotify", [True, False])
+def test_watcher_thread_picks_up_new_pdfs(monkeypatch, tmp_path, use_inotify):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    config, db, pdf_extractor, watcher = _reload_modules()
+    config.ensure_dirs()
+    db.init_db(reset=True)
+    monkeypatch.setattr(pdf_extractor, "_iter_page_codes", _fake_pages(pdf_extractor))
+
+    folder = watcher.FolderWatcher(
+        settle_seconds=0.05, poll_interval=0.05, use_inotify=use_inotify
+    ).start()
+    try:
+        (config.PDF_DIR / "lote.pdf").write_bytes(b"%PDF lote")
+        deadline = time.monotonic() + 5
+        while not _codes(db) and time.monotonic() < deadline:
+            time.sleep(0.02)
+    finally:
+        started = time.monotonic()
+        folder.stop(timeout=5)
+        stop_seconds = time.monotonic() - started
+
+    assert _codes(db) == ["WLOTE01"]
+    assert stop_seconds < 1
+
+
+def test_watcher_stop_cancels_indexing_between_pages(monkeypatch, tmp_path):
+    monkeypatch.setenv("CONTROL_DATA_DIR", str(tmp_path))
+    config, db, pdf_extractor, watcher = _reload_modules()
+    config.ensure_dirs()
+    db.init_db(reset=True)
+    monkeypatch.setattr(watcher, "PUBLISH_SECONDS", 0)
+    published = threading.Event()
+
+    def slow_pages(path_text, **_kwargs):
+        for page_index in range(1, 1001):
+            if page_index == 3:
+                published.set()
+            time.sleep(0.01)
+            yield pdf_extractor.PageCodes(page_index, 1000, [f"WLENTO{page_index:04d}"])
+
+    monkeypatch.setattr(pdf_extractor, "_iter_page_codes", slow_pages)
+
+    folder = watcher.FolderWatcher(settle_seconds=0, poll_interval=0.05, use_inotify=False)
+    (config.PDF_DIR / "lento.pdf").write_bytes(b"%PDF lento")
+    folder.start()
+    assert not folder._thread.daemon
+    assert published.wait(5)
+    started = time.monotonic()
+    folder.stop()
+
+    assert time.monotonic() - started < 1
+    assert not folder._thread.is_alive()
+    # Lo ya publicado se descarta: nada queda como "indexandose".
+    assert _codes(db) == []
+    conn = db.get_connection()
+    try:
+        assert conn.execute("SELECT COUNT(*) FROM pdf_files").fetchone()[0] == 0
+    finally:
+        conn.close()
+    assert _watch_events(db) == []